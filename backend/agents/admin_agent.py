@@ -0,0 +1,182 @@
+# backend/agents/admin_agent.py
+
+import os
+import hmac
+from functools import wraps
+from flask import Blueprint, Response, request, jsonify
+from .orion_scheduler import get_orion_scheduler
+from .vero_agent import get_prompt_stats, get_resource_cache_stats
+from . import elara_agent
+from .circuit_breaker import watsonx_breaker
+from . import tracing
+from . import profiler
+from . import events
+from .crisis_escalation import get_escalation_stats
+from .metrics_accumulator import get_accumulator_stats
+
+admin_bp = Blueprint('admin_agent', __name__)
+
+
+def _is_admin_request() -> bool:
+    """Admin endpoints require the X-Admin-Token header to match ADMIN_TOKEN."""
+    expected = os.getenv("ADMIN_TOKEN")
+    if not expected:
+        return False
+    provided = request.headers.get('X-Admin-Token', '')
+    return hmac.compare_digest(provided, expected)
+
+
+def admin_required(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not _is_admin_request():
+            return jsonify({"error": "Admin token required"}), 403
+        return view(*args, **kwargs)
+    return wrapper
+
+
+@admin_bp.route('/admin/orion/status', methods=['GET'])
+@admin_required
+def orion_status():
+    """Report Orion scheduler leadership and run history."""
+    scheduler = get_orion_scheduler()
+    if scheduler is None:
+        return jsonify({"running": False, "message": "Orion scheduler is not started on this node"})
+    return jsonify(scheduler.status())
+
+
+@admin_bp.route('/admin/vero/stats', methods=['GET'])
+@admin_required
+def vero_stats():
+    """Vero prompt sizes (retrieval vs full knowledge base) and cache effectiveness."""
+    return jsonify({
+        "prompt": get_prompt_stats(),
+        "resource_cache": get_resource_cache_stats(),
+    })
+
+
+@admin_bp.route('/admin/elara/stats', methods=['GET'])
+@admin_required
+def elara_stats():
+    """Elara prompt build time and size per chat turn, and greeting reuse."""
+    return jsonify({
+        "prompt": elara_agent.get_prompt_stats(),
+        "greeting": elara_agent.get_greeting_stats(),
+        "response_cache": elara_agent.get_response_cache_stats(),
+        "llm_batching": elara_agent.get_dispatcher_stats(),
+        "metrics_accumulator": get_accumulator_stats(),
+    })
+
+
+@admin_bp.route('/admin/watsonx/breaker', methods=['GET'])
+@admin_required
+def watsonx_breaker_status():
+    """Circuit breaker state for Watsonx model calls."""
+    return jsonify(watsonx_breaker.status())
+
+
+@admin_bp.route('/admin/events', methods=['GET'])
+@admin_required
+def recent_events():
+    """Event bus counters plus logged events since ?since= (epoch seconds), newest last; ?type= filters."""
+    since = request.args.get('since', type=float)
+    limit = request.args.get('limit', 100, type=int)
+    types = request.args.getlist('type') or None
+    found = [e.to_dict() for e in events.read_events(since, types)]
+    return jsonify({"stats": events.get_event_stats(), "events": found[-limit:] if limit > 0 else []})
+
+
+@admin_bp.route('/admin/crisis/escalations', methods=['GET'])
+@admin_required
+def crisis_escalations():
+    """Escalation outcomes and the most recent crisis events handled by this process."""
+    return jsonify(get_escalation_stats())
+
+
+@admin_bp.route('/admin/traces', methods=['GET'])
+@admin_required
+def recent_traces():
+    """Recent exported traces with their top-level stage timings; ?min_ms= keeps only slow ones."""
+    min_ms = request.args.get('min_ms', 0, type=float)
+    limit = request.args.get('limit', 20, type=int)
+    return jsonify({"stats": tracing.get_trace_stats(), "traces": tracing.recent_traces(min_ms, limit)})
+
+
+@admin_bp.route('/admin/traces/<trace_id>', methods=['GET'])
+@admin_required
+def trace_detail(trace_id):
+    """Every span of one recent trace."""
+    spans = tracing.get_trace(trace_id)
+    if spans is None:
+        return jsonify({"error": "Trace not found"}), 404
+    return jsonify({"trace_id": trace_id, "spans": spans})
+
+
+@admin_bp.route('/admin/profile', methods=['GET'])
+@admin_required
+def sample_profile():
+    """
+    Sample every thread (Orion and background workers included) for ?seconds=
+    and return collapsed stacks; ?format=json adds per-thread and per-function
+    summaries, ?thread= keeps threads whose name contains the given text.
+    """
+    seconds = request.args.get('seconds', 5, type=float)
+    interval_ms = request.args.get('interval_ms', profiler.PROFILE_INTERVAL_MS, type=float)
+    try:
+        profile = profiler.profile_for(seconds, max(interval_ms, 1) / 1000, request.args.get('thread'))
+    except profiler.ProfilerBusy:
+        return jsonify({"error": "A profile is already running"}), 409
+    if request.args.get('format') == 'json':
+        return jsonify(profile.to_dict())
+    return Response(profile.collapsed(), mimetype='text/plain')
+
+
+@admin_bp.route('/admin/profile/requests', methods=['GET'])
+@admin_required
+def request_profiles():
+    """Requests recently profiled with the X-Profile-Request header."""
+    return jsonify({"profiles": profiler.recent_request_profiles()})
+
+
+@admin_bp.route('/admin/profile/requests/<profile_id>', methods=['GET'])
+@admin_required
+def request_profile(profile_id):
+    found = profiler.get_request_profile(profile_id)
+    if found is None:
+        return jsonify({"error": "Profile not found"}), 404
+    label, profile = found
+    if request.args.get('format') == 'json':
+        return jsonify({"request": label, **profile.to_dict()})
+    return Response(profile.collapsed(), mimetype='text/plain')
+
+
+# Any request sent with X-Profile-Request: 1 and a valid X-Admin-Token is
+# sampled on its own thread; the response carries X-Profile-Id for the
+# endpoints above.
+
+@admin_bp.before_app_request
+def _start_request_profile():
+    if request.headers.get('X-Profile-Request') != '1' or not _is_admin_request():
+        return
+    sampler = profiler.start_request_profile()
+    if sampler is not None:
+        request.environ['profiler.sampler'] = sampler
+
+
+@admin_bp.after_app_request
+def _finish_request_profile(response):
+    sampler = request.environ.pop('profiler.sampler', None)
+    if sampler is not None:
+        profile_id = tracing.current_trace_id() or os.urandom(8).hex()
+        profiler.finish_request_profile(sampler, profile_id, f"{request.method} {request.path}")
+        response.headers['X-Profile-Id'] = profile_id
+    return response
+
+
+@admin_bp.teardown_app_request
+def _abandon_request_profile(error=None):
+    # after_request is skipped when the view raises; still stop the sampler and keep its profile
+    sampler = request.environ.pop('profiler.sampler', None)
+    if sampler is not None:
+        profiler.finish_request_profile(sampler, tracing.current_trace_id() or os.urandom(8).hex(),
+                                        f"{request.method} {request.path}")
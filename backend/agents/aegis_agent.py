@@ -1,8 +1,10 @@
 # backend/agents/aegis_agent.py
 
 from flask import Blueprint, request, jsonify
-from firebase_admin import firestore
 from .agent_data import AEGIS_TRIGGERS, MENTAL_HEALTH_HELPLINES
+from . import metrics
+from . import events
+from . import crisis_escalation  # escalates the CrisisDetected events published here and by Elara
 
 aegis_bp = Blueprint('aegis_agent', __name__)
 
@@ -80,9 +82,13 @@ def detect_crisis():
     user_region = data.get('region', 'GLOBAL').upper()
     
     # Check for crisis triggers
-    crisis_detected = any(trigger in user_message for trigger in AEGIS_TRIGGERS)
+    trigger = next((t for t in AEGIS_TRIGGERS if t in user_message), None)
+    crisis_detected = trigger is not None
     
     if crisis_detected:
+        metrics.aegis_trigger_hits.inc("crisis_detection")
+        events.publish(events.CRISIS_DETECTED, user_id=data.get('userId'), source="aegis",
+                       trigger=trigger, region=user_region)
         helplines = get_helpline_info(user_region)
         crisis_response = format_crisis_response(helplines, is_crisis=True)
         
@@ -1,10 +1,13 @@
 # backend/agents/auth_agent.py
 
 from flask import Blueprint, request, jsonify
-from passlib.hash import pbkdf2_sha256
-from firebase_admin import firestore
+from .clients import firestore, get_db
+from . import metrics_history
+from .metrics_accumulator import get_accumulator
+from . import session_index
 from datetime import datetime, timedelta, timezone
 import uuid
+import logging
 
 # In-memory fallbacks when Firebase is unavailable
 _MEM_USERS_BY_ID = {}
@@ -13,16 +16,20 @@ _MEM_USER_STATES = {}
 
 
 def _get_db_or_none():
-    try:
-        return firestore.client()
-    except Exception:
-        return None
+    return get_db()
+
+
+def _pbkdf2():
+    # passlib is imported on first signup/login rather than at app import
+    from passlib.hash import pbkdf2_sha256
+    return pbkdf2_sha256
 
 
 def _generate_id() -> str:
     return uuid.uuid4().hex
 
 auth_bp = Blueprint('auth_agent', __name__)
+log = logging.getLogger(__name__)
 
 # Default metrics for new users
 DEFAULT_METRICS = {"anxiety": 0, "depression": 0, "stress": 0}
@@ -42,8 +49,8 @@ def signup():
     age = data.get('age')
     region = (data.get('region') or 'GLOBAL').strip().upper()
     
-    print(f"🔍 Signup attempt for email: {email}")
-    print(f"🔍 Using {'Firebase' if db else 'in-memory'} storage")
+    log.debug("Signup attempt for email: %s", email)
+    log.debug("Using %s storage", 'Firebase' if db else 'in-memory')
 
     # Validation
     try:
@@ -73,7 +80,7 @@ def signup():
             return jsonify({"error": "User with this email already exists"}), 409
 
     # Hash password
-    hashed_password = pbkdf2_sha256.hash(password)
+    hashed_password = _pbkdf2().hash(password)
 
     # Create user with a new document ID
     if db:
@@ -140,48 +147,48 @@ def login():
     if not email or not password:
         return jsonify({"error": "Email and password are required"}), 400
         
-    print(f"🔍 Login attempt for email: {raw_email} (normalized: {email})")
-    print(f"🔍 Using {'Firebase' if db else 'in-memory'} storage")
+    log.debug("Login attempt for email: %s (normalized: %s)", raw_email, email)
+    log.debug("Using %s storage", 'Firebase' if db else 'in-memory')
 
     # Fetch user (prefer email_lower, fallback to legacy 'email' field)
     user_data = None
     user_id = None
     if db:
         try:
-            print(f"🔍 Searching Firebase for user with email_lower: {email}")
+            log.debug("Searching Firebase for user with email_lower: %s", email)
             query_result = db.collection('registered_users').where('email_lower', '==', email).limit(1).get()
             if not query_result:
-                print(f"🔍 No user found with email_lower, trying legacy exact match: {raw_email}")
+                log.debug("No user found with email_lower, trying legacy exact match: %s", raw_email)
                 # Legacy fallback: try exact email match
                 legacy = db.collection('registered_users').where('email', '==', raw_email).limit(1).get()
                 if not legacy:
-                    print(f"❌ No user found with email: {raw_email}")
+                    log.info("No user found with email: %s", raw_email)
                     return jsonify({"error": "Invalid credentials"}), 401
                 user_doc = legacy[0]
-                print(f"✅ Found user via legacy lookup, backfilling email_lower")
+                log.debug("Found user via legacy lookup, backfilling email_lower")
                 # Backfill email_lower for future logins
                 try:
                     db.collection('registered_users').document(user_doc.id).update({"email_lower": email})
                 except Exception as e:
-                    print(f"⚠️  Failed to backfill email_lower: {e}")
+                    log.warning("Failed to backfill email_lower: %s", e)
             else:
                 user_doc = query_result[0]
-                print(f"✅ Found user via email_lower lookup")
+                log.debug("Found user via email_lower lookup")
             user_data = user_doc.to_dict()
             user_id = user_doc.id
         except Exception as e:
-            print(f"❌ Firebase lookup failed: {e}")
+            log.error("Firebase lookup failed: %s", e)
             user_data = None
             user_id = None
     else:
-        print(f"🔍 Searching in-memory storage for user with email: {email}")
+        log.debug("Searching in-memory storage for user with email: %s", email)
         # In-memory lookup
         if email in _MEM_USERS_BY_EMAIL:
             user_id = _MEM_USERS_BY_EMAIL[email]
             user_data = _MEM_USERS_BY_ID.get(user_id)
-            print(f"✅ Found user in memory via email_lower")
+            log.debug("Found user in memory via email_lower")
         else:
-            print(f"🔍 No user found with email_lower, trying legacy exact match")
+            log.debug("No user found with email_lower, trying legacy exact match")
             # Legacy exact email match
             for uid, doc in _MEM_USERS_BY_ID.items():
                 if doc.get('email') == raw_email:
@@ -189,18 +196,18 @@ def login():
                     user_data = doc
                     # Backfill email_lower
                     _MEM_USERS_BY_EMAIL[email] = uid
-                    print(f"✅ Found user via legacy lookup, backfilled email_lower")
+                    log.debug("Found user via legacy lookup, backfilled email_lower")
                     break
             if not user_data:
-                print(f"❌ No user found with email: {raw_email}")
+                log.info("No user found with email: %s", raw_email)
                 return jsonify({"error": "Invalid credentials"}), 401
 
     # Verify password
-    print(f"🔍 Verifying password for user: {user_id}")
-    if not pbkdf2_sha256.verify(password, user_data.get('password_hash')):
-        print(f"❌ Password verification failed for user: {user_id}")
+    log.debug("Verifying password for user: %s", user_id)
+    if not _pbkdf2().verify(password, user_data.get('password_hash')):
+        log.info("Password verification failed for user: %s", user_id)
         return jsonify({"error": "Invalid credentials"}), 401
-    print(f"✅ Password verified successfully for user: {user_id}")
+    log.debug("Password verified successfully for user: %s", user_id)
 
     # Load metrics
     has_recent_screening = False
@@ -213,7 +220,7 @@ def login():
 
             if user_state_doc.exists:
                 user_state_data = user_state_doc.to_dict()
-                user_metrics = user_state_data.get('metrics', DEFAULT_METRICS)
+                user_metrics = get_accumulator().projected(user_id, user_state_data.get('metrics', DEFAULT_METRICS))
 
                 last_screening_time = user_state_data.get('last_screening_timestamp')
                 if last_screening_time and isinstance(last_screening_time, datetime):
@@ -276,6 +283,7 @@ def cleanup_users_without_region():
                             except Exception:
                                 pass
                             db.collection('user_sessions').document(s.id).delete()
+                        session_index.invalidate(doc.id)
                     except Exception:
                         pass
                     # Delete user doc
@@ -293,7 +301,7 @@ def cleanup_users_without_region():
                     deleted_count += 1
         return jsonify({"deleted": deleted_count})
     except Exception as e:
-        print(f"Cleanup error: {e}")
+        log.error("Cleanup error: %s", e)
         return jsonify({"error": "Cleanup failed"}), 500
 
 
@@ -311,7 +319,8 @@ def get_metrics():
             user_state_doc = user_state_ref.get()
 
             if user_state_doc.exists:
-                metrics = user_state_doc.to_dict().get('metrics', DEFAULT_METRICS)
+                # Includes chat nudges not yet flushed by the accumulator
+                metrics = get_accumulator().projected(user_id, user_state_doc.to_dict().get('metrics', DEFAULT_METRICS))
             else:
                 metrics = DEFAULT_METRICS
         else:
@@ -321,5 +330,47 @@ def get_metrics():
         return jsonify({"metrics": metrics})
 
     except Exception as e:
-        print(f"Error getting metrics for user {user_id}: {e}")
+        log.error("Error getting metrics for user %s: %s", user_id, e)
         return jsonify({"error": "Failed to get metrics"}), 500
+
+
+def _parse_time(value, default: float) -> float:
+    """Epoch seconds, or an ISO date/datetime (UTC when no offset is given)."""
+    if not value:
+        return default
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+@auth_bp.route('/auth/getMetricsHistory', methods=['GET'])
+def get_metrics_history():
+    """Metric history for a time range: ?start=&end= (ISO or epoch seconds), ?resolution=raw|hour|day."""
+    db = _get_db_or_none()
+    user_id = request.args.get('userId') or request.headers.get('X-User-ID')
+
+    if not user_id:
+        return jsonify({"error": "User ID is required"}), 400
+
+    now = datetime.now(timezone.utc).timestamp()
+    try:
+        end = _parse_time(request.args.get('end'), now)
+        start = _parse_time(request.args.get('start'), end - 30 * 86400)
+    except ValueError:
+        return jsonify({"error": "start and end must be ISO dates or epoch seconds"}), 400
+    resolution = request.args.get('resolution', 'day')
+
+    try:
+        points = metrics_history.query_history(db, user_id, start, end, resolution)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        log.error("Error getting metrics history for user %s: %s", user_id, e)
+        return jsonify({"error": "Failed to get metrics history"}), 500
+
+    return jsonify({"resolution": resolution, "points": points})
@@ -0,0 +1,206 @@
+# backend/agents/cache.py
+
+import os
+import json
+import time
+import atexit
+import logging
+import threading
+from collections import OrderedDict
+
+log = logging.getLogger(__name__)
+
+# Configuration
+# How often a persisted cache with changes is written back to disk
+CACHE_PERSIST_SECONDS = float(os.getenv("CACHE_PERSIST_SECONDS", "10"))
+
+FRESH = 'fresh'
+STALE = 'stale'
+MISS = 'miss'
+
+
+class TTLCache:
+    """
+    Thread-safe LRU cache with per-entry TTL. Entries past their TTL but
+    within `stale_seconds` are still returned by lookup() flagged as stale so
+    callers can serve them while refreshing (stale-while-revalidate).
+    With `persist_path` set, entries are loaded on first use; changes mark
+    the cache dirty and a background thread writes it back atomically every
+    `persist_seconds` and at exit. Keys and values must be JSON-serializable.
+    """
+
+    def __init__(self, max_size: int = 256, ttl_seconds: float = 3600, stale_seconds: float = 0,
+                 persist_path: str = None, persist_seconds: float = CACHE_PERSIST_SECONDS):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.stale_seconds = stale_seconds
+        self.persist_path = persist_path
+        self.persist_seconds = persist_seconds
+        self._data = OrderedDict()  # key -> (value, expires_at)
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._loaded = persist_path is None
+        self._dirty = False
+        self._saver = None
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _load_locked(self):
+        self._loaded = True
+        try:
+            with open(self.persist_path, 'r') as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            return
+        now = time.time()
+        for key, value, expires_at in entries:
+            if expires_at + self.stale_seconds > now:
+                self._data[key] = (value, expires_at)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    def _changed_locked(self):
+        if not self.persist_path:
+            return
+        self._dirty = True
+        if self._saver is None:
+            self._saver = threading.Thread(target=self._save_loop, name="cache-persist", daemon=True)
+            self._saver.start()
+            atexit.register(self.save)
+
+    def _save_loop(self):
+        while True:
+            time.sleep(self.persist_seconds)
+            self.save()
+
+    def save(self):
+        """Write the entries to persist_path if anything changed since the last write."""
+        # Serialized and written outside the cache lock so lookups and sets are not held up
+        with self._save_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                self._dirty = False
+                entries = [[k, v, exp] for k, (v, exp) in self._data.items()]
+            try:
+                os.makedirs(os.path.dirname(self.persist_path) or '.', exist_ok=True)
+                tmp_path = f"{self.persist_path}.{os.getpid()}.tmp"
+                with open(tmp_path, 'w') as f:
+                    json.dump(entries, f)
+                os.replace(tmp_path, self.persist_path)
+            except (OSError, TypeError) as e:
+                log.warning("Could not persist cache to %s: %s", self.persist_path, e)
+
+    def lookup(self, key):
+        """Return (value, state) where state is FRESH, STALE or MISS."""
+        now = time.time()
+        with self._lock:
+            if not self._loaded:
+                self._load_locked()
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return None, MISS
+            value, expires_at = entry
+            if now < expires_at:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return value, FRESH
+            if now < expires_at + self.stale_seconds:
+                self._data.move_to_end(key)
+                self.stale_hits += 1
+                return value, STALE
+            del self._data[key]
+            self.misses += 1
+            return None, MISS
+
+    def get(self, key, default=None):
+        """Fresh value only."""
+        value, state = self.lookup(key)
+        return value if state == FRESH else default
+
+    def set(self, key, value, ttl_seconds: float = None):
+        expires_at = time.time() + (self.ttl_seconds if ttl_seconds is None else ttl_seconds)
+        with self._lock:
+            if not self._loaded:
+                self._load_locked()
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+            self._changed_locked()
+
+    def invalidate(self, key):
+        with self._lock:
+            if self._data.pop(key, None) is not None:
+                self._changed_locked()
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._changed_locked()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            "size": len(self._data),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_ratio": round((self.hits + self.stale_hits) / lookups, 4) if lookups else 0.0,
+        }
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key: the first caller runs fn,
+    the others block until it finishes and get the same result (or exception).
+    Nothing is remembered once the call completes; pair with a TTLCache for that.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.coalesced = 0
+
+    def do(self, key, fn):
+        """Return (result, shared) where shared is True for callers that joined an in-flight call."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
@@ -0,0 +1,180 @@
+# backend/agents/circuit_breaker.py
+
+# Circuit breaker for model calls. While Watsonx is failing or slow, calls
+# fail immediately with CircuitOpenError (callers already fall back to mock
+# replies on any exception) instead of each waiting out the SDK timeout.
+
+import os
+import time
+import threading
+from collections import deque
+from . import metrics
+
+# Configuration
+BREAKER_WINDOW_SECONDS = float(os.getenv("MODEL_BREAKER_WINDOW_SECONDS", "60"))
+BREAKER_MIN_CALLS = int(os.getenv("MODEL_BREAKER_MIN_CALLS", "5"))
+BREAKER_FAILURE_RATE = float(os.getenv("MODEL_BREAKER_FAILURE_RATE", "0.5"))
+# Successful calls slower than this count towards the slow-call rate
+BREAKER_SLOW_CALL_SECONDS = float(os.getenv("MODEL_BREAKER_SLOW_CALL_SECONDS", "10"))
+BREAKER_SLOW_CALL_RATE = float(os.getenv("MODEL_BREAKER_SLOW_CALL_RATE", "0.8"))
+BREAKER_OPEN_SECONDS = float(os.getenv("MODEL_BREAKER_OPEN_SECONDS", "30"))
+BREAKER_HALF_OPEN_PROBES = 1
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class CircuitBreaker:
+    """
+    Trips OPEN when, over the last `window_seconds` and at least `min_calls`
+    calls, the failure rate or the slow-call rate reaches its threshold.
+    After `open_seconds` it lets `half_open_probes` calls through; a fast
+    success closes it again, anything else re-opens it.
+    """
+
+    def __init__(self, name: str, window_seconds: float = BREAKER_WINDOW_SECONDS,
+                 min_calls: int = BREAKER_MIN_CALLS, failure_rate: float = BREAKER_FAILURE_RATE,
+                 slow_call_seconds: float = BREAKER_SLOW_CALL_SECONDS, slow_call_rate: float = BREAKER_SLOW_CALL_RATE,
+                 open_seconds: float = BREAKER_OPEN_SECONDS, half_open_probes: int = BREAKER_HALF_OPEN_PROBES):
+        self.name = name
+        self.window_seconds = window_seconds
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate = slow_call_rate
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+        self._lock = threading.Lock()
+        self._calls = deque()  # (finished_at, failed, slow)
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probes = 0
+        self.trips = 0
+        self.rejected = 0
+
+    def _trim_locked(self, now: float):
+        while self._calls and now - self._calls[0][0] > self.window_seconds:
+            self._calls.popleft()
+
+    def _open_locked(self, now: float):
+        self._state = OPEN
+        self._opened_at = now
+        self._probes = 0
+        self.trips += 1
+
+    def allow(self) -> bool:
+        """Whether a call may go ahead now; every allowed call must be followed by record()."""
+        now = time.monotonic()
+        with self._lock:
+            if self._state == OPEN and now - self._opened_at >= self.open_seconds:
+                self._state = HALF_OPEN
+                self._probes = 0
+            if self._state == CLOSED:
+                return True
+            if self._state == HALF_OPEN and self._probes < self.half_open_probes:
+                self._probes += 1
+                return True
+            self.rejected += 1
+            return False
+
+    def record(self, failed: bool, elapsed: float):
+        now = time.monotonic()
+        slow = not failed and elapsed >= self.slow_call_seconds
+        with self._lock:
+            if self._state == HALF_OPEN:
+                if failed or slow:
+                    self._open_locked(now)
+                else:
+                    self._state = CLOSED
+                    self._calls.clear()
+                return
+            if self._state == OPEN:
+                # A call admitted before the breaker tripped
+                return
+
+            self._calls.append((now, failed, slow))
+            self._trim_locked(now)
+            total = len(self._calls)
+            if total < self.min_calls:
+                return
+            failures = sum(1 for _, f, _ in self._calls if f)
+            slow_calls = sum(1 for _, _, s in self._calls if s)
+            if failures / total >= self.failure_rate or slow_calls / total >= self.slow_call_rate:
+                self._open_locked(now)
+
+    def call(self, fn, *args, **kwargs):
+        """Run fn through the breaker; raises CircuitOpenError without calling it while open."""
+        if not self.allow():
+            raise CircuitOpenError(f"{self.name} circuit is open")
+        started = time.monotonic()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception:
+            self.record(True, time.monotonic() - started)
+            raise
+        self.record(False, time.monotonic() - started)
+        return result
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+                return HALF_OPEN
+            return self._state
+
+    def status(self) -> dict:
+        now = time.monotonic()
+        state = self.state
+        with self._lock:
+            self._trim_locked(now)
+            total = len(self._calls)
+            failures = sum(1 for _, f, _ in self._calls if f)
+            slow_calls = sum(1 for _, _, s in self._calls if s)
+            return {
+                "name": self.name,
+                "state": state,
+                "window_calls": total,
+                "window_failure_rate": round(failures / total, 4) if total else 0.0,
+                "window_slow_rate": round(slow_calls / total, 4) if total else 0.0,
+                "open_for_seconds": round(max(0.0, self.open_seconds - (now - self._opened_at)), 1)
+                if state == OPEN else 0,
+                "trips": self.trips,
+                "rejected": self.rejected,
+            }
+
+
+class GuardedModel:
+    """Model proxy whose generate() goes through a circuit breaker; everything else passes through."""
+
+    def __init__(self, model, breaker: CircuitBreaker):
+        self._model = model
+        self.breaker = breaker
+
+    def generate(self, *args, **kwargs):
+        return self.breaker.call(self._model.generate, *args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._model, name)
+
+
+watsonx_breaker = CircuitBreaker("watsonx")
+
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+def _collect_breaker_metrics():
+    labels = {"breaker": watsonx_breaker.name}
+    status = watsonx_breaker.status()
+    return [
+        ("circuit_breaker_state", "gauge", "0 closed, 1 half-open, 2 open", [(labels, _STATE_VALUES[status["state"]])]),
+        ("circuit_breaker_trips_total", "counter", "Times the breaker opened", [(labels, status["trips"])]),
+        ("circuit_breaker_rejected_total", "counter", "Calls failed fast while open", [(labels, status["rejected"])]),
+    ]
+
+
+metrics.register_collector(_collect_breaker_metrics)
@@ -0,0 +1,144 @@
+# backend/agents/clients.py
+
+# Shared external clients (Firebase, Watsonx.ai), constructed on first use so
+# that importing the app stays cheap and worker boot does no network setup.
+
+import os
+import logging
+import importlib
+import threading
+from .metrics import instrument_firestore, instrument_model
+
+log = logging.getLogger(__name__)
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+WATSONX_MODEL_ID = "ibm/granite-3-8b-instruct"
+
+
+class Lazy:
+    """Thread-safe once-only construction of a value from a factory."""
+
+    _UNSET = object()
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._value = self._UNSET
+        self._lock = threading.Lock()
+
+    def get(self):
+        value = self._value
+        if value is self._UNSET:
+            with self._lock:
+                value = self._value
+                if value is self._UNSET:
+                    value = self._factory()
+                    self._value = value
+        return value
+
+    @property
+    def initialized(self) -> bool:
+        return self._value is not self._UNSET
+
+    def reset(self):
+        with self._lock:
+            self._value = self._UNSET
+
+
+class LazyModule:
+    """Module proxy that defers the import until an attribute is first used."""
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module = Lazy(lambda: importlib.import_module(name))
+
+    def __getattr__(self, attr):
+        return getattr(self._module.get(), attr)
+
+    def __repr__(self):
+        return f"<lazy module {self._name!r}>"
+
+
+# `firestore.SERVER_TIMESTAMP`, `firestore.Query` etc. resolve on first access
+firestore = LazyModule('firebase_admin.firestore')
+
+
+def _initialize_firebase() -> bool:
+    """Initialize the default Firebase app from backend/serviceAccountKey.json."""
+    try:
+        service_account_path = os.path.join(BACKEND_DIR, "serviceAccountKey.json")
+
+        if not os.path.exists(service_account_path):
+            log.warning("Firebase service account key not found at %s; using in-memory storage "
+                        "(data will not persist between restarts). To enable Firebase, save the key "
+                        "from the Firebase Console as 'serviceAccountKey.json' in the backend directory "
+                        "and restart.", service_account_path)
+            return False
+
+        import firebase_admin
+        from firebase_admin import credentials
+        if not firebase_admin._apps:
+            firebase_admin.initialize_app(credentials.Certificate(service_account_path))
+        log.info("Firebase initialized successfully")
+        return True
+    except Exception as e:
+        log.error("Firebase initialization failed, falling back to in-memory storage: %s", e)
+        return False
+
+
+_firebase = Lazy(_initialize_firebase)
+
+
+def firebase_available() -> bool:
+    return _firebase.get()
+
+
+def get_db():
+    """Firestore client, or None when Firebase is not configured."""
+    if not firebase_available():
+        return None
+    try:
+        return instrument_firestore(firestore.client())
+    except Exception:
+        return None
+
+
+def _build_watsonx_model():
+    api_key = os.getenv("WATSONX_API_KEY")
+    project_id = os.getenv("WATSONX_PROJECT_ID")
+    if not api_key or not project_id:
+        return None
+    try:
+        from ibm_watsonx_ai.foundation_models import ModelInference
+        from ibm_watsonx_ai.metanames import GenTextParamsMetaNames as GenParams
+        from ibm_watsonx_ai.credentials import Credentials
+    except ImportError:
+        return None
+    try:
+        creds = Credentials(api_key=api_key, url=os.getenv("WATSONX_URL"))
+        generate_params = {
+            GenParams.DECODING_METHOD: "greedy",
+            GenParams.MAX_NEW_TOKENS: 200,
+            GenParams.MIN_NEW_TOKENS: 1,
+            GenParams.TEMPERATURE: 0.7,
+            GenParams.STOP_SEQUENCES: ["\n\n", "User:", "Elara:"]
+        }
+        model = ModelInference(
+            model_id=WATSONX_MODEL_ID,
+            credentials=creds,
+            project_id=project_id,
+            params=generate_params
+        )
+    except Exception as e:
+        log.error("Watsonx.ai initialization failed: %s", e)
+        return None
+    from .circuit_breaker import GuardedModel, watsonx_breaker
+    return GuardedModel(instrument_model(model), watsonx_breaker)
+
+
+_watsonx_model = Lazy(_build_watsonx_model)
+
+
+def get_watsonx_model():
+    """Shared Watsonx ModelInference behind the watsonx circuit breaker, or None when unconfigured or unavailable."""
+    return _watsonx_model.get()
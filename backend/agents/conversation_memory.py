@@ -0,0 +1,209 @@
+# backend/agents/conversation_memory.py
+
+# Token-budgeted chat memory for Elara. The most recent turns are kept
+# verbatim up to a token budget; older turns are folded into a rolling
+# summary stored on the session document (`summary`, `summarizedThrough`,
+# `summarizedTurns`), refreshed in the background once every few turns.
+# Turns that have dropped out of the budget stay in the prompt verbatim (up
+# to SUMMARY_EVERY_TURNS of them) until they are folded, so the turns waiting
+# for the next fold are not missing from both.
+# A request reads at most HISTORY_FETCH_LIMIT turns; when more unsummarized
+# turns than that have built up (sessions from before summaries existed),
+# the background fold pages through them oldest first, so summarizedThrough
+# only ever moves past turns that were actually folded.
+
+import os
+import logging
+import threading
+from .clients import firestore
+from .prompt_utils import estimate_tokens
+
+# Configuration
+HISTORY_TOKEN_BUDGET = int(os.getenv("ELARA_HISTORY_TOKEN_BUDGET", "400"))
+# Upper bound on verbatim turns per request, whatever their size; a request
+# reads SUMMARY_EVERY_TURNS more so it can tell whether older ones are waiting
+HISTORY_FETCH_LIMIT = int(os.getenv("ELARA_HISTORY_FETCH_LIMIT", "20"))
+SUMMARY_EVERY_TURNS = int(os.getenv("ELARA_SUMMARY_EVERY_TURNS", "4"))
+SUMMARY_MAX_TOKENS = int(os.getenv("ELARA_SUMMARY_MAX_TOKENS", "150"))
+
+# 'User: ""\nElara: ""\n' around each turn
+_TURN_OVERHEAD_TOKENS = 10
+
+log = logging.getLogger(__name__)
+
+_summarizing = set()
+_summarizing_lock = threading.Lock()
+
+
+def turn_tokens(user_message, ai_response) -> int:
+    return estimate_tokens(user_message) + estimate_tokens(ai_response) + _TURN_OVERHEAD_TOKENS
+
+
+class ConversationMemory:
+    """What Elara sees of a session: rolling summary plus recent turns (oldest first)."""
+
+    def __init__(self, summary: str = "", turns=None, unsummarized=None, summarized_turns: int = 0,
+                 summarized_through=None, window_start=None, backlog: bool = False, session_turns: int = None):
+        self.summary = summary
+        self.turns = turns or []
+        # Older than the verbatim window and not yet in the summary, oldest first: [(u, a, timestamp)]
+        self.unsummarized = unsummarized or []
+        self.summarized_turns = summarized_turns
+        self.summarized_through = summarized_through
+        # Timestamp of the oldest verbatim turn
+        self.window_start = window_start
+        # True when unsummarized turns older than the ones read may exist
+        self.backlog = backlog
+        # The session's stored user-turn count (session_index), if it has one
+        self.session_turns = session_turns
+
+    @property
+    def num_user_messages(self) -> int:
+        """User messages in the whole session, summarized ones included."""
+        if self.backlog and self.session_turns is not None:
+            # Turns beyond the ones read were not counted
+            return self.session_turns
+        recent = sum(1 for u, _ in self.turns if u is not None)
+        pending = sum(1 for u, _, _ in self.unsummarized if u is not None)
+        return self.summarized_turns + pending + recent
+
+    @property
+    def prompt_turns(self) -> list:
+        """Turns shown verbatim, oldest first: the budgeted window plus the newest turns not yet folded."""
+        held = [(u, a) for u, a, _ in self.unsummarized[-SUMMARY_EVERY_TURNS:]]
+        return held + self.turns
+
+    @property
+    def needs_summary(self) -> bool:
+        return self.backlog or len(self.unsummarized) >= SUMMARY_EVERY_TURNS
+
+
+def split_by_budget(rows, budget: int = HISTORY_TOKEN_BUDGET):
+    """
+    Split (user_message, ai_response, timestamp) rows, newest first, into the
+    verbatim turns that fit the budget and the older remainder. The newest
+    turn is always kept. Both lists are returned oldest first.
+    """
+    used = 0
+    cut = len(rows)
+    for i, (u, a, _) in enumerate(rows):
+        used += turn_tokens(u, a)
+        if used > budget and i > 0:
+            cut = i
+            break
+    recent = [(u, a) for u, a, _ in reversed(rows[:cut])]
+    older = list(reversed(rows[cut:]))
+    return recent, older
+
+
+def load_memory(db, session_id: str) -> ConversationMemory:
+    """Read the session summary and its recent turns."""
+    session_ref = db.collection('user_sessions').document(session_id)
+    session_doc = session_ref.get()
+    session = session_doc.to_dict() if session_doc.exists else {}
+    summarized_through = session.get('summarizedThrough')
+
+    query = session_ref.collection('chatHistory').order_by('timestamp', direction=firestore.Query.DESCENDING)
+    if summarized_through is not None:
+        query = query.where('timestamp', '>', summarized_through)
+
+    fetch = HISTORY_FETCH_LIMIT + SUMMARY_EVERY_TURNS
+    rows = []
+    read = 0
+    for doc in query.limit(fetch).stream():
+        read += 1
+        d = doc.to_dict()
+        if d.get('ai_response') is None:
+            continue
+        rows.append((d.get('user_message'), d['ai_response'], d.get('timestamp')))
+
+    recent, older = split_by_budget(rows[:HISTORY_FETCH_LIMIT])
+    older = list(reversed(rows[HISTORY_FETCH_LIMIT:])) + older
+    return ConversationMemory(
+        summary=session.get('summary', ''),
+        turns=recent,
+        unsummarized=older,
+        summarized_turns=session.get('summarizedTurns', 0),
+        summarized_through=summarized_through,
+        window_start=rows[len(recent) - 1][2] if rows else None,
+        backlog=read >= fetch,
+        session_turns=session.get('turn_count'),
+    )
+
+
+def extractive_summary(previous: str, turns) -> str:
+    """Summary without a model: what the user said, most recent kept when over SUMMARY_MAX_TOKENS."""
+    said = [f'User said: "{u}".' for u, _ in turns if u]
+    words = " ".join([previous] + said if previous else said).split()
+    # estimate_tokens counts punctuation too, so trim words until the estimate fits
+    while words and estimate_tokens(" ".join(words)) > SUMMARY_MAX_TOKENS:
+        words = words[max(1, len(words) // 10):]
+    return " ".join(words)
+
+
+def _unsummarized_pages(db, session_id: str, memory: ConversationMemory):
+    """Turns older than the verbatim window and newer than summarizedThrough, oldest first, in pages."""
+    history = db.collection('user_sessions').document(session_id).collection('chatHistory')
+    through = memory.summarized_through
+    while True:
+        query = history.order_by('timestamp')
+        if through is not None:
+            query = query.where('timestamp', '>', through)
+        if memory.window_start is not None:
+            query = query.where('timestamp', '<', memory.window_start)
+        docs = [doc.to_dict() for doc in query.limit(HISTORY_FETCH_LIMIT).stream()]
+        if not docs:
+            return
+        through = docs[-1].get('timestamp')
+        yield [(d.get('user_message'), d['ai_response'], d.get('timestamp'))
+               for d in docs if d.get('ai_response') is not None], through
+        if len(docs) < HISTORY_FETCH_LIMIT:
+            return
+
+
+def _fold(db, session_id: str, memory: ConversationMemory, summarize):
+    try:
+        if memory.backlog:
+            pages = _unsummarized_pages(db, session_id, memory)
+        else:
+            pages = [(memory.unsummarized, memory.unsummarized[-1][2])]
+        summary, summarized_turns = memory.summary, memory.summarized_turns
+        for rows, through in pages:
+            turns = [(u, a) for u, a, _ in rows]
+            if turns:
+                try:
+                    folded = summarize(summary, turns)
+                except Exception as e:
+                    log.warning("Error summarizing session %s, using extractive summary: %s", session_id, e)
+                    folded = None
+                summary = folded or extractive_summary(summary, turns)
+                summarized_turns += sum(1 for u, _ in turns if u is not None)
+
+            # Written per page, so summarizedThrough never passes an unfolded turn
+            db.collection('user_sessions').document(session_id).update({
+                'summary': summary,
+                'summarizedThrough': through,
+                'summarizedTurns': summarized_turns,
+            })
+    except Exception as e:
+        log.error("Error updating summary for session %s: %s", session_id, e)
+    finally:
+        with _summarizing_lock:
+            _summarizing.discard(session_id)
+
+
+def schedule_summary(db, session_id: str, memory: ConversationMemory, summarize) -> bool:
+    """
+    Fold memory.unsummarized into the session summary in the background once
+    SUMMARY_EVERY_TURNS have built up. summarize(previous_summary, turns)
+    returns the new summary text; a falsy result or error falls back to
+    extractive_summary.
+    """
+    if not memory.needs_summary:
+        return False
+    with _summarizing_lock:
+        if session_id in _summarizing:
+            return False
+        _summarizing.add(session_id)
+    threading.Thread(target=_fold, args=(db, session_id, memory, summarize), daemon=True).start()
+    return True
@@ -0,0 +1,134 @@
+# backend/agents/crisis_escalation.py
+
+# Crisis escalation. Elara's Aegis check and /aegis/crisis-detection publish
+# CrisisDetected; the event bus dispatches it ahead of any backlog and this
+# module's worker marks the user's risk state critical within seconds, rather
+# than leaving it to whenever Orion's scan next notices. Each event is also
+# written to user_states/{id}/crisis_events/{event id} for audit, in the same
+# batch as the risk update; the event id as document id keeps retries from
+# duplicating it. The request itself only pays for publishing the event.
+#
+# Firestore: user_states/{userId}
+#   orion_risk_level = 'critical', orion_insights += 'crisis_risk',
+#   crisis.{last_detected, last_source, count}
+
+import os
+import time
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone, timedelta
+from .clients import Lazy, firestore, get_db
+from . import events
+from . import metrics
+from . import tracing
+
+log = logging.getLogger(__name__)
+
+# Configuration
+CRISIS_RETRY_ATTEMPTS = int(os.getenv("CRISIS_RETRY_ATTEMPTS", "4"))
+CRISIS_RETRY_DELAY = 0.5
+# How long after a detection Orion keeps the user at critical risk
+CRISIS_RISK_HOLD_HOURS = float(os.getenv("CRISIS_RISK_HOLD_HOURS", "72"))
+CRISIS_RECENT = 100
+
+_worker = Lazy(lambda: ThreadPoolExecutor(max_workers=1, thread_name_prefix="crisis-escalation"))
+_recent = deque(maxlen=CRISIS_RECENT)
+_counts = {"escalated": 0, "failed": 0, "unrecorded": 0}
+_counts_lock = threading.Lock()
+
+
+def _count(outcome: str):
+    with _counts_lock:
+        _counts[outcome] += 1
+
+
+def escalate(db, event):
+    """Record the crisis event and raise the user's risk state in one batch."""
+    data = event.data
+    detected_at = datetime.fromtimestamp(event.ts, tz=timezone.utc)
+    user_ref = db.collection('user_states').document(data['user_id'])
+    batch = db.batch()
+    batch.set(user_ref.collection('crisis_events').document(event.id), {
+        "source": data.get('source'),
+        "trigger": data.get('trigger'),
+        "region": data.get('region'),
+        "detected_at": detected_at,
+        "escalated_at": firestore.SERVER_TIMESTAMP,
+    })
+    batch.set(user_ref, {
+        "orion_risk_level": 'critical',
+        "orion_insights": firestore.ArrayUnion(['crisis_risk']),
+        "crisis": {
+            "last_detected": detected_at,
+            "last_source": data.get('source'),
+            "count": firestore.Increment(1),
+        },
+        "last_updated": firestore.SERVER_TIMESTAMP,
+    }, merge=True)
+    batch.commit()
+
+
+def _escalate_with_retry(event):
+    user_id = event.data['user_id']
+    db = get_db()
+    if db is None:
+        # Nowhere durable to put it beyond the event log
+        _count("unrecorded")
+        _recent.append({**event.to_dict(), "outcome": "unrecorded"})
+        log.warning("Crisis detected for user %s (%s) but Firestore is not configured",
+                    user_id, event.data.get('source'))
+        return
+
+    delay = CRISIS_RETRY_DELAY
+    with tracing.trace("crisis.escalate", source=event.data.get('source')):
+        for attempt in range(1, CRISIS_RETRY_ATTEMPTS + 1):
+            try:
+                escalate(db, event)
+                break
+            except Exception as e:
+                log.error("Crisis escalation for user %s failed (attempt %s/%s): %s",
+                          user_id, attempt, CRISIS_RETRY_ATTEMPTS, e)
+                if attempt == CRISIS_RETRY_ATTEMPTS:
+                    _count("failed")
+                    metrics.crisis_escalation_lag.observe(time.time() - event.ts, "failed")
+                    _recent.append({**event.to_dict(), "outcome": "failed"})
+                    return
+                time.sleep(delay)
+                delay *= 2
+
+    lag = time.time() - event.ts
+    _count("escalated")
+    metrics.crisis_escalation_lag.observe(lag, "escalated")
+    _recent.append({**event.to_dict(), "outcome": "escalated", "lag_seconds": round(lag, 3)})
+    log.warning("Crisis escalated for user %s (%s) %.2fs after detection",
+                user_id, event.data.get('source'), lag)
+
+
+def _on_crisis_detected(event):
+    if not event.data.get('user_id'):
+        # Anonymous /aegis/crisis-detection calls have no user to escalate
+        return
+    # Firestore writes and retries run off the dispatcher so other events keep flowing
+    _worker.get().submit(_escalate_with_retry, event)
+
+
+def in_crisis_hold(user_data: dict, now: datetime = None) -> bool:
+    """True if a crisis was detected for the user within CRISIS_RISK_HOLD_HOURS."""
+    last = ((user_data or {}).get('crisis') or {}).get('last_detected')
+    if not isinstance(last, datetime):
+        return False
+    if last.tzinfo is None:
+        last = last.replace(tzinfo=timezone.utc)
+    now = now or datetime.now(timezone.utc)
+    return now - last < timedelta(hours=CRISIS_RISK_HOLD_HOURS)
+
+
+def get_escalation_stats() -> dict:
+    with _counts_lock:
+        counts = dict(_counts)
+    return {**counts, "recent": list(reversed(_recent))}
+
+
+events.subscribe(events.CRISIS_DETECTED, _on_crisis_detected)
@@ -1,16 +1,60 @@
 # Elara Agent - Conversational AI Companion
 from flask import Blueprint, request, jsonify
-from firebase_admin import firestore
+from .clients import Lazy, firestore, get_db, get_watsonx_model
 from .agent_data import AEGIS_TRIGGERS
+from .resource_jobs import submit_resource_job
+from .prompt_utils import estimate_tokens, PromptStats
+from .response_utils import postprocess_response
+from .conversation_memory import load_memory, schedule_summary
+from .cache import TTLCache, SingleFlight
+from .llm_dispatcher import BatchDispatcher
+from .http_client import Deadline
+from . import metrics
+from . import tracing
+from . import events
+from . import session_index
+from .metrics_accumulator import get_accumulator, ADJUSTED_METRICS
+from .logging_utils import sampled
+from .greeting_pool import metric_bucket, greeting_prompt, sample_greeting, add_greeting, schedule_fill, get_pool_stats
+import os
 import re
-import datetime
+import time
+import hashlib
+import threading
+import logging
 
 elara_bp = Blueprint('elara_agent', __name__)
+log = logging.getLogger(__name__)
 watsonx_model = None
 
 # Configuration
-HISTORY_TURNS = 5
-MAX_SENTENCES = 3
+SUMMARY_MAX_WORDS = 100
+GREETING_CACHE_TTL = int(os.getenv("ELARA_GREETING_CACHE_TTL", "300"))
+RESPONSE_CACHE_ENABLED = os.getenv("ELARA_RESPONSE_CACHE_ENABLED", "true").lower() != "false"
+RESPONSE_CACHE_SIZE = int(os.getenv("ELARA_RESPONSE_CACHE_SIZE", "512"))
+RESPONSE_CACHE_TTL = int(os.getenv("ELARA_RESPONSE_CACHE_TTL", "1800"))
+RESPONSE_CACHE_MAX_WORDS = 6
+# Concurrent chat prompts are sent to the model in micro-batches (see llm_dispatcher)
+LLM_BATCHING_ENABLED = os.getenv("ELARA_LLM_BATCHING_ENABLED", "true").lower() != "false"
+CHAT_LLM_DEADLINE = float(os.getenv("ELARA_LLM_DEADLINE", "20"))
+RESOURCE_PENDING_TEXT = "Let me find a helpful resource for you. It will appear below in a moment."
+
+_prompt_stats = PromptStats()
+_greeting_cache = TTLCache(max_size=1024, ttl_seconds=GREETING_CACHE_TTL)
+_greeting_flight = SingleFlight()
+_response_cache = TTLCache(max_size=RESPONSE_CACHE_SIZE, ttl_seconds=RESPONSE_CACHE_TTL)
+_dispatcher = Lazy(lambda: BatchDispatcher(lambda prompts: _get_model().generate(prompt=prompts)))
+metrics.register_cache("elara_greeting", lambda: _greeting_cache)
+metrics.register_cache("elara_response", lambda: _response_cache)
+_response_cache_lock = threading.Lock()
+_response_cache_counts = {"uncacheable": 0}
+
+# Words that tie a message to earlier turns, so a reply cached for another session would not fit
+CONTEXT_WORDS = {
+    "it", "that", "this", "those", "these", "he", "she", "they", "him", "her", "them", "his", "their",
+    "again", "earlier", "before", "still", "said", "mentioned", "same", "more", "why", "what", "yes", "no",
+}
+_MESSAGE_WORD_RE = re.compile(r"[a-z0-9']+")
 
 # Resource keywords for Vero handoff
 RESOURCE_KEYWORDS = [
@@ -28,11 +72,13 @@ def set_watsonx_model(model):
     watsonx_model = model
 
 
+def _get_model():
+    """Explicitly set model, else the shared lazily-built Watsonx model."""
+    return watsonx_model if watsonx_model is not None else get_watsonx_model()
+
+
 def _get_db_or_none():
-    try:
-        return firestore.client()
-    except Exception:
-        return None
+    return get_db()
 
 
 def _is_resource_request(text: str) -> bool:
@@ -58,9 +104,7 @@ def generate_mock_response(prompt, context=""):
     return "I'm here to listen and support you. Tell me more about what you're experiencing."
 
 
-def build_system_prompt(num_prev_messages: int) -> str:
-    """Build system prompt for Elara."""
-    base_prompt = """
+PERSONA_PROMPT = """
 <persona>
 You are Elara, a caring AI companion. Your voice is warm, empathetic, and natural. You are not a robot. Use conversational language, be curious, and gently guide the conversation. Avoid clichés like "I'm sorry to hear that" on every message. Instead, ask open-ended questions, validate feelings ("That sounds incredibly tough."), and show you're listening.
 </persona>
@@ -70,60 +114,150 @@ You are Elara, a caring AI companion. Your voice is warm, empathetic, and natura
 - Respond briefly (2-3 sentences max). Do not summarize the entire conversation unless the user asks.
 </instructions>
 """
-    if num_prev_messages == 0:
-        base_prompt += "\n<instructions>Begin with a formal, respectful greeting. Introduce yourself as Elara and warmly acknowledge the user's presence.</instructions>"
-    elif num_prev_messages == 1:
-        base_prompt += "\n<instructions>Continue formal and respectful tone; begin gentle comfort.</instructions>"
-    elif num_prev_messages < 4:
-        base_prompt += "\n<instructions>Gradually shift toward a casual, supportive, and friendly tone.</instructions>"
-    else:
-        base_prompt += "\n<instructions>Now speak casually and comfortably, matching the user's style.</instructions>"
-    return base_prompt
-
-
-def sanitize_ai_response(raw_text: str) -> str:
-    """Clean AI response to single Elara reply."""
-    if not raw_text:
-        return raw_text or ""
-
-    t = raw_text.strip().strip('`"\' \n\r')
-    t = re.sub(r'^\s*Elara[:\-\s]+', '', t, flags=re.I)
-
-    lines = t.splitlines()
-    first_nonempty_idx = 0
-    for idx, ln in enumerate(lines):
-        if ln.strip():
-            first_nonempty_idx = idx
-            break
-    lines = lines[first_nonempty_idx:]
-
-    cleaned_lines = []
-    for ln in lines:
-        if re.match(r'^\s*Elara[:\-\s]+', ln, flags=re.I):
-            if not cleaned_lines:
-                ln = re.sub(r'^\s*Elara[:\-\s]+', '', ln, flags=re.I)
-                cleaned_lines.append(ln)
-            else:
-                break
-        elif re.match(r'^\s*User[:\-\s]+', ln, flags=re.I):
-            break
-        else:
-            cleaned_lines.append(ln)
 
-    if cleaned_lines:
-        t = "\n".join(cleaned_lines).strip()
-    else:
-        t = t.strip()
+TONE_INSTRUCTIONS = (
+    "Begin with a formal, respectful greeting. Introduce yourself as Elara and warmly acknowledge the user's presence.",
+    "Continue formal and respectful tone; begin gentle comfort.",
+    "Gradually shift toward a casual, supportive, and friendly tone.",
+    "Now speak casually and comfortably, matching the user's style.",
+)
+
+# The four possible system prompts, built once at import
+SYSTEM_PROMPTS = tuple(f"{PERSONA_PROMPT}\n<instructions>{tone}</instructions>" for tone in TONE_INSTRUCTIONS)
+
+TURN_INSTRUCTIONS = (
+    "<instructions>Respond with ONLY ONE Elara message. Do NOT include multiple 'Elara:' lines or simulate future turns. "
+    "Keep it brief (1-3 sentences). If the user hints at wanting a technique or resource, include "
+    "[ACTION:find_technique|<short_problem>].</instructions>\n"
+    "Elara:"
+)
 
-    if "\n\n" in t:
-        t = t.split("\n\n", 1)[0].strip()
 
-    sentences = re.split(r'(?<=[.!?])\s+', t)
-    if len(sentences) > MAX_SENTENCES:
-        t = " ".join(sentences[:MAX_SENTENCES]).strip()
+def tone_bucket(num_prev_messages: int) -> int:
+    """Index into SYSTEM_PROMPTS for the number of previous user messages."""
+    if num_prev_messages <= 0:
+        return 0
+    if num_prev_messages == 1:
+        return 1
+    if num_prev_messages < 4:
+        return 2
+    return 3
 
-    t = re.sub(r'\s+\n', '\n', t).strip()
-    return t
+
+def build_system_prompt(num_prev_messages: int) -> str:
+    """Build system prompt for Elara."""
+    return SYSTEM_PROMPTS[tone_bucket(num_prev_messages)]
+
+
+def render_history(chat_history) -> str:
+    """Transcript of (user_message, ai_response) turns; greetings have user_message None."""
+    parts = []
+    for u_msg, ai_msg in chat_history:
+        if ai_msg is None:
+            continue
+        if u_msg is not None:
+            parts.append(f'User: "{u_msg}"\n')
+        parts.append(f'Elara: "{ai_msg}"\n')
+    return "".join(parts)
+
+
+class ChatPrompt:
+    """
+    Elara's prompt split at the stable boundary: `prefix` (system prompt and
+    prior turns) is identical across retries and is the reusable part for a
+    backend with prefix/KV caching; `suffix` holds only the new user turn.
+    """
+
+    __slots__ = ("prefix", "suffix", "history_text")
+
+    def __init__(self, prefix: str, suffix: str, history_text: str):
+        self.prefix = prefix
+        self.suffix = suffix
+        self.history_text = history_text
+
+    @property
+    def text(self) -> str:
+        return self.prefix + self.suffix
+
+    @property
+    def prefix_key(self) -> str:
+        return hashlib.sha1(self.prefix.encode("utf-8")).hexdigest()
+
+
+def build_chat_prompt(chat_history, user_message: str, summary: str = "", num_prev_messages: int = None) -> ChatPrompt:
+    """Assemble the chat prompt and record build time and size."""
+    started = time.perf_counter()
+    if num_prev_messages is None:
+        num_prev_messages = sum(1 for u, _ in chat_history if u is not None)
+    history_text = render_history(chat_history)
+    summary_text = f"<summary>Earlier in this conversation: {summary}</summary>\n" if summary else ""
+    prompt = ChatPrompt(
+        prefix=f"{build_system_prompt(num_prev_messages)}\n\n{summary_text}{history_text}",
+        suffix=f'User: "{user_message}"\n{TURN_INSTRUCTIONS}',
+        history_text=history_text,
+    )
+    _prompt_stats.record(
+        build_ms=(time.perf_counter() - started) * 1000,
+        prompt_tokens=estimate_tokens(prompt.text),
+        prefix_tokens=estimate_tokens(prompt.prefix),
+    )
+    return prompt
+
+
+def summarize_turns(previous_summary: str, turns) -> str:
+    """Fold turns into the running session summary with the model; None without one."""
+    model = _get_model()
+    if not model:
+        return None
+    prompt = (
+        "<instructions>Update the summary of this conversation between a user and Elara, a caring AI companion. "
+        f"Keep what the user shared about their feelings, situation and goals. At most {SUMMARY_MAX_WORDS} words. "
+        "Reply with the summary only.</instructions>\n"
+        f"<summary>{previous_summary}</summary>\n"
+        f"<conversation>\n{render_history(turns)}</conversation>\n"
+        "Updated summary:"
+    )
+    response = model.generate(prompt=prompt)
+    return response.get('results', [{}])[0].get('generated_text', '').strip()
+
+
+def normalize_message(text: str) -> str:
+    """Lowercased words only: "Hi!!" and "hi" share a cache entry."""
+    return " ".join(_MESSAGE_WORD_RE.findall((text or "").lower()))
+
+
+def response_cache_key(user_message: str, num_prev_messages: int, chat_history):
+    """
+    (normalized message, tone bucket, last-turn fingerprint), or None when the
+    message should not be answered from cache: longer than
+    RESPONSE_CACHE_MAX_WORDS, or referring to something said earlier.
+    """
+    words = normalize_message(user_message).split()
+    if not words or len(words) > RESPONSE_CACHE_MAX_WORDS or CONTEXT_WORDS.intersection(words):
+        with _response_cache_lock:
+            _response_cache_counts["uncacheable"] += 1
+        return None
+    last_turn = render_history(chat_history[-1:])
+    fingerprint = hashlib.sha1(last_turn.encode("utf-8")).hexdigest()[:12]
+    return (" ".join(words), tone_bucket(num_prev_messages), fingerprint)
+
+
+def get_response_cache_stats() -> dict:
+    stats = _response_cache.stats()
+    stats["enabled"] = RESPONSE_CACHE_ENABLED
+    stats["uncacheable"] = _response_cache_counts["uncacheable"]
+    return stats
+
+
+def get_dispatcher_stats() -> dict:
+    stats = _dispatcher.get().stats() if _dispatcher.initialized else {}
+    stats["enabled"] = LLM_BATCHING_ENABLED
+    return stats
+
+
+def get_prompt_stats() -> dict:
+    """Elara prompt build time (ms) and size (estimated tokens) per chat turn."""
+    return _prompt_stats.snapshot()
 
 
 def _find_latest_session_for_user(db, user_id: str):
@@ -139,21 +273,16 @@ def _find_latest_session_for_user(db, user_id: str):
         for doc in q:
             return doc.id
     except Exception as e:
-        print(f"Error finding latest session for user {user_id}: {e}")
+        log.error("Error finding latest session for user %s: %s", user_id, e)
     return None
 
 
 def _create_session(db, user_id: str):
     """Create new session document."""
     try:
-        doc_ref = db.collection('user_sessions').document()
-        doc_ref.set({
-            "userId": user_id,
-            "startTime": firestore.SERVER_TIMESTAMP
-        })
-        return doc_ref.id
+        return session_index.create_session(db, user_id)
     except Exception as e:
-        print(f"Error creating session for user {user_id}: {e}")
+        log.error("Error creating session for user %s: %s", user_id, e)
         return None
 
 
@@ -165,7 +294,7 @@ def _get_or_create_session(db, user_id: str, provided_session_id: str = None):
             if doc.exists:
                 return provided_session_id
         except Exception as e:
-            print(f"Error verifying provided session_id {provided_session_id}: {e}")
+            log.error("Error verifying provided session_id %s: %s", provided_session_id, e)
 
     latest = _find_latest_session_for_user(db, user_id)
     if latest:
@@ -174,7 +303,23 @@ def _get_or_create_session(db, user_id: str, provided_session_id: str = None):
     return _create_session(db, user_id)
 
 
-def _store_vero_response(db, session_id, user_message, vero_response_text, resource_data=None):
+def _format_resource_reply(resource_result):
+    """Vero's chat text and button payload for a resource lookup result, or (None, None)."""
+    if isinstance(resource_result, dict):
+        resource_text = f"I found a helpful resource for you: {resource_result.get('title', 'A technique')}. "
+        if resource_result.get('description'):
+            resource_text += f"{resource_result['description']} "
+        resource_text += "Click the button below to see the detailed steps and instructions."
+        return resource_text, resource_result
+    if isinstance(resource_result, list):
+        return ("I found several helpful resources for you. Click the button below to access them.",
+                {"type": "list", "items": resource_result})
+    if isinstance(resource_result, str):
+        return resource_result, {"type": "text", "text": resource_result}
+    return None, None
+
+
+def _store_vero_response(db, user_id, session_id, user_message, vero_response_text, resource_data=None):
     """Store Vero response in chat history."""
     try:
         if session_id:
@@ -185,37 +330,19 @@ def _store_vero_response(db, session_id, user_message, vero_response_text, resou
                 'resource_data': resource_data,
                 'timestamp': firestore.SERVER_TIMESTAMP
             })
+            # Whether this is the session's first message is not known here, so no preview
+            session_index.record_turn(db, session_id)
     except Exception as e:
-        print(f"Error storing Vero response in chat history for session {session_id}: {e}")
-
+        log.error("Error storing Vero response in chat history for session %s: %s", session_id, e)
 
-@elara_bp.route('/elara/greeting', methods=['POST'])
-def get_greeting():
-    """Generate personalized greeting."""
-    db = _get_db_or_none()
-    user_metrics = request.json.get('metrics', {"anxiety": 50, "depression": 50, "stress": 50})
-    user_id = request.json.get('userId')
 
-    greeting_prompt = f"""
-<role>You are Elara, a caring AI companion starting a conversation.</role>
-<instructions>
-Based on the user's long-term mental health metrics (0-100 scale), generate a SINGLE, short, natural, and welcoming opening message.
-- If depression is high, be gentle and reassuring.
-- If anxiety is high, be calm and grounding.
-- If stress is high, be supportive and acknowledge their pressure.
-- DO NOT mention the scores. Be human.
-</instructions>
-<user_metrics>
-{user_metrics}
-</user_metrics>
-Your welcoming message:
-"""
+def generate_greeting_text(model, prompt: str) -> str:
+    response = model.generate(prompt=prompt)
+    return response.get('results', [{}])[0].get('generated_text', '').strip().strip('"""').strip()
 
-    # Resolve or create session FIRST to avoid duplicate parallel session creation
-    session_id = None
-    if user_id and db:
-        session_id = _get_or_create_session(db, user_id, provided_session_id=None)
 
+def _greeting_payload(db, user_metrics, session_id=None) -> dict:
+    """The session's greeting, generating and storing one if it has none."""
     # If we already have a greeting stored for this session recently, return it (idempotent)
     if session_id and db:
         try:
@@ -233,20 +360,26 @@ Your welcoming message:
                 if payload.get('type') == 'greeting' or payload.get('user_message') is None:
                     prev_greeting = payload.get('ai_response') or ""
                     if prev_greeting:
-                        return jsonify({"agent": "Elara", "response": prev_greeting, "sessionId": session_id, "duplicate": True})
+                        return {"agent": "Elara", "response": prev_greeting, "sessionId": session_id, "duplicate": True}
         except Exception as e:
-            print(f"Error checking for existing greeting in session {session_id}: {e}")
+            log.error("Error checking for existing greeting in session %s: %s", session_id, e)
 
-    # No prior greeting found; generate a new one
-    try:
-        if watsonx_model:
-            response = watsonx_model.generate(prompt=greeting_prompt)
-            ai_response_text = response.get('results', [{}])[0].get('generated_text', '').strip().strip('"""').strip()
-        else:
-            ai_response_text = generate_mock_response(greeting_prompt)
-    except Exception as e:
-        print(f"Error calling Watsonx AI for greeting: {e}")
-        ai_response_text = generate_mock_response(greeting_prompt)
+    # No prior greeting found; sample the metric bucket's pool, calling the model only when it is empty
+    bucket = metric_bucket(user_metrics)
+    prompt = greeting_prompt(bucket)
+    ai_response_text = sample_greeting(bucket)
+    if ai_response_text is None:
+        try:
+            model = _get_model()
+            if model:
+                ai_response_text = generate_greeting_text(model, prompt)
+                add_greeting(bucket, ai_response_text)
+                schedule_fill(bucket, lambda p: generate_greeting_text(model, p))
+            else:
+                ai_response_text = generate_mock_response(prompt)
+        except Exception as e:
+            log.error("Error calling Watsonx AI for greeting: %s", e)
+            ai_response_text = generate_mock_response(prompt)
 
     # Store greeting once
     if session_id and db:
@@ -259,9 +392,52 @@ Your welcoming message:
                 'timestamp': firestore.SERVER_TIMESTAMP,
             })
         except Exception as e:
-            print(f"Error storing greeting in session {session_id}: {e}")
+            log.error("Error storing greeting in session %s: %s", session_id, e)
 
-    return jsonify({"agent": "Elara", "response": ai_response_text, "sessionId": session_id})
+    return {"agent": "Elara", "response": ai_response_text, "sessionId": session_id}
+
+
+def get_greeting_stats() -> dict:
+    return {"cache": _greeting_cache.stats(), "coalesced": _greeting_flight.coalesced, "pool": get_pool_stats()}
+
+
+@elara_bp.route('/elara/greeting', methods=['POST'])
+def get_greeting():
+    """Generate personalized greeting."""
+    db = _get_db_or_none()
+    user_metrics = request.json.get('metrics', {"anxiety": 50, "depression": 50, "stress": 50})
+    user_id = request.json.get('userId')
+    provided_session_id = request.json.get('sessionId')
+
+    def resolve():
+        # Resolve or create the session first; the cache is keyed on the resolved session, so a
+        # session created since (a finished screening, possibly on another worker) gets its own greeting
+        session_id = _get_or_create_session(db, user_id, provided_session_id) if user_id and db else None
+        # A reload within GREETING_CACHE_TTL gets the stored greeting without reading chat history
+        cached = _greeting_cache.get((user_id, session_id)) if session_id else None
+        if cached is not None:
+            return {**cached, "duplicate": True}
+        payload = _greeting_payload(db, user_metrics, session_id)
+        if session_id:
+            _greeting_cache.set((user_id, session_id), payload)
+        return payload
+
+    # Concurrent requests for the same user and session share one resolution, one generation
+    # and one stored write
+    payload, shared = _greeting_flight.do((user_id, provided_session_id), resolve)
+    if shared:
+        payload = {**payload, "duplicate": True}
+    return jsonify(payload)
+
+
+def reply_metrics_delta(ai_response_text: str) -> int:
+    """-2 after encouraging replies, -1 after a suggested technique, else 0."""
+    lowered = (ai_response_text or '').lower()
+    if any(k in lowered for k in ["great", "glad", "proud", "nice progress", "you did well", "well done"]):
+        return -2
+    if any(k in lowered for k in ["breathe", "grounding", "try this technique", "we can try"]):
+        return -1
+    return 0
 
 
 @elara_bp.route('/elara/chat', methods=['POST'])
@@ -278,239 +454,211 @@ def handle_chat():
         return jsonify({"error": "userId and message are required"}), 400
 
     # Crisis detection
-    try:
-        lowered = user_message.lower()
-        for trig in AEGIS_TRIGGERS:
-            pattern = r'\b' + re.escape(trig.lower()) + r'\b'
-            if re.search(pattern, lowered):
-                from .aegis_agent import get_helpline_info, format_crisis_response
-                helplines = get_helpline_info(user_region)
-                crisis_text = format_crisis_response(helplines, is_crisis=True)
-                return jsonify({"agent": "Aegis", "response": crisis_text})
-    except Exception as e:
-        print(f"Aegis detection error: {e}")
+    with tracing.span("elara.aegis"):
+        try:
+            lowered = user_message.lower()
+            for trig in AEGIS_TRIGGERS:
+                pattern = r'\b' + re.escape(trig.lower()) + r'\b'
+                if re.search(pattern, lowered):
+                    from .aegis_agent import get_helpline_info, format_crisis_response
+                    metrics.aegis_trigger_hits.inc("crisis")
+                    events.publish(events.CRISIS_DETECTED, user_id=user_id, source="elara",
+                                   trigger=trig, region=user_region)
+                    helplines = get_helpline_info(user_region)
+                    crisis_text = format_crisis_response(helplines, is_crisis=True)
+                    return jsonify({"agent": "Aegis", "response": crisis_text})
+        except Exception as e:
+            log.error("Aegis detection error: %s", e)
 
-    crisis_keywords = ["crisis line", "helpline", "help line", "phone number", "emergency number", "contact"]
-    if any(kw in user_message.lower() for kw in crisis_keywords):
-        from .aegis_agent import get_helpline_info, format_crisis_response
-        helplines = get_helpline_info(user_region)
-        crisis_text = format_crisis_response(helplines, is_crisis=False)
-        return jsonify({"agent": "Aegis", "response": crisis_text})
+        crisis_keywords = ["crisis line", "helpline", "help line", "phone number", "emergency number", "contact"]
+        if any(kw in user_message.lower() for kw in crisis_keywords):
+            from .aegis_agent import get_helpline_info, format_crisis_response
+            metrics.aegis_trigger_hits.inc("helpline_request")
+            helplines = get_helpline_info(user_region)
+            crisis_text = format_crisis_response(helplines, is_crisis=False)
+            return jsonify({"agent": "Aegis", "response": crisis_text})
 
     # Resource handoff
-    try:
-        if _is_resource_request(user_message):
-            try:
-                from .vero_agent import find_resource_for_query
-                resource_result = find_resource_for_query(user_message, user_region)
-                
-                if isinstance(resource_result, dict):
-                    resource_text = f"I found a helpful resource for you: {resource_result.get('title', 'A technique')}. "
-                    if resource_result.get('description'):
-                        resource_text += f"{resource_result['description']} "
-                    resource_text += "Click the button below to see the detailed steps and instructions."
-                    
-                    session_id = _get_or_create_session(db, user_id, provided_session_id)
-                    _store_vero_response(db, session_id, user_message, resource_text, resource_result)
-                    
-                    return jsonify({
-                        "agent": "Vero", 
-                        "response": resource_text,
-                        "resource_data": resource_result,
-                        "show_resource_button": True,
-                        "sessionId": session_id
-                    })
-                elif isinstance(resource_result, list):
-                    resource_text = "I found several helpful resources for you. Click the button below to access them."
-                    
-                    session_id = _get_or_create_session(db, user_id, provided_session_id)
-                    _store_vero_response(db, session_id, user_message, resource_text, {"type": "list", "items": resource_result})
-                    
-                    return jsonify({
-                        "agent": "Vero", 
-                        "response": resource_text,
-                        "resource_data": {"type": "list", "items": resource_result},
-                        "show_resource_button": True,
-                        "sessionId": session_id
-                    })
-                elif isinstance(resource_result, str):
-                    session_id = _get_or_create_session(db, user_id, provided_session_id)
-                    _store_vero_response(db, session_id, user_message, resource_result, {"type": "text", "text": resource_result})
-                    
-                    return jsonify({
-                        "agent": "Vero", 
-                        "response": resource_result,
-                        "resource_data": {"type": "text", "text": resource_result},
-                        "show_resource_button": True,
-                        "sessionId": session_id
-                    })
-            except ImportError:
-                pass
-            except Exception as e:
-                print(f"Resource agent error: {e}")
-    except Exception as e:
-        print(f"Resource-intent detection error: {e}")
-
-    # Session handling
-    session_id = _get_or_create_session(db, user_id, provided_session_id) if db else None
-
-    # Retrieve chat history
-    chat_history = []
-    if session_id and db:
+    with tracing.span("elara.resource_handoff"):
         try:
-            rows = (
-                db.collection('user_sessions').document(session_id)
-                .collection('chatHistory')
-                .order_by('timestamp', direction=firestore.Query.DESCENDING)
-                .limit(HISTORY_TURNS)
-                .stream()
-            )
-            for doc in rows:
-                d = doc.to_dict()
-                u = d.get('user_message')
-                a = d.get('ai_response')
-                if u is not None and a is not None:
-                    chat_history.append((u, a))
-                elif a is not None and (u is None):
-                    chat_history.append((None, a))
+            if _is_resource_request(user_message):
+                try:
+                    from .vero_agent import find_resource_for_query
+                    # Only instant lookups (built-in techniques, cached pages) run inline
+                    resource_result = find_resource_for_query(user_message, user_region, allow_network=False)
+                    session_id = _get_or_create_session(db, user_id, provided_session_id) if db else None
+
+                    if resource_result is None:
+                        def _store_when_ready(result):
+                            text, resource_data = _format_resource_reply(result)
+                            if text:
+                                _store_vero_response(db, user_id, session_id, user_message, text, resource_data)
+
+                        job = submit_resource_job(user_message, user_region, on_complete=_store_when_ready)
+                        return jsonify({
+                            "agent": "Vero",
+                            "response": RESOURCE_PENDING_TEXT,
+                            "resource_job_id": job.id,
+                            "sessionId": session_id
+                        })
+
+                    resource_text, resource_data = _format_resource_reply(resource_result)
+                    if resource_text:
+                        _store_vero_response(db, user_id, session_id, user_message, resource_text, resource_data)
+                        return jsonify({
+                            "agent": "Vero",
+                            "response": resource_text,
+                            "resource_data": resource_data,
+                            "show_resource_button": True,
+                            "sessionId": session_id
+                        })
+                except ImportError:
+                    pass
+                except Exception as e:
+                    log.error("Resource agent error: %s", e)
         except Exception as e:
-            print(f"Error retrieving chat history for session {session_id}: {e}")
-            chat_history = []
+            log.error("Resource-intent detection error: %s", e)
 
-    chat_history = list(reversed(chat_history))
-    num_prev_messages = len([1 for u, a in chat_history if u is not None])
+    # Session handling
+    with tracing.span("elara.session"):
+        session_id = _get_or_create_session(db, user_id, provided_session_id) if db else None
+
+    # Retrieve conversation memory
+    with tracing.span("elara.memory"):
+        memory = None
+        if session_id and db:
+            try:
+                memory = load_memory(db, session_id)
+                schedule_summary(db, session_id, memory, summarize_turns)
+            except Exception as e:
+                log.error("Error retrieving chat history for session %s: %s", session_id, e)
 
     # Build prompt
-    system_prompt = build_system_prompt(num_prev_messages)
-    history_text = ""
-    for u_msg, ai_msg in chat_history:
-        if u_msg is None and ai_msg is not None:
-            history_text += f'Elara: "{ai_msg}"\n'
-        elif u_msg is not None and ai_msg is not None:
-            history_text += f'User: "{u_msg}"\nElara: "{ai_msg}"\n'
-
-    final_prompt = (
-        f"{system_prompt}\n\n{history_text}User: \"{user_message}\"\n"
-        "<instructions>Respond with ONLY ONE Elara message. Do NOT include multiple 'Elara:' lines or simulate future turns. Keep it brief (1-3 sentences). If the user hints at wanting a technique or resource, include [ACTION:find_technique|<short_problem>].</instructions>\n"
-        "Elara:"
-    )
+    chat_turns = memory.prompt_turns if memory is not None else []
+    num_prev_messages = memory.num_user_messages if memory is not None else 0
+    chat_prompt = build_chat_prompt(chat_turns, user_message, memory.summary if memory else "", num_prev_messages)
+    final_prompt = chat_prompt.text
+    history_text = chat_prompt.history_text
+
+    # Frequent short messages are answered from the response cache
+    cache_key = None
+    if RESPONSE_CACHE_ENABLED and not data.get('noCache'):
+        cache_key = response_cache_key(user_message, num_prev_messages, chat_turns)
+    ai_response_text = _response_cache.get(cache_key) if cache_key else None
 
     # Generate response
-    try:
-        if watsonx_model:
-            response = watsonx_model.generate(prompt=final_prompt)
-            ai_response_text = response.get('results', [{}])[0].get('generated_text', '')
-            if not ai_response_text:
-                ai_response_text = response.get('generated_text', '')
-            ai_response_text = ai_response_text.strip()
-        else:
-            ai_response_text = generate_mock_response(final_prompt, history_text)
-    except Exception as e:
-        print(f"Error calling Watsonx AI for Elara: {e}")
-        ai_response_text = generate_mock_response(final_prompt, history_text)
+    if ai_response_text is None:
+        with tracing.span("elara.llm", batched=LLM_BATCHING_ENABLED):
+            generated = False
+            try:
+                model = _get_model()
+                if model:
+                    if LLM_BATCHING_ENABLED:
+                        response = _dispatcher.get().generate(final_prompt, Deadline(CHAT_LLM_DEADLINE))
+                    else:
+                        response = model.generate(prompt=final_prompt)
+                    ai_response_text = response.get('results', [{}])[0].get('generated_text', '')
+                    if not ai_response_text:
+                        ai_response_text = response.get('generated_text', '')
+                    ai_response_text = ai_response_text.strip()
+                    generated = True
+                else:
+                    ai_response_text = generate_mock_response(final_prompt, history_text)
+            except Exception as e:
+                log.warning("Error calling Watsonx AI for Elara: %s", e, extra=sampled(20))
+                ai_response_text = generate_mock_response(final_prompt, history_text)
 
-    ai_response_text = sanitize_ai_response(ai_response_text)
+        if generated and cache_key and ai_response_text:
+            _response_cache.set(cache_key, ai_response_text)
 
-    # Parse ACTION tag for proactive Vero handoff
-    try:
-        action_match = re.search(r"\[ACTION:find_technique\|([^\]]+)\]", ai_response_text, flags=re.I)
-        requested_problem = action_match.group(1).strip() if action_match else None
-        ai_response_text = re.sub(r"\s*\[ACTION:find_technique\|[^\]]+\]\s*", "", ai_response_text).strip()
-    except Exception:
-        requested_problem = None
+    # Single reply text plus the ACTION tag for proactive Vero handoff
+    ai_response_text, requested_problem = postprocess_response(ai_response_text)
 
     # Store chat turn
-    try:
-        if session_id and db:
-            db.collection('user_sessions').document(session_id).collection('chatHistory').add({
-                'user_message': user_message,
-                'ai_response': ai_response_text,
-                'timestamp': firestore.SERVER_TIMESTAMP
-            })
-    except Exception as e:
-        print(f"Error storing chat history for session {session_id}: {e}")
+    with tracing.span("elara.store_turn"):
+        try:
+            if session_id and db:
+                db.collection('user_sessions').document(session_id).collection('chatHistory').add({
+                    'user_message': user_message,
+                    'ai_response': ai_response_text,
+                    'timestamp': firestore.SERVER_TIMESTAMP
+                })
+                session_index.record_turn(db, session_id, user_message,
+                                          first=memory is not None and memory.num_user_messages == 0)
+                events.publish(events.CHAT_TURN_STORED, user_id=user_id, session_id=session_id)
+        except Exception as e:
+            log.error("Error storing chat history for session %s: %s", session_id, e)
 
-    # Lightweight heuristic to update metrics sensitivity after supportive replies
-    try:
-        if session_id and user_id and db:
-            state_ref = db.collection('user_states').document(user_id)
-            state_doc = state_ref.get()
-            if state_doc.exists:
-                cur = state_doc.to_dict().get('metrics', {"anxiety": 50, "depression": 50, "stress": 50})
-            else:
-                cur = {"anxiety": 50, "depression": 50, "stress": 50}
-
-            lowered = (ai_response_text or '').lower()
-            delta = 0
-            if any(k in lowered for k in ["great", "glad", "proud", "nice progress", "you did well", "well done"]):
-                delta = -2
-            elif any(k in lowered for k in ["breathe", "grounding", "try this technique", "we can try"]):
-                delta = -1
-
-            if delta != 0:
-                cur['anxiety'] = max(0, min(100, cur.get('anxiety', 50) + delta))
-                cur['depression'] = max(0, min(100, cur.get('depression', 50) + delta))
-                cur['stress'] = max(0, min(100, cur.get('stress', 50) + delta))
-                try:
-                    state_ref.update({
-                        'metrics': cur,
-                        'last_updated': firestore.SERVER_TIMESTAMP
-                    })
-                except Exception as e:
-                    print(f"Error updating metrics post chat: {e}")
-            updated_metrics = cur
-        else:
-            updated_metrics = None
-    except Exception as e:
-        print(f"Heuristic metrics update error: {e}")
+    # Lightweight heuristic to update metrics sensitivity after supportive replies;
+    # deltas are coalesced per user and flushed in the background
+    with tracing.span("elara.metrics_update"):
         updated_metrics = None
+        try:
+            if session_id and user_id and db:
+                delta = reply_metrics_delta(ai_response_text)
+                accumulator = get_accumulator()
+                updated_metrics = accumulator.add(
+                    user_id, {name: delta for name in ADJUSTED_METRICS} if delta else {})
+                if updated_metrics is None:
+                    # Not read by this process within the last flush interval
+                    updated_metrics = accumulator.load_projected(db, user_id)
+        except Exception as e:
+            log.error("Heuristic metrics update error: %s", e)
 
     # If ACTION requested, attach resource button data immediately
     if requested_problem:
-        try:
-            from .vero_agent import find_resource_for_query
-            resource_result = find_resource_for_query(requested_problem, user_region)
-            if resource_result:
-                return jsonify({
-                    "agent": "Elara",
-                    "response": ai_response_text,
-                    "sessionId": session_id,
-                    "metrics": updated_metrics,
-                    "show_resource_button": True,
-                    "resource_data": resource_result
-                })
-        except Exception as e:
-            print(f"Error attaching Vero resource: {e}")
+        with tracing.span("elara.action_resource"):
+            try:
+                from .vero_agent import find_resource_for_query
+                resource_result = find_resource_for_query(requested_problem, user_region, allow_network=False)
+                if resource_result:
+                    return jsonify({
+                        "agent": "Elara",
+                        "response": ai_response_text,
+                        "sessionId": session_id,
+                        "metrics": updated_metrics,
+                        "show_resource_button": True,
+                        "resource_data": resource_result
+                    })
+                if resource_result is None:
+                    # Web lookup needed: the client polls for the button data
+                    job = submit_resource_job(requested_problem, user_region)
+                    return jsonify({
+                        "agent": "Elara",
+                        "response": ai_response_text,
+                        "sessionId": session_id,
+                        "metrics": updated_metrics,
+                        "resource_job_id": job.id
+                    })
+            except Exception as e:
+                log.error("Error attaching Vero resource: %s", e)
 
     return jsonify({"agent": "Elara", "response": ai_response_text, "sessionId": session_id, "metrics": updated_metrics})
 
 
 @elara_bp.route('/elara/getHistoryList', methods=['POST'])
 def get_history_list():
-    """Get list of past chat sessions."""
+    """One page of past chat sessions, newest first; pass nextPageToken back as pageToken for the next."""
     db = _get_db_or_none()
-    user_id = request.json.get('userId')
+    data = request.json or {}
+    user_id = data.get('userId')
+    page_token = data.get('pageToken') or None
+    try:
+        page_size = int(data.get('pageSize') or session_index.SESSION_LIST_PAGE_SIZE)
+    except (TypeError, ValueError):
+        return jsonify({"error": "pageSize must be a number"}), 400
+    if not user_id:
+        return jsonify({"error": "userId is required"}), 400
     try:
         if not db:
-            return jsonify([])
-        sessions_ref = db.collection('user_sessions').where('userId', '==', user_id).order_by('startTime', direction=firestore.Query.DESCENDING).stream()
-        session_list = []
-        for doc in sessions_ref:
-            doc_dict = doc.to_dict()
-            start_time = doc_dict.get('startTime')
-            date_str = ""
-            try:
-                if isinstance(start_time, datetime.datetime):
-                    date_str = start_time.strftime('%b %d, %Y')
-                else:
-                    date_str = "Recent chat"
-            except Exception:
-                date_str = "Recent chat"
-            session_list.append({"id": doc.id, "date": date_str})
-        return jsonify(session_list)
+            return jsonify({"sessions": [], "nextPageToken": None})
+        sessions, next_token = session_index.list_sessions(db, user_id, page_size, page_token)
+        return jsonify({"sessions": sessions, "nextPageToken": next_token})
+    except session_index.InvalidPageToken:
+        return jsonify({"error": "Invalid pageToken"}), 400
     except Exception as e:
-        print(f"Error retrieving history list: {e}")
-        return jsonify([])
+        log.error("Error retrieving history list: %s", e)
+        return jsonify({"sessions": [], "nextPageToken": None})
 
 
 @elara_bp.route('/elara/getSession', methods=['POST'])
@@ -525,5 +673,5 @@ def get_session():
         chat_history = [{"user": doc.to_dict().get('user_message'), "ai": doc.to_dict().get('ai_response')} for doc in history_ref]
         return jsonify(chat_history)
     except Exception as e:
-        print(f"Error retrieving session: {e}")
+        log.error("Error retrieving session: %s", e)
         return jsonify([])
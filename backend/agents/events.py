@@ -0,0 +1,301 @@
+# backend/agents/events.py
+
+# In-process publish/subscribe for state changes between agents. Endpoints
+# publish an event when something changes (a screening completes, a chat turn
+# is stored, feedback arrives, Aegis detects a crisis) and interested modules
+# subscribe to react in near real time instead of rescanning Firestore.
+#
+# publish() only enqueues, so it costs the request nothing measurable. A
+# dispatcher thread appends each event to the durable backend and then calls
+# the subscribers in publish order, except that urgent types (EVENT_PRIORITY)
+# go ahead of any backlog; a failing subscriber is logged and does not affect
+# the others. The default backend is an append-only JSON-lines file
+# (EVENT_LOG_PATH), rotated to <path>.1 once it passes EVENT_LOG_MAX_BYTES,
+# which can be replayed with read_events().
+#
+# Event payloads carry ids and scores, never message text.
+
+import os
+import json
+import time
+import queue
+import atexit
+import itertools
+import logging
+import threading
+from collections import Counter
+from .clients import Lazy
+from . import metrics
+
+log = logging.getLogger(__name__)
+
+# Configuration
+EVENT_LOG = os.getenv("EVENT_LOG", "file").lower()  # "file" or "off"
+EVENT_LOG_PATH = os.getenv("EVENT_LOG_PATH", os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".cache", "events.jsonl"))
+EVENT_LOG_MAX_BYTES = int(os.getenv("EVENT_LOG_MAX_BYTES", str(50 * 1024 * 1024)))
+EVENT_QUEUE_SIZE = int(os.getenv("EVENT_QUEUE_SIZE", "10000"))
+
+# Event types
+SCREENING_COMPLETED = 'ScreeningCompleted'
+CHAT_TURN_STORED = 'ChatTurnStored'
+FEEDBACK_RECEIVED = 'FeedbackReceived'
+CRISIS_DETECTED = 'CrisisDetected'
+EVENT_TYPES = (SCREENING_COMPLETED, CHAT_TURN_STORED, FEEDBACK_RECEIVED, CRISIS_DETECTED)
+
+# Dispatch order across queued events, lowest first; unlisted types are 1
+EVENT_PRIORITY = {CRISIS_DETECTED: 0}
+
+ALL_EVENTS = '*'
+
+
+def _priority(event) -> int:
+    return EVENT_PRIORITY.get(event.type, 1)
+
+
+class Event:
+    __slots__ = ('id', 'type', 'ts', 'data')
+
+    def __init__(self, type: str, data: dict, id: str = None, ts: float = None):
+        self.id = id or os.urandom(8).hex()
+        self.type = type
+        self.ts = ts if ts is not None else time.time()
+        self.data = data
+
+    def to_dict(self) -> dict:
+        return {"id": self.id, "type": self.type, "ts": round(self.ts, 6), "data": self.data}
+
+    @classmethod
+    def from_dict(cls, entry: dict) -> 'Event':
+        return cls(entry["type"], entry.get("data") or {}, entry.get("id"), entry.get("ts"))
+
+
+class FileEventLog:
+    """Append-only JSON-lines event log with a single rotated predecessor."""
+
+    def __init__(self, path: str = EVENT_LOG_PATH, max_bytes: int = EVENT_LOG_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._out = None
+
+    def _open(self):
+        if self._out is None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._out = open(self.path, "a", encoding="utf-8")
+        return self._out
+
+    def append(self, events):
+        lines = "".join(json.dumps(e.to_dict(), default=str) + "\n" for e in events)
+        with self._lock:
+            out = self._open()
+            out.write(lines)
+            out.flush()
+            if self.max_bytes and out.tell() >= self.max_bytes:
+                out.close()
+                self._out = None
+                os.replace(self.path, self.path + ".1")
+
+    def read(self, since: float = None, types=None):
+        """Logged events, oldest first, optionally from `since` (epoch seconds) and of `types` only."""
+        with self._lock:
+            if self._out is not None:
+                self._out.flush()
+        for path in (self.path + ".1", self.path):
+            try:
+                f = open(path, encoding="utf-8")
+            except FileNotFoundError:
+                continue
+            with f:
+                for line in f:
+                    try:
+                        event = Event.from_dict(json.loads(line))
+                    except (ValueError, KeyError):
+                        continue
+                    if since is not None and event.ts < since:
+                        continue
+                    if types and event.type not in types:
+                        continue
+                    yield event
+
+    def close(self):
+        with self._lock:
+            if self._out is not None:
+                self._out.close()
+                self._out = None
+
+
+class NullEventLog:
+    """Backend for EVENT_LOG=off: events are dispatched but not kept."""
+
+    def append(self, events):
+        pass
+
+    def read(self, since: float = None, types=None):
+        return iter(())
+
+    def close(self):
+        pass
+
+
+class EventBus:
+    """Subscribers per event type (or ALL_EVENTS), fed by one dispatcher thread."""
+
+    def __init__(self, backend, queue_size: int = EVENT_QUEUE_SIZE):
+        self.backend = backend
+        self._subscribers = {}
+        self._queue = queue.PriorityQueue(maxsize=queue_size)
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self._thread = None
+        self.published = Counter()
+        self.dropped = 0
+        self.handler_errors = 0
+        self.log_errors = 0
+
+    def subscribe(self, event_type: str, handler):
+        """Call handler(event) on the dispatcher thread for each event of that type."""
+        with self._lock:
+            self._subscribers.setdefault(event_type, []).append(handler)
+        return handler
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="event-dispatcher", daemon=True)
+                self._thread.start()
+                atexit.register(self.drain)
+
+    def publish(self, event_type: str, **data) -> Event:
+        event = Event(event_type, data)
+        self._ensure_started()
+        try:
+            self._queue.put_nowait((_priority(event), next(self._seq), event))
+            self.published[event_type] += 1
+        except queue.Full:
+            self.dropped += 1
+            log.warning("Event queue full, dropped %s event", event_type)
+        return event
+
+    def _handlers(self, event_type: str) -> list:
+        with self._lock:
+            return self._subscribers.get(event_type, []) + self._subscribers.get(ALL_EVENTS, [])
+
+    def _urgent_waiting(self) -> bool:
+        with self._queue.mutex:
+            return bool(self._queue.queue) and self._queue.queue[0][0] == 0
+
+    def _log(self, batch):
+        try:
+            self.backend.append(batch)
+        except Exception as e:
+            self.log_errors += 1
+            log.error("Event log append failed for %s events: %s", len(batch), e)
+
+    def _dispatch(self, event):
+        for handler in self._handlers(event.type):
+            try:
+                handler(event)
+            except Exception as e:
+                self.handler_errors += 1
+                log.error("Event handler %s failed on %s: %s",
+                          getattr(handler, '__qualname__', handler), event.type, e)
+        self._queue.task_done()
+
+    def _loop(self):
+        while True:
+            batch = [self._queue.get()[2]]
+            # Everything already queued goes to the log in one write; an urgent
+            # event ends the batch as soon as it is taken
+            while len(batch) < 100 and _priority(batch[-1]) > 0:
+                try:
+                    batch.append(self._queue.get_nowait()[2])
+                except queue.Empty:
+                    break
+            self._log(batch)
+            # Urgent events go first, and one published while the rest of the
+            # batch is being dispatched is taken before the next ordinary event
+            for event in sorted(batch, key=_priority):
+                if _priority(event) > 0:
+                    while self._urgent_waiting():
+                        urgent = self._queue.get_nowait()[2]
+                        self._log([urgent])
+                        self._dispatch(urgent)
+                self._dispatch(event)
+
+    def drain(self, timeout: float = 2.0):
+        """Wait (bounded) for queued events to be logged and dispatched."""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def stats(self) -> dict:
+        with self._lock:
+            subscribers = {t: len(h) for t, h in self._subscribers.items()}
+        return {
+            "backend": type(self.backend).__name__,
+            "published": dict(self.published),
+            "queued": self._queue.qsize(),
+            "dropped": self.dropped,
+            "handler_errors": self.handler_errors,
+            "log_errors": self.log_errors,
+            "subscribers": subscribers,
+        }
+
+
+def _default_backend():
+    return FileEventLog() if EVENT_LOG == "file" else NullEventLog()
+
+
+_bus = Lazy(lambda: EventBus(_default_backend()))
+
+
+def get_bus() -> EventBus:
+    return _bus.get()
+
+
+def set_backend(backend):
+    """Replace the durable backend (anything with append(events), read(since, types) and close())."""
+    bus = _bus.get()
+    old, bus.backend = bus.backend, backend
+    old.close()
+
+
+def publish(event_type: str, **data) -> Event:
+    return _bus.get().publish(event_type, **data)
+
+
+def subscribe(event_type: str, handler=None):
+    """subscribe(type, handler), or @subscribe(type) as a decorator."""
+    if handler is None:
+        return lambda fn: _bus.get().subscribe(event_type, fn)
+    return _bus.get().subscribe(event_type, handler)
+
+
+def read_events(since: float = None, types=None):
+    return _bus.get().backend.read(since, types)
+
+
+def get_event_stats() -> dict:
+    return _bus.get().stats() if _bus.initialized else {"published": {}}
+
+
+def _collect_event_metrics():
+    if not _bus.initialized:
+        return []
+    stats = _bus.get().stats()
+    return [
+        ("events_published_total", "counter", "Events published on the in-process bus",
+         [({"type": t}, n) for t, n in sorted(stats["published"].items())]),
+        ("events_dropped_total", "counter", "Events dropped because the dispatch queue was full",
+         [({}, stats["dropped"])]),
+        ("event_handler_errors_total", "counter", "Event subscriber calls that raised",
+         [({}, stats["handler_errors"])]),
+        ("event_queue_depth", "gauge", "Events waiting to be logged and dispatched",
+         [({}, stats["queued"])]),
+    ]
+
+
+metrics.register_collector(_collect_event_metrics)
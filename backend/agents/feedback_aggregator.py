@@ -0,0 +1,207 @@
+# backend/agents/feedback_aggregator.py
+
+# Session feedback ratings. /session/feedback queues the rating in memory and
+# returns; a background thread flushes each user's queued ratings every few
+# seconds in one transaction that writes the raw feedback_history documents
+# and folds the ratings into a running summary on the user's state document.
+# Readers (Orion, dashboards, /session/feedbackSummary) read that one field
+# instead of scanning feedback_history. Ratings given for a chat session are
+# also counted on the session document.
+#
+# Firestore:
+#   user_states/{userId}.feedback_summary
+#     count, sum, mean, ewma (recent mean), last_rating, last_session_id, updated_at
+#   user_states/{userId}/feedback_history/{auto}   rating, session_id, timestamp
+#   user_sessions/{sessionId}.feedback            count, last_rating
+
+import os
+import time
+import atexit
+import logging
+import threading
+from datetime import datetime, timezone
+from .clients import Lazy, firestore, get_db
+from . import metrics
+
+log = logging.getLogger(__name__)
+
+# Configuration
+FEEDBACK_FLUSH_SECONDS = float(os.getenv("FEEDBACK_FLUSH_SECONDS", "5"))
+# Weight of the newest rating in the exponentially weighted recent mean
+FEEDBACK_EWMA_ALPHA = float(os.getenv("FEEDBACK_EWMA_ALPHA", "0.3"))
+# Ratings written per user per flush; a transaction allows at most 500 writes
+FEEDBACK_MAX_PER_FLUSH = 400
+
+SUMMARY_FIELD = 'feedback_summary'
+
+
+def fold(summary: dict, ratings) -> dict:
+    """summary with (rating, session_id, ts) ratings applied in order."""
+    summary = dict(summary or {})
+    for rating, session_id, _ in ratings:
+        count = summary.get('count', 0) + 1
+        total = summary.get('sum', 0) + rating
+        ewma = summary.get('ewma')
+        summary.update({
+            'count': count,
+            'sum': total,
+            'mean': round(total / count, 4),
+            'ewma': round(rating if ewma is None else FEEDBACK_EWMA_ALPHA * rating + (1 - FEEDBACK_EWMA_ALPHA) * ewma, 4),
+            'last_rating': rating,
+        })
+        if session_id:
+            summary['last_session_id'] = session_id
+    return summary
+
+
+class FeedbackAggregator:
+    """Per-user queued ratings, flushed in one transaction per user."""
+
+    def __init__(self, db_factory, interval: float = FEEDBACK_FLUSH_SECONDS):
+        self.db_factory = db_factory
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._pending = {}  # user_id -> [(rating, session_id, ts)]
+        self._memory = {}   # user_id -> summary, when Firestore is not configured
+        self._thread = None
+        self.added = 0
+        self.flushed = 0
+        self.failed_flushes = 0
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="feedback-aggregator", daemon=True)
+                self._thread.start()
+                atexit.register(self.flush)
+
+    def _loop(self):
+        while True:
+            time.sleep(self.interval)
+            self.flush()
+
+    def add(self, user_id: str, rating: float, session_id: str = None):
+        self._ensure_started()
+        with self._lock:
+            self._pending.setdefault(user_id, []).append((rating, session_id, time.time()))
+            self.added += 1
+
+    def summary(self, user_id: str) -> dict:
+        """The user's stored summary with not-yet-flushed ratings applied."""
+        db = self.db_factory()
+        if db is None:
+            stored = self._memory.get(user_id)
+        else:
+            snap = db.collection('user_states').document(user_id).get(field_paths=[SUMMARY_FIELD])
+            stored = (snap.to_dict() or {}).get(SUMMARY_FIELD) if snap.exists else None
+        with self._lock:
+            pending = list(self._pending.get(user_id, ()))
+        summary = fold(stored, pending)
+        summary.pop('updated_at', None)
+        return summary
+
+    def _apply(self, db, user_id: str, ratings: list):
+        user_ref = db.collection('user_states').document(user_id)
+        history = user_ref.collection('feedback_history')
+
+        sessions = {}
+        for rating, session_id, _ in ratings:
+            if session_id:
+                count, _ = sessions.get(session_id, (0, None))
+                sessions[session_id] = (count + 1, rating)
+
+        @firestore.transactional
+        def _write(transaction):
+            snap = user_ref.get(transaction=transaction)
+            stored = (snap.to_dict() or {}).get(SUMMARY_FIELD) if snap.exists else None
+            # Session ids come from the client: only the user's own existing sessions are linked
+            owned = {}
+            for session_id in sessions:
+                session_ref = db.collection('user_sessions').document(session_id)
+                session = session_ref.get(transaction=transaction)
+                if session.exists and (session.to_dict() or {}).get('userId') == user_id:
+                    owned[session_id] = session_ref
+                else:
+                    log.warning("Feedback from user %s names session %s they do not own", user_id, session_id)
+            linked = [(rating, session_id if session_id in owned else None, ts) for rating, session_id, ts in ratings]
+            for rating, session_id, ts in linked:
+                transaction.set(history.document(), {
+                    "rating": rating,
+                    "session_id": session_id,
+                    "timestamp": datetime.fromtimestamp(ts, tz=timezone.utc),
+                })
+            for session_id, session_ref in owned.items():
+                count, last_rating = sessions[session_id]
+                transaction.set(session_ref, {
+                    "feedback": {"count": firestore.Increment(count), "last_rating": last_rating}
+                }, merge=True)
+            summary = fold(stored, linked)
+            summary['updated_at'] = firestore.SERVER_TIMESTAMP
+            transaction.set(user_ref, {SUMMARY_FIELD: summary}, merge=True)
+
+        _write(db.transaction())
+
+    def flush(self) -> int:
+        """Write queued ratings; a user whose transaction fails is re-queued ahead of newer ratings."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        db = self.db_factory()
+
+        written = 0
+        for user_id, ratings in pending.items():
+            batch, rest = ratings[:FEEDBACK_MAX_PER_FLUSH], ratings[FEEDBACK_MAX_PER_FLUSH:]
+            try:
+                if db is None:
+                    with self._lock:
+                        self._memory[user_id] = fold(self._memory.get(user_id), batch)
+                else:
+                    self._apply(db, user_id, batch)
+                written += len(batch)
+            except Exception as e:
+                log.error("Error flushing feedback for user %s: %s", user_id, e)
+                self.failed_flushes += 1
+                rest = ratings
+            if rest:
+                with self._lock:
+                    self._pending[user_id] = rest + self._pending.get(user_id, [])
+        self.flushed += written
+        return written
+
+    def stats(self) -> dict:
+        with self._lock:
+            pending = sum(len(r) for r in self._pending.values())
+        return {
+            "pending_ratings": pending,
+            "ratings_added": self.added,
+            "ratings_flushed": self.flushed,
+            "failed_flushes": self.failed_flushes,
+            "flush_interval_seconds": self.interval,
+        }
+
+
+_aggregator = Lazy(lambda: FeedbackAggregator(get_db))
+
+
+def get_feedback_aggregator() -> FeedbackAggregator:
+    return _aggregator.get()
+
+
+def _collect_feedback_metrics():
+    if not _aggregator.initialized:
+        return []
+    stats = _aggregator.get().stats()
+    return [
+        ("feedback_pending_ratings", "gauge", "Feedback ratings queued for the next flush",
+         [({}, stats["pending_ratings"])]),
+        ("feedback_ratings_total", "counter", "Feedback ratings received",
+         [({}, stats["ratings_added"])]),
+        ("feedback_ratings_flushed_total", "counter", "Feedback ratings written to Firestore",
+         [({}, stats["ratings_flushed"])]),
+    ]
+
+
+metrics.register_collector(_collect_feedback_metrics)
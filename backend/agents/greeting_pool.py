@@ -0,0 +1,148 @@
+# backend/agents/greeting_pool.py
+
+# Pre-generated Elara greetings. Metrics are bucketed into low/moderate/high
+# per dimension (27 buckets); each bucket holds a few model-written variants,
+# persisted to disk, and a greeting request samples one of them. The model is
+# only called for a bucket whose pool is empty, after which the rest of the
+# pool is filled in the background.
+#
+# Pre-generate every bucket with:  python -m agents.greeting_pool
+
+import os
+import random
+import logging
+import threading
+from .cache import TTLCache
+from .clients import BACKEND_DIR, Lazy
+from . import metrics
+
+log = logging.getLogger(__name__)
+
+# Configuration
+GREETING_POOL_SIZE = int(os.getenv("ELARA_GREETING_POOL_SIZE", "5"))
+GREETING_POOL_TTL = 7 * 24 * 3600
+GREETING_POOL_PATH = os.getenv("ELARA_GREETING_POOL_PATH", os.path.join(BACKEND_DIR, ".cache", "greeting_pool.json"))
+
+METRIC_NAMES = ("depression", "anxiety", "stress")
+BUCKET_LABELS = ("low", "moderate", "high")
+# Upper bounds (inclusive) of the low and moderate buckets on the 0-100 scale
+BUCKET_BOUNDS = (33, 66)
+
+_pool = Lazy(lambda: TTLCache(max_size=64, ttl_seconds=GREETING_POOL_TTL, persist_path=GREETING_POOL_PATH))
+metrics.register_cache("greeting_pool", lambda: _pool.get() if _pool.initialized else None)
+_pool_lock = threading.Lock()
+_filling = set()
+_filling_lock = threading.Lock()
+
+
+def _label(score) -> str:
+    try:
+        score = float(score)
+    except (TypeError, ValueError):
+        score = 50
+    for bound, label in zip(BUCKET_BOUNDS, BUCKET_LABELS):
+        if score <= bound:
+            return label
+    return BUCKET_LABELS[-1]
+
+
+def metric_bucket(metrics: dict) -> str:
+    """Bucket key such as 'depression=high,anxiety=low,stress=moderate'."""
+    metrics = metrics or {}
+    return ",".join(f"{name}={_label(metrics.get(name, 50))}" for name in METRIC_NAMES)
+
+
+def all_buckets() -> list:
+    return [
+        ",".join(f"{name}={label}" for name, label in zip(METRIC_NAMES, labels))
+        for labels in ((d, a, s) for d in BUCKET_LABELS for a in BUCKET_LABELS for s in BUCKET_LABELS)
+    ]
+
+
+def greeting_prompt(bucket: str) -> str:
+    levels = bucket.replace(",", "\n").replace("=", ": ")
+    return f"""
+<role>You are Elara, a caring AI companion starting a conversation.</role>
+<instructions>
+Based on the user's long-term mental health metrics (low, moderate or high), generate a SINGLE, short, natural, and welcoming opening message.
+- If depression is high, be gentle and reassuring.
+- If anxiety is high, be calm and grounding.
+- If stress is high, be supportive and acknowledge their pressure.
+- DO NOT mention the scores. Be human.
+</instructions>
+<user_metrics>
+{levels}
+</user_metrics>
+Your welcoming message:
+"""
+
+
+def sample_greeting(bucket: str):
+    """A random pooled greeting for the bucket, or None if its pool is empty."""
+    variants = _pool.get().get(bucket)
+    return random.choice(variants) if variants else None
+
+
+def add_greeting(bucket: str, text: str) -> int:
+    """Add a variant to the bucket's pool; returns the pool size."""
+    pool = _pool.get()
+    with _pool_lock:
+        variants = list(pool.get(bucket) or [])
+        if text and text not in variants and len(variants) < GREETING_POOL_SIZE:
+            variants.append(text)
+            pool.set(bucket, variants)
+    return len(variants)
+
+
+def fill_pool(bucket: str, generate, size: int = GREETING_POOL_SIZE):
+    """Call generate(prompt) -> text until the bucket holds `size` variants (duplicates retried a few times)."""
+    attempts = 0
+    prompt = greeting_prompt(bucket)
+    while len(_pool.get().get(bucket) or []) < size and attempts < 2 * size:
+        attempts += 1
+        try:
+            add_greeting(bucket, generate(prompt))
+        except Exception as e:
+            log.warning("Error generating greeting for bucket %s: %s", bucket, e)
+            return
+
+
+def _fill_in_background(bucket: str, generate):
+    try:
+        fill_pool(bucket, generate)
+    finally:
+        with _filling_lock:
+            _filling.discard(bucket)
+
+
+def schedule_fill(bucket: str, generate) -> bool:
+    """Top up the bucket's pool on a background thread unless a fill is already running."""
+    with _filling_lock:
+        if bucket in _filling:
+            return False
+        _filling.add(bucket)
+    threading.Thread(target=_fill_in_background, args=(bucket, generate), daemon=True).start()
+    return True
+
+
+def get_pool_stats() -> dict:
+    pool = _pool.get()
+    return {
+        "buckets_filled": len(pool),
+        "buckets_total": len(BUCKET_LABELS) ** len(METRIC_NAMES),
+        "pool": pool.stats(),
+    }
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    from .clients import get_watsonx_model
+    from .elara_agent import generate_greeting_text
+
+    load_dotenv()
+    model = get_watsonx_model()
+    if model is None:
+        raise SystemExit("Watsonx model unavailable; set WATSONX_API_KEY and WATSONX_PROJECT_ID")
+    for bucket in all_buckets():
+        fill_pool(bucket, lambda prompt: generate_greeting_text(model, prompt))
+        print(f"{bucket}: {len(_pool.get().get(bucket) or [])} variants")
@@ -0,0 +1,111 @@
+# backend/agents/http_client.py
+
+# Shared keep-alive HTTP client for outbound fetches (Vero web lookups).
+# One pooled requests.Session per process, a hard per-host connection limit,
+# and deadline budgeting so a lookup never outlives its total time budget.
+
+import os
+import time
+import threading
+from urllib.parse import urlsplit
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeoutError
+from .clients import Lazy
+from . import tracing
+
+# Configuration
+HTTP_POOL_HOSTS = int(os.getenv("VERO_HTTP_POOL_HOSTS", "8"))
+HTTP_MAX_PER_HOST = int(os.getenv("VERO_HTTP_MAX_PER_HOST", "4"))
+HTTP_FETCH_TIMEOUT = float(os.getenv("VERO_HTTP_FETCH_TIMEOUT", "8"))
+HTTP_MAX_WORKERS = int(os.getenv("VERO_HTTP_MAX_WORKERS", "8"))
+USER_AGENT = "Mozilla/5.0"
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+class Deadline:
+    """Total time budget shared by every fetch in one lookup."""
+
+    def __init__(self, seconds: float):
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def timeout(self, cap: float = HTTP_FETCH_TIMEOUT) -> float:
+        """Per-request timeout: the smaller of cap and what is left of the budget."""
+        remaining = self.remaining()
+        if remaining <= 0:
+            raise DeadlineExceeded()
+        return min(cap, remaining)
+
+
+def _build_session():
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=HTTP_POOL_HOSTS, pool_maxsize=HTTP_MAX_PER_HOST, max_retries=0)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers.update({"User-Agent": USER_AGENT})
+    return session
+
+
+_session = Lazy(_build_session)
+_executor = Lazy(lambda: ThreadPoolExecutor(max_workers=HTTP_MAX_WORKERS, thread_name_prefix="vero-http"))
+
+_host_slots = {}
+_host_slots_lock = threading.Lock()
+
+
+def _host_slot(url: str) -> threading.BoundedSemaphore:
+    host = urlsplit(url).netloc.lower()
+    with _host_slots_lock:
+        slot = _host_slots.get(host)
+        if slot is None:
+            slot = _host_slots[host] = threading.BoundedSemaphore(HTTP_MAX_PER_HOST)
+        return slot
+
+
+def get(url: str, deadline: Deadline, **kwargs):
+    """GET through the shared session, waiting for a host slot no longer than the deadline allows."""
+    slot = _host_slot(url)
+    with tracing.span("http.get", host=urlsplit(url).netloc) as span:
+        if not slot.acquire(timeout=deadline.timeout()):
+            raise DeadlineExceeded()
+        try:
+            response = _session.get().get(url, timeout=deadline.timeout(), **kwargs)
+        finally:
+            slot.release()
+        span.set(status=response.status_code)
+        return response
+
+
+def first_result(tasks, deadline: Deadline):
+    """
+    Run the callables concurrently and return the first non-None result, or
+    None when all fail or the deadline passes. Losers finish in the background
+    and are bounded by the same deadline.
+    """
+    futures = [_executor.get().submit(tracing.wrap(task)) for task in tasks]
+    try:
+        for future in as_completed(futures, timeout=deadline.remaining()):
+            try:
+                result = future.result()
+            except Exception:
+                continue
+            if result is not None:
+                for other in futures:
+                    other.cancel()
+                return result
+    except FuturesTimeoutError:
+        pass
+    for future in futures:
+        future.cancel()
+    return None
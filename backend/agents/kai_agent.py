@@ -1,12 +1,18 @@
 # backend/agents/kai_agent.py
 
 from flask import Blueprint, request, jsonify, Response
-from firebase_admin import firestore
+from .clients import firestore, get_db
+from . import metrics_history
+from .metrics_accumulator import get_accumulator
+from . import events
+from . import session_index
 import json
+import logging
 from datetime import datetime, timedelta
 from .agent_data import BASE_QUESTIONS, AGE_SPECIFIC_QUESTIONS, RESPONSE_OPTIONS
 
 kai_bp = Blueprint('kai_agent', __name__)
+log = logging.getLogger(__name__)
 
 def assess_user_metrics(scores):
     """
@@ -115,7 +121,7 @@ def can_take_screening(db, user_id):
             return True
             
     except Exception as e:
-        print(f"Error checking screening eligibility for user {user_id}: {e}")
+        log.error("Error checking screening eligibility for user %s: %s", user_id, e)
         return True  # Allow screening if there's an error
 
 def get_questions_for_user(age, orion_insights=None):
@@ -134,7 +140,7 @@ def get_questions_for_user(age, orion_insights=None):
         questions.extend(AGE_SPECIFIC_QUESTIONS.get(age_group, []))
         
     if orion_insights:
-        print(f"Orion insights found: {orion_insights}. Tailoring Kai questions.")
+        log.debug("Orion insights found: %s. Tailoring Kai questions.", orion_insights)
         if 'social_anxiety' in orion_insights:
             questions.append({"id": "orion_q1", "text": "Lately, how often have you felt worried about what other people think of you?"})
         if 'low_self_worth' in orion_insights:
@@ -144,7 +150,7 @@ def get_questions_for_user(age, orion_insights=None):
 
 @kai_bp.route('/kai/screening', methods=['POST'])
 def handle_screening():
-    db = firestore.client()
+    db = get_db()
     data = request.json
     user_id, user_age = data.get('userId'), data.get('userAge')
     if not user_id or not user_age: 
@@ -187,31 +193,35 @@ def handle_screening():
             final_scores = screening_session_data.to_dict().get('scores', {}) if screening_session_data.exists else {}
             
             new_metrics = assess_user_metrics(final_scores)
+            # Before the write, so chat nudges taken against the old scores are dropped
+            get_accumulator().reset(user_id, new_metrics)
             
             user_state_ref.set({
                 "metrics": new_metrics,
+                # Other workers drop chat nudges queued before this
+                "metrics_reset_at": firestore.SERVER_TIMESTAMP,
                 "last_screening_timestamp": firestore.SERVER_TIMESTAMP,
                 "last_updated": firestore.SERVER_TIMESTAMP,
                 "orion_insights": firestore.DELETE_FIELD
             }, merge=True)
 
-            print(f"Kai assessed and updated user {user_id} metrics: {new_metrics}")
+            log.debug("Kai assessed and updated user %s metrics: %s", user_id, new_metrics)
+            try:
+                metrics_history.record(db, user_id, new_metrics)
+            except Exception as e:
+                log.error("Error recording metrics history for user %s: %s", user_id, e)
+            events.publish(events.SCREENING_COMPLETED, user_id=user_id, metrics=new_metrics)
             
             try:
-                new_session_ref = db.collection('user_sessions').document()
-                new_session_ref.set({
-                    "userId": user_id,
-                    "startTime": firestore.SERVER_TIMESTAMP
-                })
-                session_id = new_session_ref.id
+                session_id = session_index.create_session(db, user_id)
             except Exception as e:
-                print(f"Error creating session: {e}")
+                log.error("Error creating session: %s", e)
                 session_id = "mock_session_id"
 
             try:
                 screening_session_ref.delete()
             except Exception as e:
-                print(f"Error deleting screening session: {e}")
+                log.error("Error deleting screening session: %s", e)
             
             response_data = {
                 "message": "Thank you for completing your check-in. Let's start a new chat with Elara.",
@@ -230,12 +240,12 @@ def handle_screening():
         return Response(response=json.dumps(response_data), status=200, mimetype='application/json')
     
     except Exception as e:
-        print(f"Error in Kai screening: {e}")
+        log.error("Error in Kai screening: %s", e)
         return jsonify({"error": "An error occurred during screening"}), 500
 
 @kai_bp.route('/kai/checkScreeningEligibility', methods=['POST'])
 def check_screening_eligibility():
-    db = firestore.client()
+    db = get_db()
     data = request.json
     user_id = data.get('userId')
     
@@ -274,5 +284,5 @@ def check_screening_eligibility():
             })
             
     except Exception as e:
-        print(f"Error checking screening eligibility: {e}")
+        log.error("Error checking screening eligibility: %s", e)
         return jsonify({"error": "An error occurred while checking eligibility"}), 500
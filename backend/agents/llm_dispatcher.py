@@ -0,0 +1,138 @@
+# backend/agents/llm_dispatcher.py
+
+# Micro-batching for model calls. Prompts submitted within a short window
+# (or until the batch is full) go to the backend as one list-of-prompts
+# generate call, and each waiting request gets its own result back.
+# The backend is any callable taking a list of prompts and returning a list
+# of responses in the same order, so the mock backend works the same way.
+
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from .http_client import Deadline, DeadlineExceeded
+
+# Configuration
+BATCH_WINDOW_MS = float(os.getenv("LLM_BATCH_WINDOW_MS", "15"))
+BATCH_MAX_PROMPTS = int(os.getenv("LLM_BATCH_MAX_PROMPTS", "8"))
+# Batches sent to the backend at the same time
+BATCH_MAX_IN_FLIGHT = int(os.getenv("LLM_BATCH_MAX_IN_FLIGHT", "4"))
+
+
+class _Pending:
+    def __init__(self, prompt: str, deadline: Deadline):
+        self.prompt = prompt
+        self.deadline = deadline
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+    def resolve(self, result=None, error=None):
+        self.result = result
+        self.error = error
+        self.done.set()
+
+
+class BatchDispatcher:
+    """
+    Collects prompts for up to `window_ms` after the first one arrives (or
+    until `max_batch` are waiting) and sends them as one backend call.
+    Requests whose deadline passes while queued are dropped from the batch.
+    """
+
+    def __init__(self, backend, window_ms: float = BATCH_WINDOW_MS, max_batch: int = BATCH_MAX_PROMPTS,
+                 max_in_flight: int = BATCH_MAX_IN_FLIGHT):
+        self.backend = backend
+        self.window = window_ms / 1000.0
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="llm-batch")
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._collector = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.batches = 0
+        self.prompts = 0
+        self.expired = 0
+        self.failed_batches = 0
+
+    def _ensure_started(self):
+        if self._collector is not None:
+            return
+        with self._start_lock:
+            if self._collector is None:
+                self._collector = threading.Thread(target=self._collect_loop, name="llm-batch-collector", daemon=True)
+                self._collector.start()
+
+    def _collect_loop(self):
+        while True:
+            first = self._queue.get()
+            batch = [first]
+            window = Deadline(self.window)
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get(timeout=window.remaining()))
+                except queue.Empty:
+                    break
+            # Wait for a free slot so a slow backend applies back-pressure instead of piling up threads
+            self._slots.acquire()
+            self._executor.submit(self._run_batch, batch)
+
+    def _run_batch(self, batch):
+        try:
+            live = []
+            for item in batch:
+                if item.deadline.expired:
+                    item.resolve(error=DeadlineExceeded())
+                else:
+                    live.append(item)
+            with self._stats_lock:
+                self.expired += len(batch) - len(live)
+                if live:
+                    self.batches += 1
+                    self.prompts += len(live)
+            if not live:
+                return
+
+            try:
+                results = self.backend([item.prompt for item in live])
+                if not isinstance(results, list):
+                    results = [results]
+                if len(results) != len(live):
+                    raise ValueError(f"backend returned {len(results)} results for {len(live)} prompts")
+            except Exception as e:
+                with self._stats_lock:
+                    self.failed_batches += 1
+                for item in live:
+                    item.resolve(error=e)
+                return
+            for item, result in zip(live, results):
+                item.resolve(result=result)
+        finally:
+            self._slots.release()
+
+    def generate(self, prompt: str, deadline: Deadline):
+        """Backend response for prompt; raises DeadlineExceeded if it is not ready in time."""
+        if deadline.expired:
+            raise DeadlineExceeded()
+        self._ensure_started()
+        item = _Pending(prompt, deadline)
+        self._queue.put(item)
+        if not item.done.wait(deadline.remaining()):
+            raise DeadlineExceeded()
+        if item.error is not None:
+            raise item.error
+        return item.result
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            batches, prompts = self.batches, self.prompts
+            return {
+                "batches": batches,
+                "prompts": prompts,
+                "avg_batch_size": round(prompts / batches, 2) if batches else 0,
+                "expired": self.expired,
+                "failed_batches": self.failed_batches,
+                "queued": self._queue.qsize(),
+            }
+
@@ -0,0 +1,170 @@
+# backend/agents/logging_utils.py
+
+# Logging setup for the backend. Modules log through logging.getLogger(__name__);
+# configure_logging() routes every record through a bounded queue to a single
+# background writer, so request and worker threads never block on stdout.
+#
+#   LOG_LEVEL   default level (INFO). Per-request and per-user detail is DEBUG.
+#   LOG_LEVELS  per-logger overrides, e.g. "agents.auth_agent=DEBUG,werkzeug=INFO"
+#   LOG_FORMAT  "json" (one object per line) or "text"
+#
+# High-volume call sites can pass extra=sampled(N) to emit only every Nth record.
+
+import os
+import sys
+import copy
+import json
+import time
+import queue
+import atexit
+import logging
+import threading
+from logging.handlers import QueueHandler, QueueListener
+from . import metrics
+from .tracing import current_trace_id
+
+# Configuration
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_LEVELS = os.getenv("LOG_LEVELS", "")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+# The dev server logs a line per request at INFO
+DEFAULT_LEVELS = {"werkzeug": "WARNING"}
+
+# Attributes every LogRecord has; anything else came in through `extra`
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "sample_every"}
+
+_listener = None
+_configure_lock = threading.Lock()
+
+
+def sampled(every: int) -> dict:
+    """extra= for a log call that should only be emitted once per `every` calls from that line."""
+    return {"sample_every": every}
+
+
+class SamplingFilter(logging.Filter):
+    """Drops all but every Nth record from call sites that asked for sampling."""
+
+    def __init__(self):
+        super().__init__()
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record) -> bool:
+        every = getattr(record, 'sample_every', 1)
+        if every <= 1:
+            return True
+        site = (record.pathname, record.lineno)
+        with self._lock:
+            count = self._counts.get(site, 0)
+            self._counts[site] = count + 1
+        if count % every:
+            return False
+        record.sampled_one_in = every
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record) -> str:
+        entry = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class _DroppingQueueHandler(QueueHandler):
+    """Never blocks the caller: when the writer falls behind, records are dropped and counted."""
+
+    dropped = 0
+
+    def prepare(self, record):
+        # Interpolate now, on the caller's thread, since args may be mutated later; JSON encoding happens on the writer
+        record = copy.copy(record)
+        record.msg = record.message = record.getMessage()
+        record.args = None
+        trace_id = current_trace_id()
+        if trace_id:
+            record.trace_id = trace_id
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _DroppingQueueHandler.dropped += 1
+
+
+def _parse_levels(spec: str) -> dict:
+    levels = dict(DEFAULT_LEVELS)
+    for item in spec.split(","):
+        name, _, level = item.partition("=")
+        if name.strip() and level.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def configure_logging():
+    """Install the queue handler on the root logger and start the writer thread (idempotent)."""
+    global _listener
+    with _configure_lock:
+        if _listener is not None:
+            return
+        writer = logging.StreamHandler(sys.stdout)
+        if LOG_FORMAT == "json":
+            writer.setFormatter(JsonFormatter())
+        else:
+            writer.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+
+        records = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+        handler = _DroppingQueueHandler(records)
+        handler.addFilter(SamplingFilter())
+
+        root = logging.getLogger()
+        for existing in list(root.handlers):
+            root.removeHandler(existing)
+        root.addHandler(handler)
+        root.setLevel(LOG_LEVEL)
+        for name, level in _parse_levels(LOG_LEVELS).items():
+            logging.getLogger(name).setLevel(level)
+
+        _listener = QueueListener(records, writer, respect_handler_level=True)
+        _listener.start()
+        atexit.register(_listener.stop)
+
+
+def _after_fork():
+    # The writer thread does not survive a fork (gunicorn --preload); the
+    # child's next configure_logging() call starts a fresh queue and writer
+    global _listener, _configure_lock
+    _listener = None
+    _configure_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_after_fork)
+
+
+def dropped_records() -> int:
+    return _DroppingQueueHandler.dropped
+
+
+def _collect_logging_metrics():
+    return [("log_records_dropped_total", "counter", "Log records dropped because the writer fell behind",
+             [({}, dropped_records())])]
+
+
+metrics.register_collector(_collect_logging_metrics)
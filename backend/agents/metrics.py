@@ -0,0 +1,436 @@
+# backend/agents/metrics.py
+
+# Process metrics in Prometheus text format at /metrics.
+#
+# Counters and histograms are sharded per thread: a request thread only ever
+# writes its own dict, so recording takes no lock. Scrapes sum the shards and
+# fold those of finished threads into a retired total. With METRICS_ENABLED=false
+# the factories hand out no-op instruments and nothing is wrapped or hooked.
+
+import os
+import hmac
+import logging
+import time
+import threading
+from bisect import bisect_left
+from flask import Blueprint, Response, request, abort
+from . import tracing
+
+# Configuration
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() != "false"
+# When set, /metrics requires "Authorization: Bearer <token>"
+METRICS_TOKEN = os.getenv("METRICS_TOKEN")
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+LLM_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 20.0, 30.0, 60.0)
+RUN_BUCKETS = (1.0, 5.0, 15.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0)
+
+metrics_bp = Blueprint('metrics', __name__)
+log = logging.getLogger(__name__)
+
+_registry = []
+_collectors = []
+_registry_lock = threading.Lock()
+
+
+class _ThreadShards:
+    """One dict per writer thread; `merge(total, shard)` folds a shard into a total."""
+
+    def __init__(self, merge):
+        self._merge = merge
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._live = []
+        self._retired = {}
+
+    def mine(self) -> dict:
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = {}
+            with self._lock:
+                self._live.append((threading.current_thread(), shard))
+        return shard
+
+    def collect(self) -> dict:
+        with self._lock:
+            live = []
+            for thread, shard in self._live:
+                if thread.is_alive():
+                    live.append((thread, shard))
+                else:
+                    # A finished thread writes no more, so its shard can be folded in place
+                    self._merge(self._retired, shard)
+            self._live = live
+            total = {}
+            self._merge(total, self._retired)
+        for _, shard in live:
+            # dict.copy() is atomic under the GIL, so the owner may keep writing meanwhile
+            self._merge(total, shard.copy())
+        return total
+
+
+def _merge_counts(total: dict, shard: dict):
+    for key, value in shard.items():
+        total[key] = total.get(key, 0) + value
+
+
+def _merge_rows(total: dict, shard: dict):
+    for key, row in shard.items():
+        current = total.get(key)
+        if current is None:
+            total[key] = list(row)
+        else:
+            for i, value in enumerate(row):
+                current[i] += value
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name: str, help_text: str, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._shards = _ThreadShards(_merge_counts)
+
+    def inc(self, *labels, value=1):
+        shard = self._shards.mine()
+        shard[labels] = shard.get(labels, 0) + value
+
+    def samples(self):
+        for labels, value in self._shards.collect().items():
+            yield self.name, dict(zip(self.labelnames, labels)), value
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name: str, help_text: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._shards = _ThreadShards(_merge_rows)
+
+    def observe(self, value: float, *labels):
+        shard = self._shards.mine()
+        row = shard.get(labels)
+        if row is None:
+            # one slot per bucket, +Inf, then the running sum
+            row = shard[labels] = [0] * (len(self.buckets) + 2)
+        row[bisect_left(self.buckets, value)] += 1
+        row[-1] += value
+
+    def samples(self):
+        for labels, row in self._shards.collect().items():
+            base = dict(zip(self.labelnames, labels))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), row):
+                cumulative += count
+                yield f"{self.name}_bucket", {**base, "le": _format_value(bound)}, cumulative
+            yield f"{self.name}_count", base, cumulative
+            yield f"{self.name}_sum", base, row[-1]
+
+
+class _NullInstrument:
+    def inc(self, *labels, value=1):
+        pass
+
+    def observe(self, value, *labels):
+        pass
+
+
+_NULL = _NullInstrument()
+
+
+def _register(instrument):
+    with _registry_lock:
+        _registry.append(instrument)
+    return instrument
+
+
+def counter(name: str, help_text: str, labelnames=()):
+    return _register(Counter(name, help_text, labelnames)) if METRICS_ENABLED else _NULL
+
+
+def histogram(name: str, help_text: str, labelnames=(), buckets=DEFAULT_BUCKETS):
+    return _register(Histogram(name, help_text, labelnames, buckets)) if METRICS_ENABLED else _NULL
+
+
+def register_collector(fn):
+    """fn() -> iterable of (name, kind, help, [(labels dict, value)]) evaluated at scrape time."""
+    if METRICS_ENABLED:
+        with _registry_lock:
+            _collectors.append(fn)
+
+
+def register_cache(name: str, cache_getter):
+    """Expose a TTLCache's stats(); cache_getter() returns the cache or None if not built yet."""
+    def collect():
+        cache = cache_getter()
+        if cache is None:
+            return []
+        stats = cache.stats()
+        labels = {"cache": name}
+        return [
+            ("cache_hits_total", "counter", "Fresh and stale cache hits", [(labels, stats["hits"] + stats["stale_hits"])]),
+            ("cache_misses_total", "counter", "Cache misses", [(labels, stats["misses"])]),
+            ("cache_evictions_total", "counter", "LRU evictions", [(labels, stats["evictions"])]),
+            ("cache_hit_ratio", "gauge", "Hits over lookups since start", [(labels, stats["hit_ratio"])]),
+            ("cache_entries", "gauge", "Entries held", [(labels, stats["size"])]),
+        ]
+    register_collector(collect)
+
+
+# Instruments shared across agents
+http_request_duration = histogram(
+    "http_request_duration_seconds", "Request latency per blueprint route", ("blueprint", "route", "method", "status"))
+firestore_ops = counter(
+    "firestore_operations_total", "Firestore document reads and writes per collection", ("collection", "op"))
+llm_request_duration = histogram(
+    "llm_request_duration_seconds", "Watsonx generate() latency", ("outcome",), LLM_BUCKETS)
+llm_tokens = counter("llm_tokens_total", "Prompt and generated tokens", ("kind",))
+aegis_trigger_hits = counter("aegis_trigger_hits_total", "Messages routed to Aegis", ("kind",))
+crisis_escalation_lag = histogram(
+    "crisis_escalation_lag_seconds", "Time from crisis detection to the user's risk state being updated", ("outcome",))
+orion_run_duration = histogram(
+    "orion_run_duration_seconds", "Duration of scheduled Orion analysis runs", ("outcome",), RUN_BUCKETS)
+
+
+def _format_value(value) -> str:
+    if value == float('inf'):
+        return "+Inf"
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_sample(name: str, labels: dict, value) -> str:
+    if labels:
+        rendered = ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+        return f"{name}{{{rendered}}} {_format_value(value)}"
+    return f"{name} {_format_value(value)}"
+
+
+def render() -> str:
+    """All metrics in Prometheus text exposition format."""
+    with _registry_lock:
+        instruments, collectors = list(_registry), list(_collectors)
+    lines = []
+    for instrument in instruments:
+        lines.append(f"# HELP {instrument.name} {instrument.help}")
+        lines.append(f"# TYPE {instrument.name} {instrument.kind}")
+        lines.extend(_format_sample(name, labels, value) for name, labels, value in instrument.samples())
+
+    families = {}
+    for collect in collectors:
+        try:
+            for name, kind, help_text, samples in collect():
+                family = families.setdefault(name, (kind, help_text, []))
+                family[2].extend(samples)
+        except Exception as e:
+            log.error("Metrics collector error: %s", e)
+    for name, (kind, help_text, samples) in families.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        lines.extend(_format_sample(name, labels, value) for labels, value in samples)
+    return "\n".join(lines) + "\n"
+
+
+# Flask request timing
+
+def init_app(app):
+    """Time every request by blueprint and route."""
+    if not METRICS_ENABLED:
+        return
+
+    @app.before_request
+    def _start_timer():
+        request.environ['metrics.start'] = time.perf_counter()
+
+    @app.after_request
+    def _record_request(response):
+        started = request.environ.get('metrics.start')
+        if started is not None:
+            rule = request.url_rule.rule if request.url_rule is not None else "unmatched"
+            http_request_duration.observe(
+                time.perf_counter() - started,
+                request.blueprint or "app", rule, request.method, str(response.status_code))
+        return response
+
+
+@metrics_bp.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    if not METRICS_ENABLED:
+        abort(404)
+    if METRICS_TOKEN:
+        provided = request.headers.get('Authorization', '')
+        if not hmac.compare_digest(provided, f"Bearer {METRICS_TOKEN}"):
+            abort(403)
+    return Response(render(), mimetype="text/plain; version=0.0.4")
+
+
+# Watsonx model instrumentation
+
+def _result_tokens(response):
+    """(input, generated) token counts reported by Watsonx, summed over a batch."""
+    responses = response if isinstance(response, list) else [response]
+    input_tokens = generated_tokens = 0
+    for item in responses:
+        for result in (item or {}).get('results', []):
+            input_tokens += result.get('input_token_count', 0) or 0
+            generated_tokens += result.get('generated_token_count', 0) or 0
+    return input_tokens, generated_tokens
+
+
+class InstrumentedModel:
+    """Model proxy recording generate() latency and token counts, traced as llm.generate."""
+
+    def __init__(self, model):
+        self._model = model
+
+    def generate(self, *args, **kwargs):
+        prompt = kwargs.get('prompt', args[0] if args else None)
+        span = tracing.start_span("llm.generate", prompts=len(prompt) if isinstance(prompt, list) else 1)
+        started = time.perf_counter()
+        try:
+            response = self._model.generate(*args, **kwargs)
+        except Exception as e:
+            llm_request_duration.observe(time.perf_counter() - started, "error")
+            span.end(e)
+            raise
+        llm_request_duration.observe(time.perf_counter() - started, "ok")
+        input_tokens, generated_tokens = _result_tokens(response)
+        llm_tokens.inc("prompt", value=input_tokens)
+        llm_tokens.inc("generated", value=generated_tokens)
+        span.set(input_tokens=input_tokens, generated_tokens=generated_tokens)
+        span.end()
+        return response
+
+    def __getattr__(self, name):
+        return getattr(self._model, name)
+
+
+def instrument_model(model):
+    instrumented = METRICS_ENABLED or tracing.TRACING_ENABLED
+    return InstrumentedModel(model) if instrumented and model is not None else model
+
+
+# Firestore instrumentation: proxies count document reads and writes by collection
+# and trace each call as a firestore.<op> span
+
+
+def _traced_call(op: str, collection: str, fn, *args, **kwargs):
+    span = tracing.start_span(f"firestore.{op}", collection=collection)
+    try:
+        result = fn(*args, **kwargs)
+    except Exception as e:
+        span.end(e)
+        raise
+    span.end()
+    return result
+
+
+class _FirestoreProxy:
+    __slots__ = ('_target', '_collection')
+
+    def __init__(self, target, collection: str = None):
+        self._target = target
+        self._collection = collection
+
+    def __getattr__(self, name):
+        return getattr(self._target, name)
+
+
+class _QueryProxy(_FirestoreProxy):
+    __slots__ = ()
+
+    def _chain(self, name, *args, **kwargs):
+        return _QueryProxy(getattr(self._target, name)(*args, **kwargs), self._collection)
+
+    def where(self, *args, **kwargs):
+        return self._chain('where', *args, **kwargs)
+
+    def order_by(self, *args, **kwargs):
+        return self._chain('order_by', *args, **kwargs)
+
+    def limit(self, *args, **kwargs):
+        return self._chain('limit', *args, **kwargs)
+
+    def select(self, *args, **kwargs):
+        return self._chain('select', *args, **kwargs)
+
+    def offset(self, *args, **kwargs):
+        return self._chain('offset', *args, **kwargs)
+
+    def start_after(self, *args, **kwargs):
+        return self._chain('start_after', *args, **kwargs)
+
+    def stream(self, *args, **kwargs):
+        span = tracing.start_span("firestore.stream", collection=self._collection)
+        count = 0
+        try:
+            for doc in self._target.stream(*args, **kwargs):
+                firestore_ops.inc(self._collection, "read")
+                count += 1
+                yield doc
+        finally:
+            span.set(docs=count)
+            span.end()
+
+    def get(self, *args, **kwargs):
+        docs = _traced_call("query", self._collection, self._target.get, *args, **kwargs)
+        firestore_ops.inc(self._collection, "read", value=len(docs))
+        return docs
+
+
+class _CollectionProxy(_QueryProxy):
+    __slots__ = ()
+
+    def document(self, *args, **kwargs):
+        return _DocumentProxy(self._target.document(*args, **kwargs), self._collection)
+
+    def add(self, *args, **kwargs):
+        firestore_ops.inc(self._collection, "write")
+        return _traced_call("add", self._collection, self._target.add, *args, **kwargs)
+
+
+class _DocumentProxy(_FirestoreProxy):
+    __slots__ = ()
+
+    def collection(self, name):
+        return _CollectionProxy(self._target.collection(name), name)
+
+    def get(self, *args, **kwargs):
+        firestore_ops.inc(self._collection, "read")
+        return _traced_call("get", self._collection, self._target.get, *args, **kwargs)
+
+    def _write(self, name, *args, **kwargs):
+        firestore_ops.inc(self._collection, "write")
+        return _traced_call(name, self._collection, getattr(self._target, name), *args, **kwargs)
+
+    def set(self, *args, **kwargs):
+        return self._write('set', *args, **kwargs)
+
+    def update(self, *args, **kwargs):
+        return self._write('update', *args, **kwargs)
+
+    def create(self, *args, **kwargs):
+        return self._write('create', *args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        return self._write('delete', *args, **kwargs)
+
+
+class _ClientProxy(_FirestoreProxy):
+    __slots__ = ()
+
+    def collection(self, *path):
+        return _CollectionProxy(self._target.collection(*path), path[-1].rsplit('/', 1)[-1])
+
+
+def instrument_firestore(db):
+    instrumented = METRICS_ENABLED or tracing.TRACING_ENABLED
+    return _ClientProxy(db) if instrumented and db is not None else db
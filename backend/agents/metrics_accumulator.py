@@ -0,0 +1,266 @@
+# backend/agents/metrics_accumulator.py
+
+# Coalesces Elara's per-turn metric nudges. Chat turns add their deltas to an
+# in-memory per-user total; a background thread flushes each user's total
+# every few seconds as one transactional read-clamp-write of
+# user_states/{id}.metrics. A busy user costs one transaction per interval
+# instead of a read and a write per turn, and concurrent turns can no longer
+# overwrite each other's update.
+#
+# The flush is a transaction rather than an Increment transform because the
+# scores must stay within 0-100: Increment cannot clamp, so -2 applied to a
+# score of 1 would store -1.
+#
+# A Kai screening sets the scores outright, stamps metrics_reset_at and
+# resets the user here first. Deltas a flush has already taken are tagged
+# with that flush's generation and dropped if this process reset the user
+# after they were taken. A screening handled by another worker is seen
+# through metrics_reset_at: the transaction drops deltas queued before it,
+# and so does the next re-read of the user's metrics. Remembered metrics
+# expire after one flush interval, so replies re-read them at least that often.
+#
+# Firestore: user_states/{userId}.metrics, .metrics_reset_at
+
+import os
+import time
+import atexit
+import logging
+import threading
+from datetime import datetime
+from .clients import Lazy, firestore, get_db
+from .cache import TTLCache
+from . import metrics
+from . import metrics_history
+
+log = logging.getLogger(__name__)
+
+# Configuration
+METRICS_FLUSH_SECONDS = float(os.getenv("ELARA_METRICS_FLUSH_SECONDS", "10"))
+# Users whose last stored metrics are remembered for projecting replies; kept
+# short because a screening on another worker only shows up on a re-read
+KNOWN_METRICS_SIZE = 10000
+KNOWN_METRICS_TTL = float(os.getenv("ELARA_KNOWN_METRICS_TTL", str(METRICS_FLUSH_SECONDS)))
+
+ADJUSTED_METRICS = ("anxiety", "depression", "stress")
+DEFAULT_LEVEL = 50
+DEFAULT_METRICS = {name: DEFAULT_LEVEL for name in ADJUSTED_METRICS}
+
+
+def _clamp(value) -> int:
+    return max(0, min(100, int(value)))
+
+
+def _reset_time(state: dict):
+    """Epoch seconds of the user's last screening reset, or None."""
+    reset_at = (state or {}).get('metrics_reset_at')
+    return reset_at.timestamp() if isinstance(reset_at, datetime) else None
+
+
+class MetricsAccumulator:
+    """Per-user pending deltas plus the last stored metrics seen for each user."""
+
+    def __init__(self, db_factory, interval: float = METRICS_FLUSH_SECONDS):
+        self.db_factory = db_factory
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._pending = {}  # user_id -> {metric: delta}
+        self._queued_at = {}  # user_id -> time the oldest pending delta was queued
+        self._known = TTLCache(max_size=KNOWN_METRICS_SIZE, ttl_seconds=KNOWN_METRICS_TTL)
+        self._generation = 0
+        self._reset_at = {}  # user_id -> generation, for resets during the current flush
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self.added = 0
+        self.flushed_users = 0
+        self.failed_flushes = 0
+        self.dropped_stale = 0
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="metrics-accumulator", daemon=True)
+                self._thread.start()
+                atexit.register(self.flush)
+
+    def _loop(self):
+        while True:
+            time.sleep(self.interval)
+            self.flush()
+
+    def _projected_locked(self, user_id: str, base: dict):
+        pending = self._pending.get(user_id)
+        if base is None or not pending:
+            return dict(base) if base is not None else None
+        projected = dict(base)
+        for name, delta in pending.items():
+            projected[name] = _clamp(projected.get(name, DEFAULT_LEVEL) + delta)
+        return projected
+
+    def add(self, user_id: str, delta: dict):
+        """
+        Queue a delta for the user (an empty one queues nothing); returns their
+        metrics with every pending delta applied, or None if this process has
+        not seen their stored metrics yet.
+        """
+        if delta:
+            self._ensure_started()
+        with self._lock:
+            if delta:
+                pending = self._pending.setdefault(user_id, {})
+                self._queued_at.setdefault(user_id, time.time())
+                for name, value in delta.items():
+                    pending[name] = pending.get(name, 0) + value
+                self.added += 1
+            return self._projected_locked(user_id, self._known.get(user_id))
+
+    def projected(self, user_id: str, stored: dict) -> dict:
+        """Stored metrics read from Firestore with any not-yet-flushed deltas applied."""
+        with self._lock:
+            self._known.set(user_id, dict(stored))
+            return self._projected_locked(user_id, stored)
+
+    def load_projected(self, db, user_id: str) -> dict:
+        """
+        Stored metrics (defaults for a user without any) with pending deltas
+        applied; deltas queued before a screening on another worker are dropped.
+        """
+        snap = db.collection('user_states').document(user_id).get()
+        state = (snap.to_dict() or {}) if snap.exists else {}
+        reset_at = _reset_time(state)
+        with self._lock:
+            if reset_at is not None and self._queued_at.get(user_id, reset_at) < reset_at:
+                self._pending.pop(user_id, None)
+                self._queued_at.pop(user_id, None)
+                self.dropped_stale += 1
+        return self.projected(user_id, state.get('metrics') or DEFAULT_METRICS)
+
+    def reset(self, user_id: str, metrics: dict):
+        """
+        Metrics are about to be set outright (a Kai screening): drop deltas
+        queued against the old values, including any a flush has already taken.
+        """
+        with self._lock:
+            self._pending.pop(user_id, None)
+            self._queued_at.pop(user_id, None)
+            self._reset_at[user_id] = self._generation
+            self._known.set(user_id, dict(metrics))
+
+    def _stale(self, user_id: str, generation: int) -> bool:
+        with self._lock:
+            return self._reset_at.get(user_id, -1) >= generation
+
+    def _apply(self, db, user_id: str, delta: dict, generation: int, queued_at: float):
+        ref = db.collection('user_states').document(user_id)
+
+        @firestore.transactional
+        def _read_clamp_write(transaction):
+            snap = ref.get(transaction=transaction)
+            state = (snap.to_dict() or {}) if snap.exists else {}
+            # Checked inside the transaction: a screening written after this read
+            # makes the commit fail and the retry sees its metrics_reset_at
+            reset_at = _reset_time(state)
+            if self._stale(user_id, generation) or (reset_at is not None and queued_at < reset_at):
+                return None
+            current = dict(state.get('metrics') or {})
+            for name in ADJUSTED_METRICS:
+                current.setdefault(name, DEFAULT_LEVEL)
+            for name, value in delta.items():
+                current[name] = _clamp(current[name] + value)
+            transaction.set(ref, {'metrics': current, 'last_updated': firestore.SERVER_TIMESTAMP}, merge=True)
+            return current
+
+        return _read_clamp_write(db.transaction())
+
+    def flush(self) -> int:
+        """Write every pending delta; failed users are re-queued for the next flush."""
+        with self._flush_lock:
+            return self._flush()
+
+    def _flush(self) -> int:
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            queued_at, self._queued_at = self._queued_at, {}
+            self._generation += 1
+            generation = self._generation
+            # Flushes are serialized, so only resets from here on can make these deltas stale
+            self._reset_at = {}
+        if not pending:
+            return 0
+        db = self.db_factory()
+        if db is None:
+            return 0
+
+        written = 0
+        for user_id, delta in pending.items():
+            if not any(delta.values()):
+                continue
+            try:
+                stored = self._apply(db, user_id, delta, generation, queued_at.get(user_id, time.time()))
+            except Exception as e:
+                log.error("Error flushing metrics for user %s: %s", user_id, e)
+                self.failed_flushes += 1
+                with self._lock:
+                    if self._reset_at.get(user_id, -1) < generation:
+                        merged = self._pending.setdefault(user_id, {})
+                        for name, value in delta.items():
+                            merged[name] = merged.get(name, 0) + value
+                        self._queued_at[user_id] = min(self._queued_at.get(user_id, time.time()),
+                                                       queued_at.get(user_id, time.time()))
+                continue
+            if stored is None:
+                self.dropped_stale += 1
+                # Replies re-read the screening's scores instead of the remembered ones
+                self._known.invalidate(user_id)
+                continue
+            with self._lock:
+                if self._reset_at.get(user_id, -1) < generation:
+                    self._known.set(user_id, stored)
+            written += 1
+            try:
+                metrics_history.record(db, user_id, stored)
+            except Exception as e:
+                log.error("Error recording metrics history for user %s: %s", user_id, e)
+        self.flushed_users += written
+        return written
+
+    def stats(self) -> dict:
+        with self._lock:
+            pending_users = len(self._pending)
+        return {
+            "pending_users": pending_users,
+            "deltas_added": self.added,
+            "users_flushed": self.flushed_users,
+            "failed_flushes": self.failed_flushes,
+            "stale_deltas_dropped": self.dropped_stale,
+            "flush_interval_seconds": self.interval,
+        }
+
+
+_accumulator = Lazy(lambda: MetricsAccumulator(get_db))
+
+
+def get_accumulator() -> MetricsAccumulator:
+    return _accumulator.get()
+
+
+def get_accumulator_stats() -> dict:
+    return _accumulator.get().stats() if _accumulator.initialized else {"pending_users": 0}
+
+
+def _collect_accumulator_metrics():
+    if not _accumulator.initialized:
+        return []
+    stats = _accumulator.get().stats()
+    return [
+        ("metrics_accumulator_pending_users", "gauge", "Users with unflushed metric deltas",
+         [({}, stats["pending_users"])]),
+        ("metrics_accumulator_deltas_total", "counter", "Chat turns that queued a metric delta",
+         [({}, stats["deltas_added"])]),
+        ("metrics_accumulator_flushed_users_total", "counter", "Per-user flush transactions committed",
+         [({}, stats["users_flushed"])]),
+    ]
+
+
+metrics.register_collector(_collect_accumulator_metrics)
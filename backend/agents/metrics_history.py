@@ -0,0 +1,205 @@
+# backend/agents/metrics_history.py
+
+# Append-only history of each user's depression/anxiety/stress scores.
+#
+# A point is one fixed-width 64-bit integer: UTC epoch seconds in the high
+# bits and the three 0-100 scores in one byte each, so a day of points is a
+# flat integer array. Points are bucketed per user and UTC day; each day
+# bucket also carries hourly and daily rollups (count and per-metric sums),
+# kept up to date with Increment transforms so a write never reads first.
+# Range reads touch only the day buckets in the range, and hourly/daily reads
+# leave the raw points out of the projection.
+#
+# Firestore: user_states/{userId}/metrics_history/{YYYYMMDD}
+#   day, points[], count, sum_<metric>, hours.{HH}.count, hours.{HH}.sum_<metric>, last
+
+import time
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timezone, timedelta
+from .clients import firestore
+
+HISTORY_METRICS = ("depression", "anxiety", "stress")
+HISTORY_COLLECTION = 'metrics_history'
+RESOLUTIONS = ("raw", "hour", "day")
+# Longest range one read may cover
+MAX_RANGE_DAYS = 366
+
+_SCORE_BITS = 8
+_TS_SHIFT = _SCORE_BITS * len(HISTORY_METRICS)
+_SCORE_MASK = (1 << _SCORE_BITS) - 1
+
+# In-memory fallback when Firestore is not configured: {user_id: ([day, ...] sorted, {day: _DayBucket})}
+_mem_series = {}
+_mem_lock = threading.Lock()
+
+
+def encode_point(ts: int, metrics: dict) -> int:
+    value = int(ts)
+    for name in HISTORY_METRICS:
+        value = (value << _SCORE_BITS) | max(0, min(100, int(metrics.get(name, 0) or 0)))
+    return value
+
+
+def decode_point(value: int):
+    """(epoch seconds, {metric: score})"""
+    scores = {}
+    for i, name in enumerate(reversed(HISTORY_METRICS)):
+        scores[name] = (value >> (i * _SCORE_BITS)) & _SCORE_MASK
+    return value >> _TS_SHIFT, scores
+
+
+def day_key(ts: float) -> int:
+    d = datetime.fromtimestamp(ts, tz=timezone.utc)
+    return d.year * 10000 + d.month * 100 + d.day
+
+
+def _day_start(day: int) -> float:
+    return datetime(day // 10000, day // 100 % 100, day % 100, tzinfo=timezone.utc).timestamp()
+
+
+def _iso(ts: float) -> str:
+    return datetime.fromtimestamp(ts, tz=timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+class _DayBucket:
+    """One user-day in memory: raw points plus hourly rollups as [count, sum per metric]."""
+
+    __slots__ = ('points', 'hours')
+
+    def __init__(self):
+        self.points = array('Q')
+        self.hours = {}
+
+    def add(self, point: int, hour: int, scores: dict):
+        self.points.append(point)
+        rollup = self.hours.setdefault(hour, [0] + [0] * len(HISTORY_METRICS))
+        rollup[0] += 1
+        for i, name in enumerate(HISTORY_METRICS):
+            rollup[i + 1] += scores[name]
+
+    def to_doc(self, day: int) -> dict:
+        """Same shape as the Firestore bucket document."""
+        doc = {"day": day, "points": list(self.points), "count": 0, "hours": {}}
+        for name in HISTORY_METRICS:
+            doc[f"sum_{name}"] = 0
+        for hour, rollup in self.hours.items():
+            entry = {"count": rollup[0]}
+            doc["count"] += rollup[0]
+            for i, name in enumerate(HISTORY_METRICS):
+                entry[f"sum_{name}"] = rollup[i + 1]
+                doc[f"sum_{name}"] += rollup[i + 1]
+            doc["hours"][f"{hour:02d}"] = entry
+        return doc
+
+
+def record(db, user_id: str, metrics: dict, ts: float = None):
+    """Append the user's current scores to their history."""
+    if not user_id or not metrics:
+        return
+    ts = int(ts if ts is not None else time.time())
+    point = encode_point(ts, metrics)
+    _, scores = decode_point(point)
+    day = day_key(ts)
+    hour = datetime.fromtimestamp(ts, tz=timezone.utc).hour
+
+    if db is None:
+        with _mem_lock:
+            days, buckets = _mem_series.setdefault(user_id, ([], {}))
+            bucket = buckets.get(day)
+            if bucket is None:
+                bucket = buckets[day] = _DayBucket()
+                days.insert(bisect_left(days, day), day)
+            bucket.add(point, hour, scores)
+        return
+
+    hourly = {"count": firestore.Increment(1)}
+    update = {
+        "day": day,
+        "points": firestore.ArrayUnion([point]),
+        "count": firestore.Increment(1),
+        "hours": {f"{hour:02d}": hourly},
+        "last": point,
+    }
+    for name in HISTORY_METRICS:
+        hourly[f"sum_{name}"] = firestore.Increment(scores[name])
+        update[f"sum_{name}"] = firestore.Increment(scores[name])
+    db.collection('user_states').document(user_id).collection(HISTORY_COLLECTION).document(str(day)).set(
+        update, merge=True)
+
+
+def _read_buckets(db, user_id: str, first_day: int, last_day: int, with_points: bool) -> list:
+    if db is None:
+        with _mem_lock:
+            days, buckets = _mem_series.get(user_id, ([], {}))
+            lo, hi = bisect_left(days, first_day), bisect_right(days, last_day)
+            return [buckets[day].to_doc(day) for day in days[lo:hi]]
+
+    fields = ["day", "count", "hours"] + [f"sum_{name}" for name in HISTORY_METRICS]
+    if with_points:
+        fields.append("points")
+    query = (db.collection('user_states').document(user_id).collection(HISTORY_COLLECTION)
+             .where('day', '>=', first_day).where('day', '<=', last_day)
+             .order_by('day').select(fields))
+    return [doc.to_dict() for doc in query.stream()]
+
+
+def _averaged(ts: float, rollup: dict) -> dict:
+    count = rollup.get("count", 0) or 0
+    point = {"timestamp": _iso(ts), "count": count}
+    for name in HISTORY_METRICS:
+        point[name] = round(rollup.get(f"sum_{name}", 0) / count, 1) if count else None
+    return point
+
+
+def query_history(db, user_id: str, start: float, end: float, resolution: str = "day") -> list:
+    """
+    Points between start and end (epoch seconds, inclusive), oldest first.
+    "raw" returns every recorded point; "hour" and "day" return the mean of
+    each bucket with its count (buckets are included whole).
+    """
+    if resolution not in RESOLUTIONS:
+        raise ValueError(f"resolution must be one of {', '.join(RESOLUTIONS)}")
+    if end < start:
+        raise ValueError("end must not be before start")
+    if end - start > MAX_RANGE_DAYS * 86400:
+        raise ValueError(f"range is limited to {MAX_RANGE_DAYS} days")
+
+    docs = _read_buckets(db, user_id, day_key(start), day_key(end), resolution == "raw")
+    points = []
+    for doc in docs:
+        day_start = _day_start(doc["day"])
+        if resolution == "day":
+            points.append(_averaged(day_start, doc))
+        elif resolution == "hour":
+            for hour, rollup in sorted((doc.get("hours") or {}).items()):
+                hour_start = day_start + int(hour) * 3600
+                if hour_start + 3600 > start and hour_start <= end:
+                    points.append(_averaged(hour_start, rollup))
+        else:
+            for value in sorted(doc.get("points") or []):
+                ts, scores = decode_point(value)
+                if start <= ts <= end:
+                    points.append({"timestamp": _iso(ts), **scores})
+    return points
+
+
+def daily_trend(db, user_id: str, days: int = 14, recent_days: int = 3):
+    """
+    Change of each metric's mean over the last `recent_days` days against the
+    days before it, or None without enough history.
+    """
+    end = time.time()
+    daily = query_history(db, user_id, end - (days - 1) * 86400, end, "day")
+    cutoff = (datetime.now(timezone.utc) - timedelta(days=recent_days - 1)).strftime('%Y-%m-%d')
+    recent = [p for p in daily if p["timestamp"][:10] >= cutoff and p["count"]]
+    earlier = [p for p in daily if p["timestamp"][:10] < cutoff and p["count"]]
+    if not recent or not earlier:
+        return None
+
+    def mean(points, name):
+        total = sum(p[name] * p["count"] for p in points)
+        return total / sum(p["count"] for p in points)
+
+    return {name: round(mean(recent, name) - mean(earlier, name), 1) for name in HISTORY_METRICS}
@@ -0,0 +1,434 @@
+# backend/agents/orion_scheduler.py
+
+import os
+import json
+import time
+import uuid
+import logging
+import random
+import socket
+import tempfile
+import threading
+from datetime import datetime, timedelta, timezone
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    try:
+        import msvcrt
+    except ImportError:
+        msvcrt = None
+
+from . import metrics
+
+log = logging.getLogger(__name__)
+
+# Configuration
+ORION_SCHEDULE = os.getenv("ORION_SCHEDULE", "@hourly")
+ORION_JITTER_SECONDS = int(os.getenv("ORION_JITTER_SECONDS", "60"))
+ORION_INITIAL_DELAY_SECONDS = int(os.getenv("ORION_INITIAL_DELAY_SECONDS", "15"))
+ORION_LEASE_SECONDS = int(os.getenv("ORION_LEASE_SECONDS", "120"))
+ORION_LOCK_FILE = os.getenv("ORION_LOCK_FILE", os.path.join(tempfile.gettempdir(), "aura_orion_scheduler.lock"))
+
+LEASE_COLLECTION = 'system_leases'
+LEASE_DOCUMENT = 'orion_scheduler'
+
+# Upper bound when collapsing a long backlog of missed slots into one catch-up run
+MAX_CATCHUP_SLOTS = 10000
+
+CRON_ALIASES = {
+    "@hourly": "0 * * * *",
+    "@daily": "0 0 * * *",
+    "@midnight": "0 0 * * *",
+    "@weekly": "0 0 * * 0",
+    "@monthly": "0 0 1 * *",
+}
+
+
+def _utcnow():
+    return datetime.now(timezone.utc)
+
+
+def _to_epoch(dt):
+    return dt.timestamp() if dt else None
+
+
+def _from_epoch(ts):
+    return datetime.fromtimestamp(ts, tz=timezone.utc) if ts is not None else None
+
+
+class CronSchedule:
+    """Minimal five-field cron expression (minute hour day month weekday), evaluated in UTC."""
+
+    _FIELD_RANGES = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 7)]
+
+    def __init__(self, expression: str):
+        self.expression = expression
+        fields = CRON_ALIASES.get(expression.strip(), expression).split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron expression must have 5 fields: {expression!r}")
+        parsed = [self._parse_field(f, lo, hi) for f, (lo, hi) in zip(fields, self._FIELD_RANGES)]
+        self.minutes, self.hours, self.days, self.months, weekdays = parsed
+        # Cron allows both 0 and 7 for Sunday
+        self.weekdays = {0 if d == 7 else d for d in weekdays}
+        self._dom_restricted = fields[2] != '*'
+        self._dow_restricted = fields[4] != '*'
+
+    @staticmethod
+    def _parse_field(field: str, lo: int, hi: int) -> set:
+        values = set()
+        for part in field.split(','):
+            step = 1
+            if '/' in part:
+                part, step_str = part.split('/', 1)
+                step = int(step_str)
+                if step <= 0:
+                    raise ValueError(f"Invalid cron step: {field!r}")
+            if part == '*':
+                start, end = lo, hi
+            elif '-' in part:
+                start, end = (int(x) for x in part.split('-', 1))
+            else:
+                start = end = int(part)
+                if step != 1:
+                    end = hi
+            if start < lo or end > hi or start > end:
+                raise ValueError(f"Cron field out of range: {field!r}")
+            values.update(range(start, end + 1, step))
+        return values
+
+    def _day_matches(self, dt) -> bool:
+        dom_ok = dt.day in self.days
+        dow_ok = ((dt.weekday() + 1) % 7) in self.weekdays
+        if self._dom_restricted and self._dow_restricted:
+            return dom_ok or dow_ok
+        if self._dom_restricted:
+            return dom_ok
+        if self._dow_restricted:
+            return dow_ok
+        return True
+
+    def next_after(self, dt):
+        """Return the first scheduled minute strictly after dt."""
+        t = dt.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = t + timedelta(days=366 * 5)
+        while t < limit:
+            if t.month not in self.months:
+                year, month = (t.year + 1, 1) if t.month == 12 else (t.year, t.month + 1)
+                t = t.replace(year=year, month=month, day=1, hour=0, minute=0)
+            elif not self._day_matches(t):
+                t = (t + timedelta(days=1)).replace(hour=0, minute=0)
+            elif t.hour not in self.hours:
+                t = (t + timedelta(hours=1)).replace(minute=0)
+            elif t.minute not in self.minutes:
+                t += timedelta(minutes=1)
+            else:
+                return t
+        raise ValueError(f"Cron expression never fires: {self.expression!r}")
+
+
+class FirestoreLease:
+    """Leader lease stored in a Firestore document, shared by every node using the project."""
+
+    backend = 'firestore'
+
+    def __init__(self, db, holder_id: str, ttl_seconds: int = ORION_LEASE_SECONDS):
+        self.db = db
+        self.holder_id = holder_id
+        self.ttl_seconds = ttl_seconds
+        self.ref = db.collection(LEASE_COLLECTION).document(LEASE_DOCUMENT)
+
+    def try_acquire(self) -> bool:
+        from firebase_admin import firestore
+
+        @firestore.transactional
+        def _acquire(transaction):
+            snap = self.ref.get(transaction=transaction)
+            data = snap.to_dict() if snap.exists else {}
+            now = time.time()
+            holder = data.get('holder')
+            if holder and holder != self.holder_id and (data.get('expires_at') or 0) > now:
+                return False
+            transaction.set(self.ref, {'holder': self.holder_id, 'expires_at': now + self.ttl_seconds}, merge=True)
+            return True
+
+        return _acquire(self.db.transaction())
+
+    def claim_slot(self, slot_ts: float) -> bool:
+        """Atomically record slot_ts as taken; False if this node lost the lease or the slot was already run."""
+        from firebase_admin import firestore
+
+        @firestore.transactional
+        def _claim(transaction):
+            snap = self.ref.get(transaction=transaction)
+            data = snap.to_dict() if snap.exists else {}
+            if data.get('holder') != self.holder_id:
+                return False
+            if (data.get('last_slot') or 0) >= slot_ts:
+                return False
+            transaction.set(self.ref, {'last_slot': slot_ts, 'last_run_started_at': time.time()}, merge=True)
+            return True
+
+        return _claim(self.db.transaction())
+
+    def read_state(self) -> dict:
+        snap = self.ref.get()
+        return snap.to_dict() if snap.exists else {}
+
+    def write_state(self, values: dict):
+        self.ref.set(values, merge=True)
+
+    def release(self):
+        try:
+            if self.read_state().get('holder') == self.holder_id:
+                self.ref.set({'expires_at': 0}, merge=True)
+        except Exception:
+            pass
+
+
+class FileLease:
+    """Leader lease held as an OS file lock; covers every worker process on one machine."""
+
+    backend = 'file'
+
+    def __init__(self, path: str = ORION_LOCK_FILE):
+        self.path = path
+        self.state_path = path + '.json'
+        self._fh = None
+
+    def try_acquire(self) -> bool:
+        if self._fh is not None:
+            return True
+        fh = open(self.path, 'a+')
+        try:
+            if fcntl is not None:
+                fcntl.flock(fh.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            elif msvcrt is not None:
+                fh.seek(0)
+                msvcrt.locking(fh.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            fh.close()
+            return False
+        self._fh = fh
+        return True
+
+    def claim_slot(self, slot_ts: float) -> bool:
+        if self._fh is None or (self.read_state().get('last_slot') or 0) >= slot_ts:
+            return False
+        self.write_state({'last_slot': slot_ts, 'last_run_started_at': time.time()})
+        return True
+
+    def read_state(self) -> dict:
+        try:
+            with open(self.state_path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def write_state(self, values: dict):
+        state = self.read_state()
+        state.update(values)
+        tmp_path = self.state_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.state_path)
+
+    def release(self):
+        if self._fh is not None:
+            try:
+                self._fh.close()
+            finally:
+                self._fh = None
+
+
+class OrionScheduler:
+    """
+    Runs a job on a cron schedule on exactly one node. Every worker starts a
+    scheduler; only the lease holder runs the job, and each scheduled slot is
+    claimed before it runs so a lease handover never repeats an interval.
+    Slots missed while no leader was alive are collapsed into one catch-up run.
+    """
+
+    def __init__(self, job, lease_factory, schedule: str = ORION_SCHEDULE,
+                 jitter_seconds: int = ORION_JITTER_SECONDS,
+                 initial_delay_seconds: int = ORION_INITIAL_DELAY_SECONDS,
+                 lease_seconds: int = ORION_LEASE_SECONDS):
+        self.job = job
+        self.lease_factory = lease_factory
+        self.schedule = CronSchedule(schedule)
+        self.jitter_seconds = max(0, jitter_seconds)
+        self.initial_delay_seconds = initial_delay_seconds
+        self.lease_seconds = lease_seconds
+        self.node_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+        self._lease = None
+        self._is_leader = False
+        self._pending_slot = None
+        self._run_at = None
+        self._running = False
+        self._runs_completed = 0
+        self._last_error = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name='orion-scheduler', daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._lease is not None:
+            self._lease.release()
+
+    def _get_lease(self):
+        if self._lease is None:
+            self._lease = self.lease_factory(self.node_id)
+        return self._lease
+
+    def _due_slot(self, state: dict, now):
+        """Latest scheduled slot <= now that has not been run yet, or None."""
+        last_slot = _from_epoch(state.get('last_slot'))
+        if last_slot is None:
+            # Never run anywhere: run once on startup, as the old worker did
+            return now.replace(second=0, microsecond=0)
+        slot = self.schedule.next_after(last_slot)
+        if slot > now:
+            return None
+        for _ in range(MAX_CATCHUP_SLOTS):
+            following = self.schedule.next_after(slot)
+            if following > now:
+                break
+            slot = following
+        return slot
+
+    def _tick(self):
+        now = _utcnow()
+        lease = self._get_lease()
+        self._is_leader = lease.try_acquire()
+        if not self._is_leader:
+            self._pending_slot = self._run_at = None
+            return
+
+        if self._pending_slot is None:
+            slot = self._due_slot(lease.read_state(), now)
+            if slot is None:
+                return
+            self._pending_slot = slot
+            if (now - slot).total_seconds() > self.jitter_seconds:
+                # Catch-up for a slot missed while no leader was alive: run now
+                self._run_at = now
+            else:
+                self._run_at = slot + timedelta(seconds=random.uniform(0, self.jitter_seconds))
+
+        if now < self._run_at:
+            return
+
+        slot, self._pending_slot, self._run_at = self._pending_slot, None, None
+        if not lease.claim_slot(_to_epoch(slot)):
+            return
+
+        self._running = True
+        started = time.time()
+        error = None
+        try:
+            self.job()
+        except Exception as e:
+            error = str(e)
+            log.error("Orion scheduled run failed: %s", e)
+        finally:
+            self._running = False
+        metrics.orion_run_duration.observe(time.time() - started, "error" if error else "ok")
+        self._last_error = error
+        self._runs_completed += 1
+        try:
+            lease.write_state({
+                'last_run_at': started,
+                'last_duration_seconds': round(time.time() - started, 3),
+                'last_error': error,
+                'last_run_node': self.node_id,
+            })
+        except Exception as e:
+            log.error("Could not record Orion run state: %s", e)
+
+    def _sleep_seconds(self) -> float:
+        heartbeat = max(1.0, self.lease_seconds / 3.0)
+        if self._run_at is not None:
+            return max(0.5, min(heartbeat, (self._run_at - _utcnow()).total_seconds()))
+        return heartbeat
+
+    def _loop(self):
+        if self._stop.wait(self.initial_delay_seconds):
+            return
+        while not self._stop.is_set():
+            try:
+                self._tick()
+            except Exception as e:
+                log.error("Orion scheduler error: %s", e)
+            self._stop.wait(self._sleep_seconds())
+
+    def status(self) -> dict:
+        """Snapshot of scheduler and shared lease state for the admin endpoint."""
+        lease = self._lease
+        state = {}
+        if lease is not None:
+            try:
+                state = lease.read_state()
+            except Exception as e:
+                state = {'error': str(e)}
+        last_slot = _from_epoch(state.get('last_slot'))
+        next_slot = self.schedule.next_after(last_slot or _utcnow())
+
+        def _iso(ts):
+            dt = _from_epoch(ts)
+            return dt.isoformat() if dt else None
+
+        return {
+            'node_id': self.node_id,
+            'backend': lease.backend if lease is not None else None,
+            'is_leader': self._is_leader,
+            'leader': state.get('holder') or (self.node_id if self._is_leader else None),
+            'lease_expires_at': _iso(state.get('expires_at')),
+            'schedule': self.schedule.expression,
+            'jitter_seconds': self.jitter_seconds,
+            'running': self._running,
+            'pending_slot': self._pending_slot.isoformat() if self._pending_slot else None,
+            'pending_run_at': self._run_at.isoformat() if self._run_at else None,
+            'last_slot': last_slot.isoformat() if last_slot else None,
+            'last_run_at': _iso(state.get('last_run_at')),
+            'last_run_node': state.get('last_run_node'),
+            'last_duration_seconds': state.get('last_duration_seconds'),
+            'last_error': state.get('last_error', self._last_error),
+            'next_slot': next_slot.isoformat(),
+            'runs_completed_on_this_node': self._runs_completed,
+        }
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def start_orion_scheduler(job, db_factory):
+    """
+    Start the process-wide Orion scheduler. Uses a Firestore lease when a
+    database is available, otherwise a local file lock.
+    """
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is not None:
+            return _scheduler
+
+        def lease_factory(node_id):
+            db = db_factory()
+            if db is not None:
+                return FirestoreLease(db, node_id)
+            return FileLease()
+
+        _scheduler = OrionScheduler(job, lease_factory).start()
+        return _scheduler
+
+
+def get_orion_scheduler():
+    return _scheduler
@@ -0,0 +1,188 @@
+# backend/agents/profiler.py
+
+# Statistical wall-clock profiler for production use. A background thread
+# reads every thread's current stack via sys._current_frames() at a fixed
+# interval and counts identical stacks; nothing is installed in the profiled
+# threads, so overhead is one stack walk per thread per sample. Output is in
+# collapsed-stack format ("thread;outer;...;inner count"), which flamegraph.pl,
+# speedscope and most flamegraph viewers read directly.
+
+import os
+import sys
+import time
+import threading
+from collections import Counter, deque
+
+# Configuration
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+# Single requests are short, so they are sampled more often
+PROFILE_REQUEST_INTERVAL_MS = float(os.getenv("PROFILE_REQUEST_INTERVAL_MS", "1"))
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "60"))
+PROFILE_MAX_DEPTH = 64
+# Request profiles kept for /admin/profile/requests/<id>
+PROFILE_RECENT_REQUESTS = int(os.getenv("PROFILE_RECENT_REQUESTS", "20"))
+PROFILE_MAX_REQUEST_SAMPLERS = 4
+
+_labels = {}
+
+
+def _label(code) -> str:
+    label = _labels.get(code)
+    if label is None:
+        label = _labels[code] = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+    return label
+
+
+class Profile:
+    """Stack counts from one sampling run."""
+
+    def __init__(self, stacks: Counter, samples: int, duration: float, interval: float):
+        self.stacks = stacks
+        self.samples = samples
+        self.duration = duration
+        self.interval = interval
+
+    def collapsed(self) -> str:
+        return "".join(f"{';'.join(stack)} {count}\n" for stack, count in self.stacks.most_common())
+
+    def top_functions(self, n: int = 20) -> list:
+        """Functions by share of samples on top of the stack (self) and anywhere on it (total)."""
+        own, total = Counter(), Counter()
+        for stack, count in self.stacks.items():
+            frames = stack[1:]
+            if not frames:
+                continue
+            own[frames[-1]] += count
+            for frame in set(frames):
+                total[frame] += count
+        observed = sum(self.stacks.values()) or 1
+        ranked = sorted(total, key=lambda fn: (own[fn], total[fn]), reverse=True)[:n]
+        return [{"function": fn, "self_pct": round(100 * own[fn] / observed, 2),
+                 "total_pct": round(100 * total[fn] / observed, 2)}
+                for fn in ranked]
+
+    def to_dict(self) -> dict:
+        threads = Counter()
+        for stack, count in self.stacks.items():
+            threads[stack[0]] += count
+        return {
+            "samples": self.samples,
+            "duration_seconds": round(self.duration, 3),
+            "interval_ms": round(self.interval * 1000, 3),
+            "threads": dict(threads.most_common()),
+            "top": self.top_functions(),
+            "stacks": self.collapsed().splitlines(),
+        }
+
+
+class Sampler:
+    """
+    Samples the stacks of all threads (or only `thread_ids`, or threads whose
+    name contains `thread_filter`) every `interval` seconds until stop().
+    """
+
+    def __init__(self, interval: float = PROFILE_INTERVAL_MS / 1000, thread_ids=None, thread_filter: str = None):
+        self.interval = interval
+        self.thread_ids = set(thread_ids) if thread_ids else None
+        self.thread_filter = thread_filter
+        self.exclude = set()
+        self._stacks = Counter()
+        self._samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+        self._started = 0.0
+
+    def _sample(self):
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident in self.exclude or (self.thread_ids is not None and ident not in self.thread_ids):
+                continue
+            name = names.get(ident, f"thread-{ident}")
+            if self.thread_filter and self.thread_filter not in name:
+                continue
+            stack = []
+            while frame is not None and len(stack) < PROFILE_MAX_DEPTH:
+                stack.append(_label(frame.f_code))
+                frame = frame.f_back
+            stack.append(name)
+            self._stacks[tuple(reversed(stack))] += 1
+        self._samples += 1
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def start(self):
+        self._started = time.monotonic()
+        self._thread = threading.Thread(target=self._loop, name="profiler-sampler", daemon=True)
+        self._thread.start()
+        self.exclude.add(self._thread.ident)
+        return self
+
+    def stop(self) -> Profile:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return Profile(self._stacks, self._samples, time.monotonic() - self._started, self.interval)
+
+
+class ProfilerBusy(Exception):
+    pass
+
+
+_profile_lock = threading.Lock()
+
+
+def profile_for(seconds: float, interval: float = PROFILE_INTERVAL_MS / 1000, thread_filter: str = None) -> Profile:
+    """Sample every thread for `seconds` (capped at PROFILE_MAX_SECONDS); one run at a time per process."""
+    if not _profile_lock.acquire(blocking=False):
+        raise ProfilerBusy()
+    try:
+        sampler = Sampler(interval, thread_filter=thread_filter)
+        # The caller only sleeps while sampling
+        sampler.exclude.add(threading.get_ident())
+        sampler.start()
+        time.sleep(max(0.0, min(seconds, PROFILE_MAX_SECONDS)))
+        return sampler.stop()
+    finally:
+        _profile_lock.release()
+
+
+# Single-request profiles
+
+_request_slots = threading.BoundedSemaphore(PROFILE_MAX_REQUEST_SAMPLERS)
+_recent_requests = deque(maxlen=PROFILE_RECENT_REQUESTS)
+
+
+def start_request_profile(interval: float = PROFILE_REQUEST_INTERVAL_MS / 1000):
+    """Sampler for the calling thread only, or None when too many request profiles are running."""
+    if not _request_slots.acquire(blocking=False):
+        return None
+    try:
+        return Sampler(interval, thread_ids=[threading.get_ident()]).start()
+    except Exception:
+        _request_slots.release()
+        raise
+
+
+def finish_request_profile(sampler: Sampler, profile_id: str, label: str) -> Profile:
+    try:
+        profile = sampler.stop()
+    finally:
+        _request_slots.release()
+    _recent_requests.append((profile_id, label, profile))
+    return profile
+
+
+def get_request_profile(profile_id: str):
+    """(label, Profile) of a recently profiled request, or None."""
+    for pid, label, profile in list(_recent_requests):
+        if pid == profile_id:
+            return label, profile
+    return None
+
+
+def recent_request_profiles() -> list:
+    return [{"id": pid, "request": label, "samples": profile.samples,
+             "duration_seconds": round(profile.duration, 3)}
+            for pid, label, profile in reversed(list(_recent_requests))]
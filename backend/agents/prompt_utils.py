@@ -0,0 +1,39 @@
+# backend/agents/prompt_utils.py
+
+import re
+import threading
+
+# Words, numbers and individual punctuation marks; close to subword token
+# counts for English prose without loading the model's tokenizer.
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate LLM token count of text."""
+    return len(_TOKEN_RE.findall(text or ""))
+
+
+class PromptStats:
+    """Running totals, averages and last values for named per-request prompt measurements."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._count = 0
+        self._totals = {}
+        self._last = {}
+
+    def record(self, **values):
+        with self._lock:
+            self._count += 1
+            for name, value in values.items():
+                self._totals[name] = self._totals.get(name, 0) + value
+                self._last[name] = value
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            count, totals, last = self._count, dict(self._totals), dict(self._last)
+        stats = {"requests": count}
+        for name, total in totals.items():
+            stats[f"{name}_avg"] = round(total / count, 4) if count else 0
+            stats[f"{name}_last"] = last[name]
+        return stats
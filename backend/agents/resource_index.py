@@ -0,0 +1,246 @@
+# backend/agents/resource_index.py
+
+# Offline BM25 index over Vero's resources: VERO_RESOURCES plus the on-disk
+# corpus in backend/data/vero_resources.json. Scoring is a single vectorized
+# NumPy column sum over a precomputed document x term weight matrix. A
+# resource only matches if some query term is in its title or keywords, so
+# words that merely occur in step text cannot select it on their own.
+
+import os
+import re
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections import Counter
+from .agent_data import VERO_RESOURCES
+from .clients import BACKEND_DIR, Lazy
+
+log = logging.getLogger(__name__)
+
+# Configuration
+RESOURCE_CORPUS_PATH = os.getenv("VERO_RESOURCE_CORPUS", os.path.join(BACKEND_DIR, "data", "vero_resources.json"))
+INDEX_MIN_SCORE = float(os.getenv("VERO_INDEX_MIN_SCORE", "1.5"))
+# How often a query may stat() the corpus file to pick up edits
+CORPUS_CHECK_INTERVAL = 5.0
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+# Keywords and titles describe what a resource is for, so they count more than step text
+FIELD_WEIGHTS = {"title": 2, "keywords": 3, "description": 1, "steps": 1}
+# Fields a query must hit for a resource to match at all
+TOPIC_FIELDS = ("title", "keywords")
+
+STOPWORDS = {
+    "a", "an", "the", "i", "im", "i'm", "me", "my", "you", "your", "for", "to", "of", "in", "on", "with",
+    "and", "or", "about", "is", "am", "are", "be", "been", "do", "can", "could", "would", "please",
+    "some", "any", "get", "give", "find", "need", "want", "help", "feel", "feeling", "really", "very",
+    "mental", "health", "technique", "techniques", "resource", "resources", "tip", "tips",
+    "it", "this", "that", "at", "as", "by", "if", "so", "up", "how", "what", "each", "from", "into",
+    # Conversational filler that chat messages routed here are full of
+    "something", "anything", "thing", "things", "show", "tell", "talk", "talking", "say", "day", "days",
+    "today", "was", "were", "has", "have", "had", "bad", "good", "like", "just", "know", "think", "lot",
+    "going", "got", "make", "let", "us", "we", "they", "not", "don't", "dont", "will", "should", "more",
+    "much", "all", "out", "there", "now", "still", "maybe", "suggest", "recommend", "share", "send",
+}
+
+_TOKEN_RE = re.compile(r"[a-z0-9']+")
+
+
+def tokenize(text: str) -> list:
+    """Lowercase content words with light plural stemming."""
+    tokens = []
+    for w in _TOKEN_RE.findall((text or "").lower()):
+        if w in STOPWORDS:
+            continue
+        if len(w) > 3 and w.endswith("s") and not w.endswith("ss"):
+            w = w[:-1]
+        tokens.append(w)
+    return tokens
+
+
+def _normalize_entry(resource_id: str, entry: dict) -> dict:
+    source = entry.get("source", "")
+    return {
+        "id": resource_id,
+        "type": entry.get("type", "technique"),
+        "title": entry.get("title", ""),
+        "description": entry.get("description", ""),
+        "source": source if source.startswith("Sourced from:") else f"Sourced from: {source}",
+        "source_url": entry.get("source_url", ""),
+        "steps": list(entry.get("steps", [])),
+        "keywords": list(entry.get("keywords", [])),
+    }
+
+
+def _entry_terms(entry: dict) -> Counter:
+    terms = Counter()
+    for field, weight in FIELD_WEIGHTS.items():
+        value = entry.get(field)
+        text = " ".join(value) if isinstance(value, list) else value
+        for token in tokenize(text):
+            terms[token] += weight
+    return terms
+
+
+def _topic_terms(entry: dict) -> set:
+    terms = set()
+    for field in TOPIC_FIELDS:
+        value = entry.get(field)
+        terms.update(tokenize(" ".join(value) if isinstance(value, list) else value))
+    return terms
+
+
+def _entry_hash(entry: dict) -> str:
+    return hashlib.sha1(json.dumps(entry, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def load_corpus(path: str = RESOURCE_CORPUS_PATH) -> dict:
+    """VERO_RESOURCES overlaid with the on-disk corpus (same id replaces the built-in entry)."""
+    entries = {rid: _normalize_entry(rid, e) for rid, e in VERO_RESOURCES.items()}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            for e in json.load(f):
+                entries[e["id"]] = _normalize_entry(e["id"], e)
+    except (OSError, ValueError, KeyError) as e:
+        log.warning("Could not load Vero resource corpus %s: %s", path, e)
+    return entries
+
+
+class ResourceIndex:
+    """
+    BM25 index rebuilt incrementally: only added or changed entries are
+    re-tokenized, then the weight matrix is recomputed from the cached term
+    counts, which is a handful of NumPy operations.
+    """
+
+    def __init__(self, entries: dict = None):
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._hashes = {}
+        self._terms = {}
+        self._topics = {}
+        # (ids, vocab, weights, topic mask, entries) swapped in whole so searches never see a half-built index
+        self._snapshot = ([], {}, None, None, {})
+        self.rebuilds = 0
+        self.retokenized = 0
+        if entries:
+            self.update(entries)
+
+    def update(self, entries: dict):
+        import numpy as np
+
+        with self._lock:
+            for rid in list(self._entries):
+                if rid not in entries:
+                    del self._hashes[rid], self._terms[rid], self._topics[rid]
+            current = {}
+            for rid, entry in entries.items():
+                digest = _entry_hash(entry)
+                if self._hashes.get(rid) != digest:
+                    self._hashes[rid] = digest
+                    self._terms[rid] = _entry_terms(entry)
+                    self._topics[rid] = _topic_terms(entry)
+                    self.retokenized += 1
+                current[rid] = entry
+            self._entries = current
+
+            ids = list(current)
+            vocab = {}
+            for rid in ids:
+                for term in self._terms[rid]:
+                    vocab.setdefault(term, len(vocab))
+
+            tf = np.zeros((len(ids), len(vocab)), dtype=np.float32)
+            topic = np.zeros((len(ids), len(vocab)), dtype=bool)
+            for row, rid in enumerate(ids):
+                for term, count in self._terms[rid].items():
+                    tf[row, vocab[term]] = count
+                for term in self._topics[rid]:
+                    topic[row, vocab[term]] = True
+
+            if ids:
+                doc_len = tf.sum(axis=1, keepdims=True)
+                avg_len = float(doc_len.mean()) or 1.0
+                df = (tf > 0).sum(axis=0)
+                idf = np.log(1.0 + (len(ids) - df + 0.5) / (df + 0.5)).astype(np.float32)
+                norm = BM25_K1 * (1.0 - BM25_B + BM25_B * doc_len / avg_len)
+                weights = idf * (tf * (BM25_K1 + 1.0)) / (tf + norm)
+            else:
+                weights = tf
+
+            self._snapshot = (ids, vocab, weights, topic, current)
+            self.rebuilds += 1
+
+    def search(self, query: str, k: int = 3, min_score: float = INDEX_MIN_SCORE) -> list:
+        """Top-k (score, entry) pairs with score >= min_score, best first."""
+        import numpy as np
+
+        ids, vocab, weights, topic, entries = self._snapshot
+        if not ids:
+            return []
+        cols = [vocab[t] for t in set(tokenize(query)) if t in vocab]
+        if not cols:
+            return []
+        scores = np.where(topic[:, cols].any(axis=1), weights[:, cols].sum(axis=1), 0.0)
+        k = min(k, len(ids))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(float(scores[i]), entries[ids[i]]) for i in top if scores[i] >= min_score]
+
+    def entries(self) -> list:
+        ids, _, _, _, entries = self._snapshot
+        return [entries[rid] for rid in ids]
+
+    def __len__(self):
+        return len(self._snapshot[0])
+
+
+class _CorpusWatcher:
+    """Keeps the shared index in sync with the corpus file, checking its mtime at most every few seconds."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._index = None
+        self._mtime = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def _mtime_now(self):
+        try:
+            return os.path.getmtime(self.path)
+        except OSError:
+            return None
+
+    def get(self) -> ResourceIndex:
+        now = time.monotonic()
+        if self._index is not None and now - self._checked_at < CORPUS_CHECK_INTERVAL:
+            return self._index
+        with self._lock:
+            self._checked_at = now
+            mtime = self._mtime_now()
+            if self._index is None:
+                self._index = ResourceIndex(load_corpus(self.path))
+                self._mtime = mtime
+            elif mtime != self._mtime:
+                self._index.update(load_corpus(self.path))
+                self._mtime = mtime
+            return self._index
+
+
+_watcher = Lazy(lambda: _CorpusWatcher(RESOURCE_CORPUS_PATH))
+
+
+def get_resource_index() -> ResourceIndex:
+    return _watcher.get().get()
+
+
+def search_resources(query: str, k: int = 3, min_score: float = INDEX_MIN_SCORE) -> list:
+    """Top-k matching resources for query, best first."""
+    return [entry for _, entry in get_resource_index().search(query, k, min_score)]
+
+
+def to_resource(entry: dict) -> dict:
+    """Public resource payload (what the frontend renders) for an index entry."""
+    return {key: entry[key] for key in ("type", "title", "description", "source", "source_url", "steps")}
@@ -0,0 +1,158 @@
+# backend/agents/resource_jobs.py
+
+# Background resource lookups for Vero. Chat endpoints submit a job and reply
+# immediately with its id; a small worker pool performs the (possibly slow)
+# lookup and the client polls /vero/resourceJob/<id> for the result.
+#
+# Every job is also written to Firestore when it is submitted and again when
+# it finishes, so a poll that lands on another worker process finds it and
+# long-polls the document.
+#
+# Firestore: resource_jobs/{jobId}
+#   jobId, status, resource_data, show_resource_button, error, createdAt, finishedAt
+
+import os
+import time
+import uuid
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from .clients import Lazy, firestore, get_db
+from . import tracing
+
+log = logging.getLogger(__name__)
+
+# Configuration
+RESOURCE_JOB_WORKERS = int(os.getenv("VERO_RESOURCE_JOB_WORKERS", "4"))
+RESOURCE_JOB_TTL = 10 * 60
+RESOURCE_JOB_MAX_WAIT = 25
+# How often a poll for another worker's job re-reads its document
+RESOURCE_JOB_POLL_SECONDS = 1.0
+
+PENDING = 'pending'
+DONE = 'done'
+FAILED = 'failed'
+
+# Jobs are mirrored here so any worker process can answer a poll
+JOBS_COLLECTION = 'resource_jobs'
+
+
+class ResourceJob:
+    def __init__(self, query: str, region: str):
+        self.id = uuid.uuid4().hex
+        self.query = query
+        self.region = region
+        self.status = PENDING
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self._done = threading.Event()
+
+    def wait(self, timeout: float) -> bool:
+        return self._done.wait(timeout)
+
+    def to_dict(self) -> dict:
+        data = {"jobId": self.id, "status": self.status}
+        if self.status == DONE:
+            data["resource_data"] = self.result
+            data["show_resource_button"] = bool(self.result)
+        elif self.status == FAILED:
+            data["error"] = "Resource lookup failed"
+        return data
+
+
+_executor = Lazy(lambda: ThreadPoolExecutor(max_workers=RESOURCE_JOB_WORKERS, thread_name_prefix="vero-job"))
+_jobs = {}
+_jobs_lock = threading.Lock()
+
+
+def _purge_expired_locked(now: float):
+    expired = [job_id for job_id, job in _jobs.items()
+               if job.finished_at and now - job.finished_at > RESOURCE_JOB_TTL]
+    for job_id in expired:
+        del _jobs[job_id]
+
+
+def _run_job(job: ResourceJob, on_complete):
+    with tracing.span("vero.resource_job", job_id=job.id) as span:
+        try:
+            from .vero_agent import find_resource_for_query
+            job.result = find_resource_for_query(job.query, job.region)
+            job.status = DONE
+        except Exception as e:
+            log.error("Resource job %s failed: %s", job.id, e)
+            job.error = str(e)
+            job.status = FAILED
+        span.set(status=job.status)
+    job.finished_at = time.time()
+    job._done.set()
+
+    db = get_db()
+    if db is not None:
+        try:
+            db.collection(JOBS_COLLECTION).document(job.id).set({
+                **job.to_dict(),
+                "finishedAt": firestore.SERVER_TIMESTAMP,
+            }, merge=True)
+        except Exception as e:
+            log.error("Error storing resource job %s: %s", job.id, e)
+
+    if on_complete is not None and job.status == DONE:
+        try:
+            on_complete(job.result)
+        except Exception as e:
+            log.error("Resource job %s completion handler error: %s", job.id, e)
+
+
+def submit_resource_job(query: str, region: str = 'GLOBAL', on_complete=None) -> ResourceJob:
+    """Queue a resource lookup; on_complete(result) runs on the worker once it succeeds."""
+    job = ResourceJob(query, region)
+    with _jobs_lock:
+        _purge_expired_locked(job.created_at)
+        _jobs[job.id] = job
+    # Written before the reply carries the id, so a poll on any worker finds the job
+    db = get_db()
+    if db is not None:
+        try:
+            db.collection(JOBS_COLLECTION).document(job.id).set({
+                **job.to_dict(),
+                "createdAt": firestore.SERVER_TIMESTAMP,
+            })
+        except Exception as e:
+            log.error("Error storing resource job %s: %s", job.id, e)
+    # Spans from the job join the submitting request's trace and are exported as they finish
+    _executor.get().submit(tracing.wrap(_run_job), job, on_complete)
+    return job
+
+
+def get_job_status(job_id: str, wait: float = 0) -> dict:
+    """Job state as a response dict, optionally long-polling up to `wait` seconds; None if unknown."""
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+    if job is not None:
+        if job.status == PENDING and wait > 0:
+            job.wait(min(wait, RESOURCE_JOB_MAX_WAIT))
+        return job.to_dict()
+
+    # Submitted by another worker process: re-read its document until it finishes or `wait` runs out
+    db = get_db()
+    if db is None:
+        return None
+    deadline = time.monotonic() + min(max(wait, 0), RESOURCE_JOB_MAX_WAIT)
+    ref = db.collection(JOBS_COLLECTION).document(job_id)
+    while True:
+        try:
+            doc = ref.get()
+        except Exception as e:
+            log.error("Error reading resource job %s: %s", job_id, e)
+            return None
+        if not doc.exists:
+            return None
+        data = doc.to_dict()
+        remaining = deadline - time.monotonic()
+        if data.get("status") != PENDING or remaining <= 0:
+            data.pop("createdAt", None)
+            data.pop("finishedAt", None)
+            return data
+        time.sleep(min(RESOURCE_JOB_POLL_SECONDS, remaining))
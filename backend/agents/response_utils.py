@@ -0,0 +1,95 @@
+# backend/agents/response_utils.py
+
+# Post-processing of raw model output into one Elara reply: cut at the next
+# simulated turn, limit sentences and pull out the [ACTION:...] handoff tag.
+# All patterns are compiled once; see bench_sanitize.py for the equivalence
+# check against the original implementation and timings.
+
+import re
+
+MAX_SENTENCES = 3
+
+_QUOTE_CHARS = '`"\' \n\r'
+_ELARA_PREFIX_RE = re.compile(r'\s*Elara[:\-\s]+', re.I)
+_USER_PREFIX_RE = re.compile(r'\s*User[:\-\s]+', re.I)
+_SENTENCE_BREAK_RE = re.compile(r'(?<=[.!?])\s+')
+_SPACE_BEFORE_NEWLINE_RE = re.compile(r'\s+\n')
+# Tags are recognised in any case but only the canonical spelling is removed from the text
+_ACTION_RE = re.compile(r'\[ACTION:find_technique\|([^\]]+)\]', re.I)
+_ACTION_TAG_RE = re.compile(r'\s*\[ACTION:find_technique\|[^\]]+\]\s*')
+
+
+def _first_turn(t: str) -> str:
+    """Lines up to the next 'Elara:' or 'User:' turn, without the reply's own 'Elara:' prefix."""
+    lines = t.splitlines()
+    start = 0
+    for idx, ln in enumerate(lines):
+        if ln.strip():
+            start = idx
+            break
+
+    kept = []
+    for idx in range(start, len(lines)):
+        ln = lines[idx]
+        m = _ELARA_PREFIX_RE.match(ln)
+        if m:
+            if kept:
+                break
+            kept.append(ln[m.end():])
+        elif _USER_PREFIX_RE.match(ln):
+            break
+        else:
+            kept.append(ln)
+    return "\n".join(kept).strip() if kept else t.strip()
+
+
+def _limit_sentences(t: str, max_sentences: int) -> str:
+    """First max_sentences sentences joined by single spaces; stops scanning at the limit."""
+    breaks = []
+    for m in _SENTENCE_BREAK_RE.finditer(t):
+        breaks.append(m)
+        if len(breaks) == max_sentences:
+            break
+    else:
+        return t
+    pieces = []
+    pos = 0
+    for m in breaks:
+        pieces.append(t[pos:m.start()])
+        pos = m.end()
+    return " ".join(pieces).strip()
+
+
+def sanitize_ai_response(raw_text: str, max_sentences: int = MAX_SENTENCES) -> str:
+    """Clean AI response to single Elara reply."""
+    if not raw_text:
+        return raw_text or ""
+
+    t = raw_text.strip().strip(_QUOTE_CHARS)
+    m = _ELARA_PREFIX_RE.match(t)
+    if m:
+        t = t[m.end():]
+
+    t = _first_turn(t)
+
+    cut = t.find("\n\n")
+    if cut >= 0:
+        t = t[:cut].strip()
+
+    t = _limit_sentences(t, max_sentences)
+    if "\n" in t:
+        t = _SPACE_BEFORE_NEWLINE_RE.sub('\n', t)
+    return t.strip()
+
+
+def extract_action(text: str):
+    """Remove [ACTION:find_technique|problem] tags; returns (text, first problem or None)."""
+    m = _ACTION_RE.search(text) if '[' in text else None
+    if m is None:
+        return text.strip(), None
+    return _ACTION_TAG_RE.sub("", text).strip(), m.group(1).strip()
+
+
+def postprocess_response(raw_text: str, max_sentences: int = MAX_SENTENCES):
+    """Raw model output -> (reply text, requested technique problem or None)."""
+    return extract_action(sanitize_ai_response(raw_text, max_sentences))
@@ -1,24 +1,40 @@
 # backend/agents/session_agent.py
 
+import logging
 from flask import Blueprint, request, jsonify
-from firebase_admin import firestore
+from .feedback_aggregator import get_feedback_aggregator
+from . import events
+
+log = logging.getLogger(__name__)
 
 session_bp = Blueprint('session_agent', __name__)
 
 @session_bp.route('/session/feedback', methods=['POST'])
 def handle_feedback():
-    db = firestore.client()
-    data = request.json
+    data = request.json or {}
     user_id = data.get('userId')
     rating = data.get('rating')
-    
+    session_id = data.get('sessionId')
+
     if not user_id or not rating:
         return jsonify({"error": "User ID and rating are required."}), 400
-        
-    # This feedback will be used by Orion to update the user's long-term state
-    db.collection('user_states').document(user_id).collection('feedback_history').add({
-        "rating": rating,
-        "timestamp": firestore.SERVER_TIMESTAMP
-    })
-    
-    return jsonify({"message": "Feedback received. Thank you!"}), 200
\ No newline at end of file
+    if isinstance(rating, bool) or not isinstance(rating, (int, float)):
+        return jsonify({"error": "Rating must be a number."}), 400
+
+    # Queued and folded into the user's feedback summary, which Orion and dashboards read
+    get_feedback_aggregator().add(user_id, rating, session_id)
+    events.publish(events.FEEDBACK_RECEIVED, user_id=user_id, rating=rating, session_id=session_id)
+
+    return jsonify({"message": "Feedback received. Thank you!"}), 200
+
+@session_bp.route('/session/feedbackSummary', methods=['GET'])
+def get_feedback_summary():
+    """Count, mean and recent (exponentially weighted) mean of a user's ratings."""
+    user_id = request.args.get('userId') or request.headers.get('X-User-ID')
+    if not user_id:
+        return jsonify({"error": "User ID is required"}), 400
+    try:
+        return jsonify({"summary": get_feedback_aggregator().summary(user_id)})
+    except Exception as e:
+        log.error("Error getting feedback summary for user %s: %s", user_id, e)
+        return jsonify({"error": "Failed to get feedback summary"}), 500
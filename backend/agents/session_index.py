@@ -0,0 +1,115 @@
+# backend/agents/session_index.py
+
+# The per-user list of chat sessions shown in the history sidebar. Each
+# session document carries a small denormalized preview (its first user
+# message and a turn count) that is maintained as turns are stored, so the
+# list is a single projected, paginated query and never opens chatHistory.
+# Pages are cached per user for a few seconds, which absorbs repeated sidebar
+# renders; the cache is per process, so the short TTL also bounds how long a
+# session created on another worker can be missing. Creating a session here
+# drops the user's cached pages.
+#
+# Firestore: user_sessions/{sessionId}
+#   userId, startTime, turn_count, preview
+
+import os
+import logging
+from datetime import datetime
+from .clients import firestore
+from .cache import TTLCache
+from . import metrics
+
+log = logging.getLogger(__name__)
+
+# Configuration
+SESSION_LIST_PAGE_SIZE = int(os.getenv("SESSION_LIST_PAGE_SIZE", "20"))
+SESSION_LIST_MAX_PAGE_SIZE = 100
+SESSION_LIST_CACHE_TTL = float(os.getenv("SESSION_LIST_CACHE_TTL", "5"))
+SESSION_PREVIEW_CHARS = 80
+
+LIST_FIELDS = ['startTime', 'preview', 'turn_count']
+
+# user_id -> {(page_size, page_token): (sessions, next_page_token)}
+_list_cache = TTLCache(max_size=2048, ttl_seconds=SESSION_LIST_CACHE_TTL)
+metrics.register_cache("session_list", lambda: _list_cache)
+
+
+class InvalidPageToken(ValueError):
+    pass
+
+
+def invalidate(user_id: str):
+    """Drop the user's cached session-list pages."""
+    _list_cache.invalidate(user_id)
+
+
+def create_session(db, user_id: str) -> str:
+    doc_ref = db.collection('user_sessions').document()
+    doc_ref.set({
+        "userId": user_id,
+        "startTime": firestore.SERVER_TIMESTAMP,
+        "turn_count": 0,
+    })
+    invalidate(user_id)
+    return doc_ref.id
+
+
+def _preview(text: str) -> str:
+    text = " ".join(text.split())
+    if len(text) <= SESSION_PREVIEW_CHARS:
+        return text
+    return text[:SESSION_PREVIEW_CHARS - 1].rstrip() + "…"
+
+
+def record_turn(db, session_id: str, user_message: str = None, first: bool = False):
+    """Count a stored user turn; the session's first user message becomes its preview."""
+    update = {"turn_count": firestore.Increment(1)}
+    if first and user_message:
+        update["preview"] = _preview(user_message)
+    db.collection('user_sessions').document(session_id).set(update, merge=True)
+
+
+def _entry(doc) -> dict:
+    d = doc.to_dict() or {}
+    start_time = d.get('startTime')
+    return {
+        "id": doc.id,
+        "startTime": start_time.isoformat() if isinstance(start_time, datetime) else None,
+        "preview": d.get('preview'),
+        "turnCount": d.get('turn_count'),
+    }
+
+
+def _query_page(db, user_id: str, page_size: int, page_token: str):
+    sessions_ref = db.collection('user_sessions')
+    query = (sessions_ref.where('userId', '==', user_id)
+             .order_by('startTime', direction=firestore.Query.DESCENDING)
+             .select(LIST_FIELDS))
+    if page_token:
+        # The token is the last session id of the previous page
+        cursor = sessions_ref.document(page_token).get(field_paths=['userId', 'startTime'])
+        if not cursor.exists or (cursor.to_dict() or {}).get('userId') != user_id:
+            raise InvalidPageToken(page_token)
+        query = query.start_after(cursor)
+    docs = list(query.limit(page_size + 1).stream())
+    sessions = [_entry(doc) for doc in docs[:page_size]]
+    next_token = sessions[-1]["id"] if len(docs) > page_size else None
+    return sessions, next_token
+
+
+def list_sessions(db, user_id: str, page_size: int = SESSION_LIST_PAGE_SIZE, page_token: str = None):
+    """(sessions newest first, next page token or None) for one page of the user's sessions."""
+    page_size = max(1, min(int(page_size), SESSION_LIST_MAX_PAGE_SIZE))
+    key = (page_size, page_token)
+    pages = _list_cache.get(user_id)
+    if pages is not None and key in pages:
+        return pages[key]
+
+    page = _query_page(db, user_id, page_size, page_token)
+    # Copy on write, and only if nothing invalidated the user's pages while querying
+    current = _list_cache.get(user_id)
+    if current is pages:
+        updated = dict(current or {})
+        updated[key] = page
+        _list_cache.set(user_id, updated)
+    return page
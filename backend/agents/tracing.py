@@ -0,0 +1,376 @@
+# backend/agents/tracing.py
+
+# Request tracing. Every HTTP request (and every Orion run) is a trace with a
+# root span; agent stages, Firestore calls, model calls and web fetches open
+# child spans under whatever span is current in the calling context. Spans
+# are written as JSON lines by a background writer, one trace at a time once
+# its root span ends, so a slow request can be broken down by stage.
+#
+#   TRACE_EXPORT       "stdout", "file" (TRACE_FILE) or "off"; the file is
+#                      rotated to <path>.1 once it passes TRACE_FILE_MAX_BYTES
+#   TRACE_SAMPLE_RATE  fraction of traces exported; traces slower than
+#                      TRACE_SLOW_MS are always exported
+#
+# Work handed to thread pools joins the trace when submitted through wrap().
+
+import os
+import sys
+import json
+import time
+import queue
+import random
+import atexit
+import logging
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+from flask import request
+
+log = logging.getLogger(__name__)
+
+# Configuration
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "true").lower() != "false"
+TRACE_EXPORT = os.getenv("TRACE_EXPORT", "file").lower()
+TRACE_FILE = os.getenv("TRACE_FILE", os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".cache", "traces.jsonl"))
+TRACE_FILE_MAX_BYTES = int(os.getenv("TRACE_FILE_MAX_BYTES", str(50 * 1024 * 1024)))
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0.05"))
+TRACE_SLOW_MS = float(os.getenv("TRACE_SLOW_MS", "1000"))
+# Spans kept per trace; Orion runs touch every user document
+TRACE_MAX_SPANS = int(os.getenv("TRACE_MAX_SPANS", "500"))
+TRACE_RECENT = int(os.getenv("TRACE_RECENT", "100"))
+TRACE_QUEUE_SIZE = 1000
+
+TRACE_HEADER = 'X-Trace-Id'
+
+_current = contextvars.ContextVar('trace_span', default=None)
+
+
+def _new_id(nbytes: int) -> str:
+    return os.urandom(nbytes).hex()
+
+
+class _Trace:
+    """Spans of one trace, buffered until the root span ends."""
+
+    __slots__ = ('trace_id', 'sampled', 'root', 'spans', 'dropped', 'closed', 'lock')
+
+    def __init__(self, trace_id: str, sampled: bool):
+        self.trace_id = trace_id
+        self.sampled = sampled
+        self.root = None
+        self.spans = []
+        self.dropped = 0
+        self.closed = False
+        self.lock = threading.Lock()
+
+
+class Span:
+    __slots__ = ('trace', 'span_id', 'parent_id', 'name', 'attributes', 'start', 'duration', 'error', '_t0')
+
+    def __init__(self, trace: _Trace, name: str, parent_id: str = None, attributes: dict = None):
+        self.trace = trace
+        self.span_id = _new_id(8)
+        self.parent_id = parent_id
+        self.name = name
+        self.attributes = attributes or {}
+        self.start = time.time()
+        self.duration = None
+        self.error = None
+        self._t0 = time.perf_counter()
+
+    @property
+    def trace_id(self) -> str:
+        return self.trace.trace_id
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def end(self, error: BaseException = None):
+        if self.duration is not None:
+            return
+        self.duration = time.perf_counter() - self._t0
+        if error is not None:
+            self.error = f"{type(error).__name__}: {error}"
+        _finished(self)
+
+    def to_dict(self) -> dict:
+        entry = {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": round(self.start, 6),
+            "duration_ms": round((self.duration or 0) * 1000, 3),
+        }
+        if self.attributes:
+            entry["attributes"] = self.attributes
+        if self.error:
+            entry["error"] = self.error
+        return entry
+
+
+class _NullSpan:
+    """Stands in for a span outside any trace, so call sites need no checks."""
+
+    trace_id = None
+    span_id = None
+
+    def set(self, **attributes):
+        pass
+
+    def end(self, error: BaseException = None):
+        pass
+
+
+NULL_SPAN = _NullSpan()
+
+
+def current_span():
+    return _current.get()
+
+
+def current_trace_id():
+    span = _current.get()
+    return span.trace_id if span is not None else None
+
+
+def start_span(name: str, **attributes):
+    """Child of the current span, not made current (for leaf calls); NULL_SPAN outside a trace."""
+    parent = _current.get()
+    if parent is None:
+        return NULL_SPAN
+    return Span(parent.trace, name, parent.span_id, attributes)
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """Child span of the current one, current for the duration of the block."""
+    parent = _current.get()
+    if parent is None:
+        yield NULL_SPAN
+        return
+    child = Span(parent.trace, name, parent.span_id, attributes)
+    token = _current.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.end(e)
+        raise
+    finally:
+        _current.reset(token)
+        child.end()
+
+
+def start_trace(name: str, trace_id: str = None, parent_id: str = None, **attributes):
+    """Root span of a new trace, made current; returns (span, token) for end_trace."""
+    if not TRACING_ENABLED:
+        return NULL_SPAN, None
+    trace = _Trace(trace_id or _new_id(16), random.random() < TRACE_SAMPLE_RATE)
+    root = trace.root = Span(trace, name, parent_id, attributes)
+    return root, _current.set(root)
+
+
+def end_trace(root, token, error: BaseException = None):
+    if token is None:
+        return
+    _current.reset(token)
+    root.end(error)
+
+
+@contextmanager
+def trace(name: str, **attributes):
+    """Run the block as its own trace (background jobs such as Orion runs)."""
+    root, token = start_trace(name, **attributes)
+    try:
+        yield root
+    except BaseException as e:
+        end_trace(root, token, e)
+        raise
+    end_trace(root, token)
+
+
+def traced(name: str):
+    """Decorator: run the function inside a span called `name`."""
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def wrap(fn):
+    """fn bound to the caller's context, so spans opened on a pool thread join the caller's trace."""
+    if _current.get() is None:
+        return fn
+    ctx = contextvars.copy_context()
+    return lambda *args, **kwargs: ctx.run(fn, *args, **kwargs)
+
+
+# Export
+
+_recent = deque(maxlen=TRACE_RECENT)
+_export_queue = queue.Queue(maxsize=TRACE_QUEUE_SIZE)
+_writer = None
+_writer_lock = threading.Lock()
+_export_counts = {"exported": 0, "dropped": 0}
+
+
+def _finished(span: Span):
+    trace = span.trace
+    with trace.lock:
+        if trace.closed:
+            # Background work that outlived its request follows the decision made for the trace
+            if trace.sampled:
+                _export([span])
+            return
+        if len(trace.spans) < TRACE_MAX_SPANS or span is trace.root:
+            trace.spans.append(span)
+        else:
+            trace.dropped += 1
+        if span is not trace.root:
+            return
+        trace.closed = True
+        trace.sampled = trace.sampled or span.duration * 1000 >= TRACE_SLOW_MS
+        spans, trace.spans = trace.spans, []
+
+    if trace.dropped:
+        span.set(dropped_spans=trace.dropped)
+    if trace.sampled:
+        _recent.append((span, spans))
+        _export(spans)
+
+
+def _write_stdout(spans):
+    sys.stdout.write("".join(json.dumps(s.to_dict(), default=str) + "\n" for s in spans))
+    sys.stdout.flush()
+
+
+def _write_loop(append):
+    while True:
+        spans = _export_queue.get()
+        try:
+            append(spans)
+        except Exception as e:
+            log.error("Trace export error: %s", e)
+
+
+def _start_writer() -> bool:
+    global _writer
+    with _writer_lock:
+        if _writer is not None:
+            return True
+        if TRACE_EXPORT == "stdout":
+            append = _write_stdout
+        elif TRACE_EXPORT == "file":
+            # Same size-capped JSON-lines file as the event log; spans have to_dict() too
+            from .events import FileEventLog
+            append = FileEventLog(TRACE_FILE, TRACE_FILE_MAX_BYTES).append
+        else:
+            return False
+        _writer = threading.Thread(target=_write_loop, args=(append,), name="trace-writer", daemon=True)
+        _writer.start()
+        return True
+
+
+def _export(spans):
+    if TRACE_EXPORT == "off" or not _start_writer():
+        return
+    try:
+        _export_queue.put_nowait(spans)
+        _export_counts["exported"] += 1
+    except queue.Full:
+        _export_counts["dropped"] += 1
+
+
+def _flush(timeout: float = 2.0):
+    deadline = time.monotonic() + timeout
+    while not _export_queue.empty() and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+atexit.register(_flush)
+
+
+def _summary(root: Span, spans) -> dict:
+    stages = [s for s in spans if s.parent_id == root.span_id]
+    return {
+        **root.to_dict(),
+        "spans": len(spans),
+        "stages": [{"name": s.name, "duration_ms": round(s.duration * 1000, 3), **({"error": s.error} if s.error else {})}
+                   for s in sorted(stages, key=lambda s: s.start)],
+    }
+
+
+def recent_traces(min_ms: float = 0, limit: int = 20) -> list:
+    """Most recent exported traces, newest first, with their top-level stages."""
+    found = []
+    for root, spans in reversed(list(_recent)):
+        if root.duration * 1000 >= min_ms:
+            found.append(_summary(root, spans))
+            if len(found) >= limit:
+                break
+    return found
+
+
+def get_trace(trace_id: str):
+    """All spans of a recent trace, in start order, or None."""
+    for root, spans in list(_recent):
+        if root.trace_id == trace_id:
+            return [s.to_dict() for s in sorted(spans, key=lambda s: s.start)]
+    return None
+
+
+def get_trace_stats() -> dict:
+    return {
+        "enabled": TRACING_ENABLED,
+        "export": TRACE_EXPORT,
+        "sample_rate": TRACE_SAMPLE_RATE,
+        "slow_ms": TRACE_SLOW_MS,
+        "traces_exported": _export_counts["exported"],
+        "traces_dropped": _export_counts["dropped"],
+        "recent": len(_recent),
+    }
+
+
+# Flask integration
+
+def _incoming_context():
+    """(trace_id, parent span id) from a W3C traceparent or X-Trace-Id header."""
+    parts = request.headers.get('traceparent', '').split('-')
+    if len(parts) == 4 and len(parts[1]) == 32 and len(parts[2]) == 16:
+        return parts[1], parts[2]
+    trace_id = request.headers.get(TRACE_HEADER, '').strip()
+    if trace_id and len(trace_id) <= 64 and trace_id.replace('-', '').isalnum():
+        return trace_id, None
+    return None, None
+
+
+def init_app(app):
+    """Open a root span per request and return its trace id in the X-Trace-Id header."""
+    if not TRACING_ENABLED:
+        return
+
+    @app.before_request
+    def _start_request_trace():
+        trace_id, parent_id = _incoming_context()
+        rule = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        root, token = start_trace(f"{request.method} {rule}", trace_id, parent_id, endpoint=request.endpoint)
+        request.environ['trace.root'] = (root, token)
+
+    @app.after_request
+    def _tag_response(response):
+        root, _ = request.environ.get('trace.root', (NULL_SPAN, None))
+        if root.trace_id:
+            root.set(status=response.status_code)
+            response.headers[TRACE_HEADER] = root.trace_id
+        return response
+
+    @app.teardown_request
+    def _end_request_trace(error=None):
+        root, token = request.environ.pop('trace.root', (NULL_SPAN, None))
+        end_trace(root, token, error)
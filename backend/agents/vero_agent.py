@@ -1,15 +1,42 @@
 # Vero Agent - Resource Provider
 from flask import Blueprint, request, jsonify
-from firebase_admin import firestore
-try:
-    import requests
-    from bs4 import BeautifulSoup
-    SCRAPING_AVAILABLE = True
-except Exception:
-    SCRAPING_AVAILABLE = False
+from .clients import firestore, get_db, get_watsonx_model, Lazy, BACKEND_DIR
+from . import http_client
+from .http_client import Deadline
+from .cache import TTLCache, FRESH, STALE
+from .resource_jobs import get_job_status
+from .resource_index import tokenize, search_resources, to_resource, get_resource_index
+from .prompt_utils import estimate_tokens, PromptStats
+from . import metrics
+from . import tracing
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from urllib.parse import quote
+import os
+import re
+import logging
+import threading
+
+# Total time budget for a web fallback lookup, shared by both search queries
+VERO_LOOKUP_DEADLINE = float(os.getenv("VERO_LOOKUP_DEADLINE", "10"))
+# Search endpoint; point it at a local stub server to exercise scraping offline
+VERO_SEARCH_URL = os.getenv("VERO_SEARCH_URL", "https://duckduckgo.com/html/?q={query}")
+
+# Scraped-resource cache: fresh for a day, served stale (and refreshed in the background) for a week
+RESOURCE_CACHE_PATH = os.getenv("VERO_RESOURCE_CACHE_PATH", os.path.join(BACKEND_DIR, ".cache", "vero_resources.json"))
+RESOURCE_CACHE_SIZE = int(os.getenv("VERO_RESOURCE_CACHE_SIZE", "500"))
+RESOURCE_CACHE_TTL = 24 * 3600
+RESOURCE_CACHE_STALE = 7 * 24 * 3600
+# Failed lookups are remembered briefly so repeats fall through to the default technique quickly
+RESOURCE_CACHE_NEGATIVE_TTL = 10 * 60
+
+# Retrieval-augmented getResource: only the top-k index entries go into the prompt
+RAG_TOP_K = int(os.getenv("VERO_RAG_TOP_K", "3"))
+RAG_ID_RE = re.compile(r"^id\s*:\s*\[?([\w-]+)\]?", re.I)
+RAG_NUMBERED_RE = re.compile(r"^\d+[.)]\s*")
 
 vero_bp = Blueprint('vero_agent', __name__)
+log = logging.getLogger(__name__)
 watsonx_model = None
 
 def set_watsonx_model(model):
@@ -18,27 +45,30 @@ def set_watsonx_model(model):
     watsonx_model = model
 
 
+def _get_model():
+    """Explicitly set model, else the shared lazily-built Watsonx model."""
+    return watsonx_model if watsonx_model is not None else get_watsonx_model()
+
+
 def _get_db_or_none():
-    try:
-        return firestore.client()
-    except Exception:
-        return None
+    return get_db()
 
-def _scrape_first_result(query: str):
+def _scrape_first_result(query: str, deadline: Deadline):
     """Very light web scraping: search via DuckDuckGo HTML and fetch first result content."""
-    if not SCRAPING_AVAILABLE:
+    try:
+        # BeautifulSoup is optional and only loaded on the first fallback lookup
+        from bs4 import BeautifulSoup
+    except ImportError:
         return None
     try:
-        q = requests.utils.quote(query)
-        search_url = f"https://duckduckgo.com/html/?q={q}"
-        s = requests.Session()
-        r = s.get(search_url, timeout=8, headers={"User-Agent": "Mozilla/5.0"})
+        search_url = VERO_SEARCH_URL.format(query=quote(query))
+        r = http_client.get(search_url, deadline)
         soup = BeautifulSoup(r.text, 'html.parser')
         a = soup.select_one('a.result__a')
         if not a or not a.get('href'):
             return None
         target = a.get('href')
-        page = s.get(target, timeout=8, headers={"User-Agent": "Mozilla/5.0"})
+        page = http_client.get(target, deadline)
         psoup = BeautifulSoup(page.text, 'html.parser')
         # Extract main text
         paragraphs = [p.get_text(strip=True) for p in psoup.select('p')]
@@ -48,202 +78,233 @@ def _scrape_first_result(query: str):
         return None
 
 
-def find_resource_for_query(query, region='GLOBAL', chat_context: str = ""):
-    """Find resources for user queries with proper source attribution."""
-    query_lower = query.lower()
-    
-    if "stress" in query_lower or "anxiety" in query_lower:
-        return {
-            "type": "technique",
-            "title": "Box Breathing Technique",
-            "description": "A simple breathing exercise used by Navy SEALs to reduce stress and anxiety",
-            "source": "Sourced from: Navy SEALs and healthcare professionals",
-            "source_url": "https://www.webmd.com/balance/what-is-box-breathing",
-            "steps": [
-                "Find a comfortable, quiet place to sit or lie down.",
-                "Close your eyes and slowly exhale all the air from your lungs.",
-                "Inhale slowly through your nose for a count of 4.",
-                "Hold your breath for a count of 4.",
-                "Exhale slowly through your mouth for a count of 4.",
-                "Hold the empty breath for a count of 4.",
-                "Repeat the cycle for at least 5 minutes to feel the calming effects."
-            ]
-        }
-    elif "focus" in query_lower or "concentration" in query_lower:
-        return {
-            "type": "technique",
-            "title": "Pomodoro Technique",
-            "description": "A time management method to improve focus and productivity",
-            "source": "Sourced from: Francesco Cirillo",
-            "source_url": "https://francescocirillo.com/pages/pomodoro-technique",
-            "steps": [
-                "Choose a task you want to work on.",
-                "Set a timer for 25 minutes.",
-                "Work on the task until the timer rings.",
-                "Take a 5-minute break.",
-                "After 4 pomodoros, take a longer 15-30 minute break.",
-                "Repeat the cycle as needed."
-            ]
-        }
-    elif "sad" in query_lower or "depression" in query_lower:
-        return {
-            "type": "exercise",
-            "title": "Gratitude Listing Exercise",
-            "description": "A simple exercise to shift perspective and improve mood",
-            "source": "Sourced from: PositivePsychology.com",
-            "source_url": "https://positivepsychology.com/gratitude-exercises/",
-            "steps": [
-                "Find a quiet moment to sit comfortably.",
-                "Take a few deep breaths to center yourself.",
-                "Write down three specific things you are grateful for today.",
-                "Be as specific as possible (e.g., 'the warm sunlight on my face' rather than 'the weather').",
-                "Reflect on why each item brings you gratitude.",
-                "Repeat this exercise daily for best results."
-            ]
-        }
+def _scrape_resource(query: str):
+    """Race the specific and the plain search query; first usable page wins within one shared budget."""
+    deadline = Deadline(VERO_LOOKUP_DEADLINE)
+    return http_client.first_result([
+        lambda: _scrape_first_result(f"mental health technique for {query}", deadline),
+        lambda: _scrape_first_result(query, deadline),
+    ], deadline)
+
+
+def normalize_query(query: str) -> str:
+    """Cache key for a lookup: content words, lightly stemmed, order-insensitive."""
+    return " ".join(sorted(set(tokenize(query))))
+
+
+_resource_cache = Lazy(lambda: TTLCache(
+    max_size=RESOURCE_CACHE_SIZE,
+    ttl_seconds=RESOURCE_CACHE_TTL,
+    stale_seconds=RESOURCE_CACHE_STALE,
+    persist_path=RESOURCE_CACHE_PATH,
+))
+NOT_CACHED = object()
+_refresh_executor = Lazy(lambda: ThreadPoolExecutor(max_workers=2, thread_name_prefix="vero-refresh"))
+_refreshing = set()
+_refreshing_lock = threading.Lock()
+
+# (normalized query, retrieved ids) -> structured resource
+_rag_cache = TTLCache(max_size=512, ttl_seconds=6 * 3600)
+metrics.register_cache("vero_resources", lambda: _resource_cache.get() if _resource_cache.initialized else None)
+metrics.register_cache("vero_rag", lambda: _rag_cache)
+_full_kb_cache = {}
+_prompt_stats = PromptStats()
+
+
+def _store_scrape(key: str, query: str):
+    scraped = _scrape_resource(query)
+    if scraped:
+        _resource_cache.get().set(key, scraped)
     else:
-        # Try web scrape fallback based on context
-        scraped = _scrape_first_result(f"mental health technique for {query}") or _scrape_first_result(query)
-        if scraped:
-            return {
-                "type": "web",
-                "title": f"Resource for: {query}",
-                "description": "Web-sourced information related to your request.",
-                "source": "Sourced from: Web",
-                "source_url": scraped["url"],
-                "steps": [scraped["content"][:800] or "Open the link to read more."]
-            }
+        _resource_cache.get().set(key, {}, ttl_seconds=RESOURCE_CACHE_NEGATIVE_TTL)
+    return scraped
+
+
+def _refresh_in_background(key: str, query: str):
+    with _refreshing_lock:
+        if key in _refreshing:
+            return
+        _refreshing.add(key)
+
+    def _run():
+        try:
+            _store_scrape(key, query)
+        finally:
+            with _refreshing_lock:
+                _refreshing.discard(key)
+
+    _refresh_executor.get().submit(tracing.wrap(_run))
+
+
+def _cached_scrape(query: str, allow_network: bool = True):
+    """
+    Scraped page for query via the persistent cache; stale entries are served
+    and refreshed. On a miss with allow_network=False, returns NOT_CACHED.
+    """
+    key = normalize_query(query) or query.strip().lower()
+    value, state = _resource_cache.get().lookup(key)
+    if state == STALE:
+        _refresh_in_background(key, query)
+    if state in (FRESH, STALE):
+        return value or None
+    if not allow_network:
+        return NOT_CACHED
+    return _store_scrape(key, query)
+
+
+def get_resource_cache_stats() -> dict:
+    return _resource_cache.get().stats()
+
+
+DEFAULT_RESOURCE = {
+    "type": "technique",
+    "title": "5-4-3-2-1 Grounding Technique",
+    "description": "A sensory grounding exercise to help with overwhelming feelings",
+    "source": "Sourced from: Healthline",
+    "source_url": "https://www.healthline.com/health/grounding-techniques",
+    "steps": [
+        "Look around and name 5 things you can see.",
+        "Touch and name 4 things you can feel.",
+        "Listen and name 3 things you can hear.",
+        "Smell and name 2 things you can smell.",
+        "Taste and name 1 thing you can taste.",
+        "Take a deep breath and notice how you feel."
+    ]
+}
+
+
+@tracing.traced("vero.find_resource")
+def find_resource_for_query(query, region='GLOBAL', chat_context: str = "", allow_network: bool = True):
+    """
+    Find resources for user queries with proper source attribution.
+    With allow_network=False, returns None instead of fetching from the web,
+    so callers on the chat path can hand the lookup to a background job.
+    """
+    matches = search_resources(query, k=1)
+    if matches:
+        return to_resource(matches[0])
+
+    # Try web scrape fallback based on context
+    scraped = _cached_scrape(query, allow_network)
+    if scraped is NOT_CACHED:
+        return None
+    if scraped:
         return {
-            "type": "technique",
-            "title": "5-4-3-2-1 Grounding Technique",
-            "description": "A sensory grounding exercise to help with overwhelming feelings",
-            "source": "Sourced from: Healthline",
-            "source_url": "https://www.healthline.com/health/grounding-techniques",
-            "steps": [
-                "Look around and name 5 things you can see.",
-                "Touch and name 4 things you can feel.",
-                "Listen and name 3 things you can hear.",
-                "Smell and name 2 things you can smell.",
-                "Taste and name 1 thing you can taste.",
-                "Take a deep breath and notice how you feel."
-            ]
+            "type": "web",
+            "title": f"Resource for: {query}",
+            "description": "Web-sourced information related to your request.",
+            "source": "Sourced from: Web",
+            "source_url": scraped["url"],
+            "steps": [scraped["content"][:800] or "Open the link to read more."]
         }
+    return dict(DEFAULT_RESOURCE)
 
 def generate_mock_resource(query):
     """Generate mock resource when WatsonX.ai unavailable."""
-    query_lower = query.lower()
-    
-    if "stress" in query_lower or "anxiety" in query_lower:
-        return {
-            "title": "Box Breathing Technique",
-            "source": "Sourced from: Navy SEALs and healthcare professionals",
-            "source_url": "https://www.webmd.com/balance/what-is-box-breathing",
-            "steps": [
-                "Find a comfortable, quiet place to sit or lie down.",
-                "Close your eyes and slowly exhale all the air from your lungs.",
-                "Inhale slowly through your nose for a count of 4.",
-                "Hold your breath for a count of 4.",
-                "Exhale slowly through your mouth for a count of 4.",
-                "Hold the empty breath for a count of 4.",
-                "Repeat the cycle for at least 5 minutes to feel the calming effects."
-            ]
-        }
-    elif "focus" in query_lower or "concentration" in query_lower:
-        return {
-            "title": "Pomodoro Technique",
-            "source": "Sourced from: Francesco Cirillo",
-            "source_url": "https://francescocirillo.com/pages/pomodoro-technique",
-            "steps": [
-                "Choose a task you want to work on.",
-                "Set a timer for 25 minutes.",
-                "Work on the task until the timer rings.",
-                "Take a 5-minute break.",
-                "After 4 pomodoros, take a longer 15-30 minute break.",
-                "Repeat the cycle as needed."
-            ]
-        }
-    elif "sad" in query_lower or "depression" in query_lower:
-        return {
-            "title": "Gratitude Listing Exercise",
-            "source": "Sourced from: PositivePsychology.com",
-            "source_url": "https://positivepsychology.com/gratitude-exercises/",
-            "steps": [
-                "Find a quiet moment to sit comfortably.",
-                "Take a few deep breaths to center yourself.",
-                "Write down three specific things you are grateful for today.",
-                "Be as specific as possible (e.g., 'the warm sunlight on my face' rather than 'the weather').",
-                "Reflect on why each item brings you gratitude.",
-                "Repeat this exercise daily for best results."
-            ]
-        }
-    else:
-        return {
-            "title": "5-4-3-2-1 Grounding Technique",
-            "source": "Sourced from: Healthline",
-            "source_url": "https://www.healthline.com/health/grounding-techniques",
-            "steps": [
-                "Look around and name 5 things you can see.",
-                "Touch and name 4 things you can feel.",
-                "Listen and name 3 things you can hear.",
-                "Smell and name 2 things you can smell.",
-                "Taste and name 1 thing you can taste.",
-                "Take a deep breath and notice how you feel."
-            ]
-        }
+    matches = search_resources(query, k=1)
+    return to_resource(matches[0]) if matches else dict(DEFAULT_RESOURCE)
 
-@vero_bp.route('/vero/getResource', methods=['POST'])
-def get_resource():
-    """Get resource for user query."""
-    db = _get_db_or_none()
-    data = request.json
-    problem_query = data.get('query')
-    user_id = data.get('userId')
-    if not problem_query:
-        return jsonify({"error": "A query is required to find a resource"}), 400
 
-    knowledge_base = """
-    1. For stress and anxiety, the 'Box Breathing' technique is very effective. It involves inhaling for 4 seconds, holding for 4, exhaling for 4, and holding for 4. It is used by Navy SEALs. Source: WebMD.
-    2. For problems with focus or concentration, the 'Pomodoro Technique' is a great tool. It involves working in a 25-minute focused block, followed by a 5-minute break. This cycle is repeated. Source: Francesco Cirillo.
-    3. When feeling sad or down, a 'Gratitude Listing' exercise can help shift perspective. The steps are simply to take a moment to write down three specific things you are grateful for, no matter how small. Source: PositivePsychology.com.
-    4. For overwhelming feelings or panic, the '5-4-3-2-1 Grounding Technique' is excellent. The steps are: name 5 things you can see, 4 things you can feel, 3 things you can hear, 2 things you can smell, and 1 thing you can taste. Source: Healthline.
-    """
-    
+def warm_resource_index():
+    """Build the resource index ahead of the first query."""
     try:
-        if watsonx_model:
-            summarization_prompt = f"""
-<role>
-You are an expert at extracting simple, actionable, step-by-step instructions from a knowledge base.
-</role>
+        get_resource_index()
+    except Exception as e:
+        log.warning("Could not build Vero resource index: %s", e)
+
+def _format_kb_entry(entry: dict) -> str:
+    """One compact knowledge-base line per resource."""
+    return (f"[{entry['id']}] {entry['title']}: {entry['description']}. "
+            f"Steps: {' '.join(entry['steps'])} ({entry['source'].replace('Sourced from: ', '')})")
+
+
+def _build_rag_prompt(problem_query: str, entries: list) -> str:
+    knowledge_base = "\n".join(_format_kb_entry(e) for e in entries)
+    return f"""<role>You pick the best technique from a knowledge base and restate its steps simply.</role>
 <instructions>
-Read the knowledge base and find the single best technique for a user struggling with "{problem_query}".
-Your output MUST be in this exact format, with no extra conversation:
-Title: [Title of the technique]
-Source: [Name of the source]
+Choose the single best entry for a user struggling with "{problem_query}". Reply in exactly this format:
+Id: [id in brackets]
 Steps:
 - Step 1...
-- Step 2...
-- Step 3...
 </instructions>
 <knowledge_base>
 {knowledge_base}
 </knowledge_base>
-
-The best technique for "{problem_query}" is:
 """
-            response = watsonx_model.generate(prompt=summarization_prompt)
-            summarized_exercise = response['results'][0]['generated_text'].strip()
 
-            lines = summarized_exercise.split('\n')
-            title = lines[0].replace("Title:", "").strip()
-            source = lines[1].replace("Source:", "").strip()
-            steps = [line.replace("-", "").strip() for line in lines if line.startswith('-')]
-            
-            response_data = {
-                "title": title,
-                "source": f"Sourced from: {source}",
-                "source_url": "https://www.google.com",
-                "steps": steps
-            }
+
+def _parse_rag_output(text: str, entries: list) -> dict:
+    """Structured resource from the model output, keyed by field names rather than line positions."""
+    by_id = {e['id']: e for e in entries}
+    chosen = entries[0]
+    steps = []
+    for line in (text or "").splitlines():
+        stripped = line.strip()
+        match = RAG_ID_RE.match(stripped)
+        if match and match.group(1) in by_id:
+            chosen = by_id[match.group(1)]
+        elif stripped.startswith(('-', '*')) or RAG_NUMBERED_RE.match(stripped):
+            step = RAG_NUMBERED_RE.sub('', stripped.lstrip('-* ')).strip()
+            if step:
+                steps.append(step)
+    resource = to_resource(chosen)
+    if steps:
+        resource["steps"] = steps
+    return resource
+
+
+def get_prompt_stats() -> dict:
+    """Prompt size per LLM request with top-k retrieval versus sending the whole knowledge base."""
+    stats = _prompt_stats.snapshot()
+    stats["rag_cache"] = _rag_cache.stats()
+    return stats
+
+
+def _full_kb_prompt_tokens(problem_query: str) -> int:
+    """Tokens the prompt would cost if every indexed resource were embedded (the pre-retrieval design)."""
+    index = get_resource_index()
+    if _full_kb_cache.get("size") != len(index):
+        _full_kb_cache.update(size=len(index), tokens=estimate_tokens(_build_rag_prompt("", index.entries())))
+    return _full_kb_cache["tokens"] + estimate_tokens(problem_query)
+
+
+@tracing.traced("vero.rag")
+def _rag_resource(model, problem_query: str, region: str = 'GLOBAL') -> dict:
+    """
+    Retrieve the top-k resources and let the model choose and restate one.
+    Identical (query, retrieved ids) pairs are answered from cache without the model.
+    """
+    entries = search_resources(problem_query, k=RAG_TOP_K)
+    if not entries:
+        return find_resource_for_query(problem_query, region)
+
+    cache_key = f"{normalize_query(problem_query)}|{','.join(e['id'] for e in entries)}"
+    cached = _rag_cache.get(cache_key)
+    if cached is not None:
+        return dict(cached)
+
+    prompt = _build_rag_prompt(problem_query, entries)
+    _prompt_stats.record(prompt_tokens=estimate_tokens(prompt), full_kb_prompt_tokens=_full_kb_prompt_tokens(problem_query))
+
+    response = model.generate(prompt=prompt)
+    resource = _parse_rag_output(response['results'][0]['generated_text'], entries)
+    _rag_cache.set(cache_key, resource)
+    return dict(resource)
+
+@vero_bp.route('/vero/getResource', methods=['POST'])
+def get_resource():
+    """Get resource for user query."""
+    db = _get_db_or_none()
+    data = request.json
+    problem_query = data.get('query')
+    user_id = data.get('userId')
+    if not problem_query:
+        return jsonify({"error": "A query is required to find a resource"}), 400
+
+    try:
+        model = _get_model()
+        if model:
+            response_data = _rag_resource(model, problem_query, data.get('region', 'GLOBAL'))
         else:
             # Gather short chat context from last few turns
             context_text = ""
@@ -279,16 +340,29 @@ The best technique for "{problem_query}" is:
             response_data = resource_from_rules if resource_from_rules else generate_mock_resource(problem_query)
             
     except Exception as e:
-        print(f"Error during Vero's AI summarization: {e}")
+        log.error("Error during Vero's AI summarization: %s", e)
         response_data = generate_mock_resource(problem_query)
 
     return jsonify(response_data)
 
+@vero_bp.route('/vero/resourceJob/<job_id>', methods=['GET'])
+def get_resource_job(job_id):
+    """Poll a background resource lookup; `wait` long-polls for up to that many seconds."""
+    try:
+        wait = float(request.args.get('wait', 0))
+    except ValueError:
+        wait = 0
+    status = get_job_status(job_id, wait=wait)
+    if status is None:
+        return jsonify({"error": "Unknown resource job"}), 404
+    return jsonify(status)
+
 @vero_bp.route('/vero/getMentalHealthTip', methods=['POST'])
 def get_mental_health_tip():
     """Get personalized mental health tip."""
     try:
-        if watsonx_model:
+        model = _get_model()
+        if model:
             tip_prompt = """
 <role>
 You are a compassionate mental health expert providing daily wellness tips.
@@ -299,7 +373,7 @@ Generate a single, encouraging, and actionable mental health tip. Keep it brief
 
 Your daily mental health tip:
 """
-            response = watsonx_model.generate(prompt=tip_prompt)
+            response = model.generate(prompt=tip_prompt)
             tip = response['results'][0]['generated_text'].strip().strip('"""').strip()
         else:
             fallback_tips = [
@@ -316,5 +390,5 @@ Your daily mental health tip:
         
         return jsonify({"tip": tip})
     except Exception as e:
-        print(f"Error generating mental health tip: {e}")
+        log.error("Error generating mental health tip: %s", e)
         return jsonify({"tip": "Remember to be kind to yourself today. You're doing great!"})
\ No newline at end of file
@@ -0,0 +1,134 @@
+# backend/bench_sanitize.py
+
+"""
+Equivalence check and micro-benchmark for Elara's response post-processing.
+
+Usage: python bench_sanitize.py [--cases N] [--seed N] [--number N]
+
+1. Property check: for N randomly generated model outputs (turn markers,
+   blank lines, mixed line endings, sentence punctuation, ACTION tags),
+   agents.response_utils.postprocess_response must return exactly what the
+   original sanitize_ai_response + ACTION regex code in handle_chat returned.
+2. Benchmark: per-call time of both implementations on typical outputs.
+"""
+
+import re
+import sys
+import random
+import argparse
+import timeit
+
+from agents.response_utils import postprocess_response
+
+MAX_SENTENCES = 3
+
+
+def legacy_sanitize_ai_response(raw_text: str) -> str:
+    """sanitize_ai_response as it was before response_utils."""
+    if not raw_text:
+        return raw_text or ""
+
+    t = raw_text.strip().strip('`"\' \n\r')
+    t = re.sub(r'^\s*Elara[:\-\s]+', '', t, flags=re.I)
+
+    lines = t.splitlines()
+    first_nonempty_idx = 0
+    for idx, ln in enumerate(lines):
+        if ln.strip():
+            first_nonempty_idx = idx
+            break
+    lines = lines[first_nonempty_idx:]
+
+    cleaned_lines = []
+    for ln in lines:
+        if re.match(r'^\s*Elara[:\-\s]+', ln, flags=re.I):
+            if not cleaned_lines:
+                ln = re.sub(r'^\s*Elara[:\-\s]+', '', ln, flags=re.I)
+                cleaned_lines.append(ln)
+            else:
+                break
+        elif re.match(r'^\s*User[:\-\s]+', ln, flags=re.I):
+            break
+        else:
+            cleaned_lines.append(ln)
+
+    if cleaned_lines:
+        t = "\n".join(cleaned_lines).strip()
+    else:
+        t = t.strip()
+
+    if "\n\n" in t:
+        t = t.split("\n\n", 1)[0].strip()
+
+    sentences = re.split(r'(?<=[.!?])\s+', t)
+    if len(sentences) > MAX_SENTENCES:
+        t = " ".join(sentences[:MAX_SENTENCES]).strip()
+
+    t = re.sub(r'\s+\n', '\n', t).strip()
+    return t
+
+
+def legacy_postprocess(raw_text: str):
+    """The sanitize + ACTION parsing sequence from handle_chat before response_utils."""
+    ai_response_text = legacy_sanitize_ai_response(raw_text)
+    action_match = re.search(r"\[ACTION:find_technique\|([^\]]+)\]", ai_response_text, flags=re.I)
+    requested_problem = action_match.group(1).strip() if action_match else None
+    ai_response_text = re.sub(r"\s*\[ACTION:find_technique\|[^\]]+\]\s*", "", ai_response_text).strip()
+    return ai_response_text, requested_problem
+
+
+FRAGMENTS = [
+    "Elara:", "elara -", "ELARA ", "Elara", "User:", "user -", "User", " ", "  ", "\t", "\n", "\n\n", "\r\n", "\r",
+    "\x0c", " ", '"', "'", "`", ".", "!", "?", "...", "?!", "That sounds hard.", "I'm here for you.",
+    "How are you feeling", "Let's try a breathing exercise!", "Would that help?", "word", "Elaras",
+    "[ACTION:find_technique|stress]", "[action:FIND_TECHNIQUE| sleep problems ]", "[ACTION:find_technique|]",
+    "[ACTION:find_technique|a", "]", "[", "|", ":", "-",
+]
+
+SAMPLES = [
+    'Elara: "That sounds really tough. I\'m here with you. Would you like to try a grounding exercise? '
+    'It only takes a minute."\nUser: yes\nElara: Great.',
+    "I hear you. Exams can be overwhelming. [ACTION:find_technique|exam stress]",
+    "Hello! How has your day been so far?",
+    "\n\nElara - It makes sense to feel that way.\n\nUser: thanks\nElara: anytime",
+]
+
+
+def random_output(rng: random.Random) -> str:
+    return "".join(rng.choice(FRAGMENTS) for _ in range(rng.randint(0, 25)))
+
+
+def property_check(cases: int, seed: int) -> int:
+    rng = random.Random(seed)
+    failures = 0
+    for i in range(cases):
+        raw = SAMPLES[i] if i < len(SAMPLES) else random_output(rng)
+        expected, actual = legacy_postprocess(raw), postprocess_response(raw)
+        if expected != actual:
+            failures += 1
+            if failures <= 5:
+                print(f"❌ Mismatch for {raw!r}:\n   legacy: {expected!r}\n   new:    {actual!r}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check and benchmark Elara response post-processing")
+    parser.add_argument("--cases", type=int, default=20000, help="random outputs to compare")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--number", type=int, default=20000, help="benchmark iterations per sample")
+    args = parser.parse_args()
+
+    failures = property_check(args.cases, args.seed)
+    print(f"Property check: {args.cases - failures}/{args.cases} outputs identical")
+
+    print(f"\n{'sample':<8}{'legacy us':>12}{'new us':>12}")
+    for i, raw in enumerate(SAMPLES):
+        legacy = timeit.timeit(lambda: legacy_postprocess(raw), number=args.number) / args.number * 1e6
+        new = timeit.timeit(lambda: postprocess_response(raw), number=args.number) / args.number * 1e6
+        print(f"{i:<8}{legacy:>12.2f}{new:>12.2f}")
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+# backend/check_http_client.py
+
+"""
+Behaviour check for the shared outbound HTTP client against a local stub server.
+
+Usage: python check_http_client.py [--cap-requests N]
+
+Starts an http.server stub on 127.0.0.1 with slow and fast pages and a fake
+search page, then checks:
+1. Fan-out: agents.http_client.first_result returns the fastest usable
+   result without waiting for the slower tasks, and None when none succeed.
+2. Deadline: a fetch slower than the lookup's Deadline gives up when the
+   budget runs out, and an expired Deadline never reaches the server.
+3. Per-host cap: concurrent gets to one host never have more than
+   HTTP_MAX_PER_HOST requests in flight, and they reuse pooled connections.
+4. Vero: _scrape_resource, pointed at the stub's search page, returns the
+   page behind the faster of its two racing queries.
+"""
+
+import os
+import sys
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+SLOW_PAGE_MS = 1500
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """/sleep/<ms> answers after ms; /search?q= links to a slow or fast /page/<ms>."""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+            server.connections.add(self.client_address)
+            server.requests += 1
+        try:
+            url = urlsplit(self.path)
+            parts = url.path.strip("/").split("/")
+            if parts[0] == "search":
+                query = parse_qs(url.query).get("q", [""])[0]
+                delay = SLOW_PAGE_MS if "technique" in query else 50
+                body = f'<a class="result__a" href="http://{self.headers["Host"]}/page/{delay}">result</a>'
+            elif parts[0] in ("sleep", "page"):
+                delay = int(parts[1])
+                time.sleep(delay / 1000)
+                body = f"<p>page {delay}</p>" if parts[0] == "page" else f"slept {delay}"
+            else:
+                self.send_error(404)
+                return
+            data = body.encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub() -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.in_flight = server.max_in_flight = server.requests = 0
+    server.connections = set()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def reset_counters(server, idle_timeout: float = 5):
+    """Zero the counters once requests abandoned by earlier checks have finished server-side."""
+    deadline = time.monotonic() + idle_timeout
+    while server.in_flight and time.monotonic() < deadline:
+        time.sleep(0.05)
+    with server.lock:
+        server.max_in_flight = server.requests = 0
+        server.connections = set()
+
+
+def check(name: str, ok: bool, detail: str) -> bool:
+    print(f"{'✅' if ok else '❌'} {name}: {detail}")
+    return ok
+
+
+def check_fan_out(http_client, base: str) -> bool:
+    def fetch(ms):
+        return lambda: http_client.get(f"{base}/sleep/{ms}", deadline).text
+
+    deadline = http_client.Deadline(5)
+    started = time.monotonic()
+    result = http_client.first_result([fetch(1000), fetch(50), fetch(1200)], deadline)
+    elapsed = time.monotonic() - started
+    ok = check("first-wins fan-out", result == "slept 50" and elapsed < 0.5,
+               f"got {result!r} after {elapsed:.2f}s")
+
+    def fail():
+        raise ValueError("no result")
+
+    started = time.monotonic()
+    result = http_client.first_result([fail, lambda: None], http_client.Deadline(5))
+    elapsed = time.monotonic() - started
+    return check("fan-out with no usable result", result is None and elapsed < 0.5,
+                 f"got {result!r} after {elapsed:.2f}s") and ok
+
+
+def check_deadline(http_client, server, base: str) -> bool:
+    deadline = http_client.Deadline(0.5)
+    started = time.monotonic()
+    result = http_client.first_result([lambda: http_client.get(f"{base}/sleep/3000", deadline).text], deadline)
+    elapsed = time.monotonic() - started
+    ok = check("deadline budget", result is None and 0.4 < elapsed < 1.0,
+               f"3s fetch under a 0.5s deadline gave {result!r} after {elapsed:.2f}s")
+
+    reset_counters(server)
+    expired = http_client.Deadline(0)
+    try:
+        http_client.get(f"{base}/sleep/0", expired)
+        raised = False
+    except http_client.DeadlineExceeded:
+        raised = True
+    return check("expired deadline", raised and server.requests == 0,
+                 f"DeadlineExceeded raised: {raised}, requests sent: {server.requests}") and ok
+
+
+def check_host_cap(http_client, server, base: str, requests: int) -> bool:
+    cap = http_client.HTTP_MAX_PER_HOST
+    reset_counters(server)
+    deadline = http_client.Deadline(30)
+    with ThreadPoolExecutor(max_workers=requests) as pool:
+        statuses = list(pool.map(lambda _: http_client.get(f"{base}/sleep/200", deadline).status_code,
+                                 range(requests)))
+    ok = all(status == 200 for status in statuses)
+    return check("per-host connection cap", ok and server.max_in_flight <= cap and len(server.connections) <= cap,
+                 f"{requests} concurrent gets, at most {server.max_in_flight} in flight and "
+                 f"{len(server.connections)} connections (cap {cap})")
+
+
+def check_vero() -> bool:
+    from agents import vero_agent
+
+    started = time.monotonic()
+    result = vero_agent._scrape_resource("breathing")
+    elapsed = time.monotonic() - started
+    url = (result or {}).get("url", "")
+    return check("vero lookup race", url.endswith("/page/50") and elapsed < SLOW_PAGE_MS / 1000,
+                 f"got {url or None} after {elapsed:.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the shared HTTP client against a local stub server")
+    parser.add_argument("--cap-requests", type=int, default=12, help="concurrent gets for the per-host cap check")
+    args = parser.parse_args()
+
+    server = start_stub()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    # Read by vero_agent at import
+    os.environ["VERO_SEARCH_URL"] = base + "/search?q={query}"
+    os.environ["VERO_LOOKUP_DEADLINE"] = "5"
+    from agents import http_client
+
+    results = [
+        check_fan_out(http_client, base),
+        check_deadline(http_client, server, base),
+        check_host_cap(http_client, server, base, args.cap_requests),
+        check_vero(),
+    ]
+    server.shutdown()
+    print("\nAll checks passed" if all(results) else "\nSome checks failed")
+    sys.exit(0 if all(results) else 1)
+
+
+if __name__ == "__main__":
+    main()
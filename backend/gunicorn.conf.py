@@ -0,0 +1,14 @@
+# backend/gunicorn.conf.py
+
+# Importing main only builds the app; the log writer, Orion's scheduler and
+# Vero's index warmup are threads, so they are (re)started here in each
+# worker process, after any fork (gunicorn --preload included).
+
+import sys
+
+
+def post_worker_init(worker):
+    app = worker.wsgi
+    main = sys.modules[app.import_name]
+    main.configure_logging()
+    main.start_background_agents(app)
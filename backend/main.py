@@ -1,120 +1,48 @@
 # Aura Mental Health App - Main Application
 import os
-import time
+import logging
 import threading
 from flask import Flask, render_template, send_from_directory
 from flask_cors import CORS
 from dotenv import load_dotenv
-import firebase_admin
-from firebase_admin import credentials, firestore
-
-# Watsonx.ai imports
-try:
-    from ibm_watsonx_ai.foundation_models import ModelInference
-    from ibm_watsonx_ai.metanames import GenTextParamsMetaNames as GenParams
-    from ibm_watsonx_ai.credentials import Credentials
-    WATSONX_AVAILABLE = True
-except ImportError:
-    ModelInference = None
-    Credentials = None
-    WATSONX_AVAILABLE = False
 
 # Agent blueprint imports
 try:
+    from agents.logging_utils import configure_logging
     from agents.auth_agent import auth_bp
     from agents.kai_agent import kai_bp
-    from agents.elara_agent import elara_bp, set_watsonx_model as set_elara_model
-    from agents.vero_agent import vero_bp, set_watsonx_model as set_vero_model
+    from agents.elara_agent import elara_bp
+    from agents.vero_agent import vero_bp, warm_resource_index
     from agents.aegis_agent import aegis_bp
     from agents.orion_analyzer import run_analysis
     from agents.session_agent import session_bp
+    from agents.admin_agent import admin_bp
+    from agents.orion_scheduler import start_orion_scheduler
+    from agents.clients import get_db
+    from agents import metrics
+    from agents import tracing
     AGENTS_AVAILABLE = True
 except ImportError:
     AGENTS_AVAILABLE = False
 
-# Initialize Firebase globally
-def initialize_firebase():
-    """Initialize Firebase outside of app context."""
-    try:
-        backend_dir = os.path.abspath(os.path.dirname(__file__))
-        service_account_path = os.path.join(backend_dir, "serviceAccountKey.json")
-        
-        if not os.path.exists(service_account_path):
-            print("⚠️  Firebase service account key not found at:", service_account_path)
-            print("   Using in-memory storage (data will not persist between restarts)")
-            print("   To enable Firebase:")
-            print("   1. Get your service account key from Firebase Console")
-            print("   2. Save it as 'serviceAccountKey.json' in the backend directory")
-            print("   3. Restart the application")
-            return False
-        else:
-            cred = credentials.Certificate(service_account_path)
-            firebase_admin.initialize_app(cred)
-            print("✅ Firebase initialized successfully")
-            return True
-    except Exception as e:
-        print(f"❌ Firebase initialization failed: {e}")
-        print("   Falling back to in-memory storage")
-        return False
+    def configure_logging():
+        logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO").upper())
+
+log = logging.getLogger(__name__)
 
-# Initialize Firebase
-firebase_available = initialize_firebase()
 
 def create_app():
-    """Create and configure Flask application."""
+    """
+    Create and configure Flask application. Firebase and the Watsonx model
+    are not touched here; agents.clients builds them on first use.
+    """
     load_dotenv()
+    configure_logging()
     backend_dir = os.path.abspath(os.path.dirname(__file__))
     frontend_dir = os.path.join(os.path.dirname(backend_dir), 'frontend')
 
     app = Flask(__name__, template_folder=frontend_dir, static_folder=frontend_dir, static_url_path='')
     CORS(app)
-    app.firebase_available = firebase_available
-
-    with app.app_context():
-        # Watsonx.ai setup
-        try:
-            watsonx_api_key = os.getenv("WATSONX_API_KEY")
-            watsonx_project_id = os.getenv("WATSONX_PROJECT_ID")
-            watsonx_url = os.getenv("WATSONX_URL")
-
-            if not WATSONX_AVAILABLE:
-                app.watsonx_model = None
-            elif not watsonx_api_key or not watsonx_project_id:
-                app.watsonx_model = None
-            else:
-                try:
-                    creds = Credentials(api_key=watsonx_api_key, url=watsonx_url)
-                    generate_params = {
-                        GenParams.DECODING_METHOD: "greedy",
-                        GenParams.MAX_NEW_TOKENS: 200,
-                        GenParams.MIN_NEW_TOKENS: 1,
-                        GenParams.TEMPERATURE: 0.7,
-                        GenParams.STOP_SEQUENCES: ["\n\n", "User:", "Elara:"]
-                    }
-
-                    model = ModelInference(
-                        model_id="ibm/granite-3-8b-instruct",
-                        credentials=creds,
-                        project_id=watsonx_project_id,
-                        params=generate_params
-                    )
-                    
-                    if AGENTS_AVAILABLE:
-                        try:
-                            set_elara_model(model)
-                        except Exception as e:
-                            print(f"Could not set Elara model: {e}")
-                        try:
-                            set_vero_model(model)
-                        except Exception as e:
-                            print(f"Could not set Vero model: {e}")
-                    app.watsonx_model = model
-                except Exception as e:
-                    print(f"Watsonx.ai initialization failed: {e}")
-                    app.watsonx_model = None
-        except Exception as e:
-            print(f"Watsonx.ai setup error: {e}")
-            app.watsonx_model = None
 
     # Static file serving
     @app.route('/styles.css')
@@ -142,33 +70,47 @@ def create_app():
             app.register_blueprint(vero_bp)
             app.register_blueprint(aegis_bp)
             app.register_blueprint(session_bp)
+            app.register_blueprint(admin_bp)
+            app.register_blueprint(metrics.metrics_bp)
+            metrics.init_app(app)
+            tracing.init_app(app)
         except Exception as e:
-            print(f"Error registering blueprints: {e}")
+            log.error("Error registering blueprints: %s", e)
 
     return app
 
 
-def orion_background_worker(app_instance):
-    """Background worker for Orion analysis."""
-    time.sleep(15)
-    while True:
-        try:
-            with app_instance.app_context():
-                if hasattr(app_instance, 'firebase_available') and app_instance.firebase_available:
-                    db = firestore.client()
-                    if AGENTS_AVAILABLE:
-                        run_analysis(db)
-        except Exception as e:
-            print(f"Orion background worker error: {e}")
-        time.sleep(3600)
+def run_orion_job(app_instance):
+    """Single Orion analysis pass, invoked by the scheduler on the leader node."""
+    with app_instance.app_context():
+        db = get_db() if AGENTS_AVAILABLE else None
+        if db is not None:
+            with tracing.trace("orion.run"):
+                run_analysis(db)
+
+
+def start_background_agents(app_instance):
+    """
+    Start Orion on every worker (leader election picks one runner) and warm
+    Vero's index. Called from __main__ below and, under gunicorn, from the
+    post_worker_init hook in gunicorn.conf.py, never at import.
+    """
+    if not AGENTS_AVAILABLE:
+        return
+    threading.Thread(target=warm_resource_index, name='vero-index-warmup', daemon=True).start()
+    if os.getenv("ORION_SCHEDULER_ENABLED", "true").lower() in ("0", "false", "no"):
+        return
+    try:
+        start_orion_scheduler(
+            job=lambda: run_orion_job(app_instance),
+            db_factory=get_db,
+        )
+    except Exception as e:
+        log.error("Could not start Orion background agent: %s", e)
 
 
 app = create_app()
 
 if __name__ == '__main__':
-    try:
-        threading.Thread(target=orion_background_worker, args=(app,), daemon=True).start()
-    except Exception as e:
-        print(f"Could not start Orion background agent: {e}")
-
+    start_background_agents(app)
     app.run(debug=True, use_reloader=False, host='0.0.0.0', port=5000)
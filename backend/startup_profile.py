@@ -0,0 +1,97 @@
+# backend/startup_profile.py
+
+"""
+Import-time and cold-start profile for the backend.
+
+Usage: python startup_profile.py [--top N] [--runs N]
+
+1. Runs `python -X importtime -c "import main"` and summarizes the slowest
+   top-level packages by self import time.
+2. Measures cold start in fresh interpreters: time to import `main` (which
+   creates the app) and time to serve the first request.
+"""
+
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+from collections import defaultdict
+
+BACKEND_DIR = os.path.abspath(os.path.dirname(__file__))
+
+COLD_START_SNIPPET = """
+import json, time
+t0 = time.perf_counter()
+import main
+t1 = time.perf_counter()
+client = main.app.test_client()
+client.get('/aegis/available-regions')
+t2 = time.perf_counter()
+print(json.dumps({"import_s": t1 - t0, "first_request_s": t2 - t1}))
+"""
+
+
+def import_time_summary(top: int = 15):
+    """Return (total_us, [(package, self_us)]) for `import main`, grouped by root package."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=BACKEND_DIR, capture_output=True, text=True
+    )
+    by_package = defaultdict(int)
+    total_us = 0
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3 or not parts[0].strip().isdigit():
+            continue
+        # Self time summed per root package attributes every module exactly once
+        self_us, package = int(parts[0]), parts[2].strip().split(".")[0]
+        by_package[package] += self_us
+        total_us += self_us
+    ranked = sorted(by_package.items(), key=lambda kv: kv[1], reverse=True)[:top]
+    return total_us, ranked
+
+
+def cold_start(runs: int = 3):
+    """Return a list of {"import_s", "first_request_s"} from fresh interpreters."""
+    samples = []
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, "-c", COLD_START_SNIPPET],
+            cwd=BACKEND_DIR, capture_output=True, text=True
+        )
+        for line in reversed(result.stdout.strip().splitlines()):
+            if line.startswith("{"):
+                samples.append(json.loads(line))
+                break
+        else:
+            print(f"❌ Cold start run failed:\n{result.stderr}")
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Profile backend import and cold-start time")
+    parser.add_argument("--top", type=int, default=15, help="number of packages to list")
+    parser.add_argument("--runs", type=int, default=3, help="cold start repetitions")
+    args = parser.parse_args()
+
+    total_us, ranked = import_time_summary(args.top)
+    print(f"Import time for `import main`: {total_us / 1000:.1f} ms (including interpreter startup)")
+    print(f"{'package':<30}{'self ms':>15}")
+    for package, us in ranked:
+        print(f"{package:<30}{us / 1000:>15.1f}")
+
+    samples = cold_start(args.runs)
+    if samples:
+        imports = [s["import_s"] * 1000 for s in samples]
+        firsts = [s["first_request_s"] * 1000 for s in samples]
+        print(f"\nCold start over {len(samples)} runs (median):")
+        print(f"  import main + create_app: {statistics.median(imports):.1f} ms")
+        print(f"  first request:            {statistics.median(firsts):.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
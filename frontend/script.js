@@ -555,6 +555,8 @@ async function sendMessage() {
     
     if (data.show_resource_button && data.resource_data) {
       addResourceButton(data.resource_data);
+    } else if (data.resource_job_id) {
+      pollResourceJob(data.resource_job_id);
     }
     
     if (data.metrics) {
@@ -590,32 +592,90 @@ function addResourceButton(resourceData) {
   chatLog.scrollTop = chatLog.scrollHeight;
 }
 
+// Resource lookups that need the web finish in the background; long-poll for the result
+async function pollResourceJob(jobId, attempts = 4) {
+  setBackgroundAgentActive('Vero', true);
+  try {
+    for (let i = 0; i < attempts; i++) {
+      const res = await fetch(`${BACKEND_URL}/vero/resourceJob/${jobId}?wait=20`);
+      if (!res.ok) break;
+      const job = await res.json();
+      if (job.status === 'done') {
+        if (job.show_resource_button && job.resource_data) {
+          addResourceButton(job.resource_data);
+        }
+        break;
+      }
+      if (job.status === 'failed') break;
+    }
+  } catch (error) {
+    console.error('Resource lookup failed:', error);
+  }
+  setBackgroundAgentActive('Vero', false);
+}
+
 // History management
-async function loadHistoryList() {
+const HISTORY_PAGE_SIZE = 20;
+
+function formatSessionDate(startTime) {
+  if (!startTime) return 'Recent chat';
+  const date = new Date(startTime);
+  if (isNaN(date)) return 'Recent chat';
+  return date.toLocaleDateString(undefined, { month: 'short', day: 'numeric', year: 'numeric' });
+}
+
+function renderHistoryItem(session) {
+  const item = document.createElement('li');
+  item.className = 'history-item';
+  const icon = document.createElement('i');
+  icon.className = 'fas fa-heart';
+  item.appendChild(icon);
+  // Preview is the user's own text, so it is set as text rather than HTML
+  item.appendChild(document.createTextNode(` ${formatSessionDate(session.startTime)}`));
+  if (session.preview) {
+    const preview = document.createElement('div');
+    preview.className = 'history-preview';
+    preview.textContent = session.preview;
+    item.appendChild(preview);
+    item.title = session.turnCount ? `${session.preview} (${session.turnCount} messages)` : session.preview;
+  }
+  item.onclick = () => viewPastSession(session.id);
+  return item;
+}
+
+async function loadHistoryList(pageToken = null) {
   const list = document.getElementById('history-list');
   if (!list) return;
   
-  list.innerHTML = '<li>Loading your wellness journey...</li>';
+  if (!pageToken) list.innerHTML = '<li>Loading your wellness journey...</li>';
   
   try {
     const res = await fetch(`${BACKEND_URL}/elara/getHistoryList`, { 
       method: 'POST', 
       headers: {'Content-Type': 'application/json'}, 
-      body: JSON.stringify({ userId: currentUser.id }) 
+      body: JSON.stringify({ userId: currentUser.id, pageSize: HISTORY_PAGE_SIZE, pageToken }) 
     });
     
-    const sessions = await res.json();
-    list.innerHTML = '';
+    const page = await res.json();
+    if (!pageToken) list.innerHTML = '';
+    const more = list.querySelector('.history-more');
+    if (more) more.remove();
     
-    sessions.forEach(session => {
-      const item = document.createElement('li');
-      item.className = 'history-item';
-      item.innerHTML = `<i class="fas fa-heart"></i> ${session.date}`;
-      item.onclick = () => viewPastSession(session.id);
-      list.appendChild(item);
-    });
+    (page.sessions || []).forEach(session => list.appendChild(renderHistoryItem(session)));
+    
+    if (page.nextPageToken) {
+      const moreItem = document.createElement('li');
+      moreItem.className = 'history-more';
+      moreItem.textContent = 'Show older conversations';
+      moreItem.onclick = () => {
+        moreItem.textContent = 'Loading...';
+        moreItem.onclick = null;
+        loadHistoryList(page.nextPageToken);
+      };
+      list.appendChild(moreItem);
+    }
   } catch (error) { 
-    list.innerHTML = '<li>Could not load your wellness journey.</li>'; 
+    if (!pageToken) list.innerHTML = '<li>Could not load your wellness journey.</li>'; 
   }
 }
 